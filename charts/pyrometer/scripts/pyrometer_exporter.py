@@ -1,43 +1,137 @@
 #!/usr/bin/env python
-from flask import Flask, request, jsonify
-import requests
-import datetime
+from aiohttp import web
+import collections
+import itertools
+import os
+import time
 
-import logging
+from exporter_runtime import Service
 
-log = logging.getLogger("werkzeug")
-log.setLevel(logging.ERROR)
+service = Service()
 
-application = Flask(__name__)
+# Healthy bakers that haven't had an event for the longest time are forgotten
+# beyond this many bakers, to bound memory. Unhealthy bakers are kept until
+# they recover, so that none is missing from the unhealthy total.
+MAX_BAKERS = int(os.getenv("PYROMETER_MAX_BAKERS", "10000"))
+# Event kinds beyond this many are counted as "other", but for the kinds the
+# health of the bakers is tracked from, which are always counted as such
+MAX_EVENT_KINDS = 100
+HEALTH_KINDS = {"baker_unhealthy", "baker_recovered"}
 
-unhealthy_bakers = set()
 
-
-@application.route("/pyrometer_webhook", methods=["POST"])
-def pyrometer_webhook():
+class BakerEvents:
     """
-    Receive all events from pyrometer
+    The health of the bakers and the counts of events, as reported by the
+    webhook. Batches of events are ingested in one pass, without yielding to
+    the event loop, so scrapes always see whole batches.
     """
-    for msg in request.get_json():
-        if msg["kind"] == "baker_unhealthy":
-            print(f"Baker {msg['baker']} is unhealthy")
-            unhealthy_bakers.add(msg["baker"])
-        if msg["kind"] == "baker_recovered":
-            print(f"Baker {msg['baker']} recovered")
-            unhealthy_bakers.remove(msg["baker"])
 
-    return "Webhook received"
+    def __init__(self, max_bakers=MAX_BAKERS):
+        self.max_bakers = max_bakers
+        # baker: [unhealthy, time.time() of its latest event], the least
+        # recently active bakers first
+        self.bakers = collections.OrderedDict()
+        self.unhealthy_count = 0
+        self.event_counts = collections.Counter()
+        self.last_event_at = None
+
+    def event_label(self, kind):
+        """The kind label events of kind are counted under"""
+        if kind in self.event_counts or kind in HEALTH_KINDS:
+            return kind
+        if len(self.event_counts.keys() - HEALTH_KINDS) >= MAX_EVENT_KINDS:
+            return "other"
+        return kind
+
+    def ingest(self, events):
+        now = time.time()
+        for event in events:
+            kind = event.get("kind")
+            if not isinstance(kind, str):
+                kind = "unknown"
+            self.event_counts[self.event_label(kind)] += 1
+            baker = event.get("baker")
+            if not isinstance(baker, str):
+                continue
+            state = self.bakers.get(baker)
+            if state is None:
+                state = self.bakers[baker] = [False, now]
+            else:
+                state[1] = now
+                self.bakers.move_to_end(baker)
+            if kind == "baker_unhealthy" and not state[0]:
+                print(f"Baker {baker} is unhealthy")
+                state[0] = True
+                self.unhealthy_count += 1
+            elif kind == "baker_recovered" and state[0]:
+                print(f"Baker {baker} recovered")
+                state[0] = False
+                self.unhealthy_count -= 1
+        if events:
+            self.last_event_at = now
+        excess = len(self.bakers) - self.max_bakers
+        if excess > 0:
+            healthy = (b for b, (unhealthy, _) in self.bakers.items() if not unhealthy)
+            for baker in list(itertools.islice(healthy, excess)):
+                del self.bakers[baker]
+
 
+baker_events = BakerEvents()
 
-@application.route("/metrics", methods=["GET"])
-def prometheus_metrics():
+
+@service.route("POST", "/pyrometer_webhook")
+async def pyrometer_webhook(request):
     """
-    Prometheus endpoint
+    Receive all events from pyrometer
     """
-    return f"""# total number of monitored bakers that are currently unhealthy
-pyrometer_unhealthy_bakers_total {len(unhealthy_bakers)}
-"""
+    baker_events.ingest(await request.json())
+    return web.Response(text="Webhook received")
+
+
+#
+# Prometheus endpoint
+
+service.registry.gauge(
+    "pyrometer_unhealthy_bakers_total",
+    "total number of monitored bakers that are currently unhealthy",
+    collect=lambda: baker_events.unhealthy_count,
+)
+service.registry.gauge(
+    "pyrometer_baker_unhealthy",
+    "Whether the baker is unhealthy.",
+    ["baker"],
+    collect=lambda: {
+        (baker,): int(unhealthy)
+        for baker, (unhealthy, _) in baker_events.bakers.items()
+    },
+)
+service.registry.gauge(
+    "pyrometer_baker_seconds_since_last_event",
+    "Time since the latest event of the baker.",
+    ["baker"],
+    collect=lambda: {
+        (baker,): time.time() - event_at
+        for baker, (_, event_at) in baker_events.bakers.items()
+    },
+)
+service.registry.counter(
+    "pyrometer_events_total",
+    "Events received from pyrometer.",
+    ["kind"],
+    collect=lambda: {
+        (kind,): count for kind, count in baker_events.event_counts.items()
+    },
+)
+service.registry.gauge(
+    "pyrometer_seconds_since_last_event",
+    "Time since the latest event.",
+    collect=lambda: (
+        float("inf")
+        if baker_events.last_event_at is None
+        else time.time() - baker_events.last_event_at
+    ),
+)
 
 
 if __name__ == "__main__":
-    application.run(host="0.0.0.0", port=31732, debug=False)
+    service.run()
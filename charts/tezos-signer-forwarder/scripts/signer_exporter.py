@@ -1,13 +1,17 @@
 #!/usr/bin/env python
+import asyncio
 import os
-from flask import Flask, request, jsonify
-import requests
+import time
+
+import aiohttp
 
 import logging
-log = logging.getLogger('werkzeug')
-log.setLevel(logging.ERROR)
 
-application = Flask(__name__)
+from exporter_runtime import Service
+
+log = logging.getLogger("signer_exporter")
+
+service = Service()
 
 readiness_probe_path = os.getenv("READINESS_PROBE_PATH")
 signer_port = os.getenv("SIGNER_PORT")
@@ -16,38 +20,94 @@ signer_metrics = os.getenv("SIGNER_METRICS") == "true"
 # https://kubernetes.io/docs/tasks/configure-pod-container/configure-liveness-readiness-startup-probes/
 # Configured readiness probe timeoutSeconds is 5s, timeout sync request before that.
 SIGNER_CONNECT_TIMEOUT = 4.5
+# The signer is probed in the background every SIGNER_PROBE_INTERVAL seconds,
+# scrapes are answered with the outcome of the latest probe.
+SIGNER_PROBE_INTERVAL = float(os.getenv("SIGNER_PROBE_INTERVAL", "10"))
+
+PROBE_DURATION = service.registry.histogram(
+    "signer_probe_duration_seconds",
+    "Duration of the requests probing the signer.",
+    ["probe"],
+    buckets=(0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 4.5),
+)
 
-@application.route('/metrics', methods=['GET'])
-def prometheus_metrics():
+
+class SignerHealth:
     '''
-    Prometheus endpoint
-    This combines:
-    * the metrics from the signer, which themselves are a combination of the
-      prometheus node-exporter and custom probes (power status, etc)
-    * the `unhealthy_signers_total` metric exported by this script, verifying
-      whether the signer URL configured upstream returns a 200 OK
+    The outcome of the latest probe of the signer, refreshed in the
+    background over the service's keep-alive connections, so that scrapes
+    never wait for the signer and several scrapers don't add to its load.
     '''
 
-    try:
-        probe = requests.get(f"http://localhost:{signer_port}{readiness_probe_path}", timeout=SIGNER_CONNECT_TIMEOUT)
-    except requests.exceptions.ConnectTimeout:
-        #Timeout connect to node
-        probe = None
-    except requests.exceptions.ReadTimeout:
-        #Timeout read from node
-        probe = None
-    except requests.exceptions.RequestException:
-        probe = None
-    if probe and signer_metrics:
-        try:
-            healthz = requests.get(f"http://localhost:{signer_port}/healthz").text
-        except requests.exceptions.RequestException:
-            healthz = None
-    else:
+    def __init__(self, signer_url):
+        self.signer_url = signer_url
+        self.healthy = False
+        self.healthz = None
+        # time.monotonic() of the latest completed refresh
+        self.refreshed_at = None
+
+    async def timed_get(self, probe, path):
+        '''Return the response's body, or None if the request failed'''
+        with PROBE_DURATION.time(probe):
+            try:
+                async with service.session.get(
+                    f"{self.signer_url}{path}",
+                    timeout=aiohttp.ClientTimeout(total=SIGNER_CONNECT_TIMEOUT),
+                ) as r:
+                    if r.ok:
+                        return await r.text()
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                log.info(f"Signer probe {path} failed: {e!r}")
+        return None
+
+    async def refresh(self):
+        healthy = await self.timed_get("readiness", readiness_probe_path) is not None
         healthz = None
-    return '''# number of unhealthy signers - should be 0 or 1
-unhealthy_signers_total %s
-%s''' % (0 if probe else 1, healthz or "")
+        if healthy and signer_metrics:
+            healthz = await self.timed_get("healthz", "/healthz")
+        self.healthy = healthy
+        self.healthz = healthz
+        self.refreshed_at = time.monotonic()
+
+    def age(self):
+        if self.refreshed_at is None:
+            return float("inf")
+        return time.monotonic() - self.refreshed_at
+
+
+signer_health = SignerHealth(f"http://localhost:{signer_port}")
+
+
+async def refresh_signer_health():
+    await signer_health.refresh()
+
+
+service.every(SIGNER_PROBE_INTERVAL, refresh_signer_health)
+
+#
+# Prometheus endpoint
+# This combines:
+# * the metrics from the signer, which themselves are a combination of the
+#   prometheus node-exporter and custom probes (power status, etc)
+# * the `unhealthy_signers_total` metric exported by this script, verifying
+#   whether the signer URL configured upstream returns a 200 OK
+# * the age of the latest probe of the signer and the durations of the
+#   probes
+# Everything comes from the latest background probe of the signer.
+
+service.registry.gauge(
+    "unhealthy_signers_total",
+    "number of unhealthy signers - should be 0 or 1",
+    collect=lambda: 0 if signer_health.healthy else 1,
+)
+service.registry.gauge(
+    "signer_probe_age_seconds",
+    "Time since the signer was last probed.",
+    collect=signer_health.age,
+)
+service.registry.add_collector(
+    lambda: [signer_health.healthz.rstrip("\n")] if signer_health.healthz else []
+)
 
 if __name__ == "__main__":
-   application.run(host = "0.0.0.0", port = 31732, debug = False)
+   service.run()
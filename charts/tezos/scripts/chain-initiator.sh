@@ -15,8 +15,10 @@ fi
 # Substitute #fromfile with the hex encoded files in question.
 # This is for bootstrapped smart rollups.
 
-# Note that this is low-level string substitution with `read`
-# Due to the size of the hex-encoded kernel, using `sed` was not possible.
+# config-generator already substituted the files present in its container.
+# The ones it left, such as kernels shipped in this image, are substituted
+# here in a single pass of awk over the parameters, each file being streamed
+# into the output as hex by xxd.
 
 PARAMETERS_FILE='/etc/tezos/parameters.json'
 TMP_PARAMETERS_FILE='/etc/tezos/tmp_parameters.json'
@@ -24,68 +26,34 @@ TMP_PARAMETERS_FILE='/etc/tezos/tmp_parameters.json'
 # Pattern to search for
 pattern='fromfile#'
 
-# Buffer for characters
-buffer=''
-
-# Whether 'fromfile#' was detected
-detected_fromfile=false
-
-# Process each character
-while IFS= read -r -n1 char
-do
-  # Add the character to the buffer
-  buffer=$(printf "%s%s" "$buffer" "$char")
-
-  # If the buffer ends with the pattern
-  if [ "${buffer%"$pattern"}" != "$buffer" ]
-  then
-    detected_fromfile=true
-
-    # Clear the buffer
-    buffer=''
-
-    # Read the filename
-    filename=''
-    while IFS= read -r -n1 char && [ "$char" != '"' ]
-    do
-      filename=$(printf "%s%s" "$filename" "$char")
-    done
-
-    echo "Found kernel file: $filename"
-
-    # Check if file exists
-    if [ ! -f "$filename" ]; then
-      echo "Kernel file $filename not found!"
-      exit 1
-    fi
-
-    # Convert the file content to hex and append to the temp file
-    xxd -p -c 0 "$filename" | tr -d '\n' >> $TMP_PARAMETERS_FILE
-
-    # Add a closing double quote
-    printf '"' >> $TMP_PARAMETERS_FILE
-  elif [ ${#buffer} -ge ${#pattern} ]
-  then
-    # Write the oldest character in the buffer to the temporary file
-    printf "%s" "${buffer%"${buffer#?}"}" >> $TMP_PARAMETERS_FILE
-
-    # Remove the oldest character from the buffer
-    buffer=${buffer#?}
-  fi
-done < "$PARAMETERS_FILE"
-
-# If there's anything left in the buffer, write it to the file
-if [ -n "$buffer" ]
+if grep -q "$pattern" "$PARAMETERS_FILE"
 then
-  printf "%s" "$buffer" >> $TMP_PARAMETERS_FILE
-fi
-
-# Replace the original parameters.json file with the modified one only if 'fromfile#' was detected
-if $detected_fromfile; then
+  awk -v pattern="$pattern" '
+  {
+    line = $0
+    while ((start = index(line, pattern)) > 0) {
+      printf "%s", substr(line, 1, start - 1)
+      line = substr(line, start + length(pattern))
+      # The file name goes up to the closing double quote, which is kept
+      end = index(line, "\"")
+      filename = substr(line, 1, end - 1)
+      line = substr(line, end)
+      print "Found kernel file: " filename > "/dev/stderr"
+      if (system("test -f \"" filename "\"") != 0) {
+        print "Kernel file " filename " not found!" > "/dev/stderr"
+        exit 1
+      }
+      # xxd writes to the same output, after what awk printed so far
+      fflush()
+      if (system("xxd -p -c 0 \"" filename "\" | tr -d \"\\n\"") != 0) {
+        exit 1
+      }
+    }
+    print line
+  }' "$PARAMETERS_FILE" > $TMP_PARAMETERS_FILE
   mv $TMP_PARAMETERS_FILE $PARAMETERS_FILE
   echo "Updated JSON saved in '$PARAMETERS_FILE'"
 else
-  rm -f $TMP_PARAMETERS_FILE
   echo "No 'fromfile#' detected in '$PARAMETERS_FILE', no changes made."
 fi
 echo Activating chain:
@@ -0,0 +1,70 @@
+set -e
+
+bin_dir="/usr/local/bin"
+data_dir="/var/tezos"
+node="$bin_dir/octez-node"
+# Served to the new nodes of the class by the snapshot-server container
+export_dir="$data_dir/peer-snapshot"
+export_interval=${PEER_SNAPSHOT_INTERVAL:-21600}
+retry_interval=60
+
+# octez-node snapshot export reads the node's store while it runs, at a
+# block the node won't rewrite, so the export is a consistent copy of the
+# chain at that block.
+# The history mode is either a string or an object, such as
+# {"rolling": {"additional_cycles": 5}}, and full when it isn't set.
+history_mode=$(${node} config show --config-file /etc/tezos/config.json \
+    | tr -d ' \t\n' \
+    | sed -n 's/.*"history_mode":{\{0,1\}"\([a-z]*\)".*/\1/p')
+case "$history_mode" in
+    rolling)    mode_arg="--rolling" ;;
+    # Archive nodes export full snapshots
+    *)          mode_arg="" ;;
+esac
+echo "Exporting the snapshots of a ${history_mode:-full} node"
+
+mkdir -p ${export_dir}
+# The siblings of an archive node don't import its full snapshots
+echo ${history_mode:-full} > ${export_dir}/history_mode
+
+while true; do
+    if ! wget -qO- http://127.0.0.1:8732/chains/main/is_bootstrapped \
+            | grep -q '"sync_state": *"synced"'; then
+        echo "The node isn't synced yet."
+        sleep ${retry_interval}
+        continue
+    fi
+
+    name=$(date +%s)
+    rm -f ${export_dir}/*.exporting
+    echo "Exporting a snapshot to ${export_dir}/${name}.snapshot"
+    status=0
+    ${node} snapshot export ${mode_arg} --config-file /etc/tezos/config.json \
+        ${export_dir}/${name}.exporting || status=$?
+    if [ "$status" -ne 0 ]; then
+        echo "Exporting the snapshot failed, retrying in ${retry_interval}s."
+        rm -f ${export_dir}/${name}.exporting
+        sleep ${retry_interval}
+        continue
+    fi
+    ${node} snapshot info --json ${export_dir}/${name}.exporting \
+        > ${export_dir}/${name}.info.json
+    sha256sum ${export_dir}/${name}.exporting | head -c 64 \
+        > ${export_dir}/${name}.sha256
+    mv ${export_dir}/${name}.exporting ${export_dir}/${name}.snapshot
+
+    # The previous export is kept until the next one, for the downloads
+    # still fetching it.
+    previous=$(cat ${export_dir}/latest 2>/dev/null || true)
+    echo ${name} > ${export_dir}/latest.tmp
+    mv ${export_dir}/latest.tmp ${export_dir}/latest
+    for file in ${export_dir}/*; do
+        case "$(basename $file)" in
+            latest|${name}.*|${previous:-latest}.*) ;;
+            *) rm -vf $file ;;
+        esac
+    done
+    cat ${export_dir}/${name}.info.json
+
+    sleep ${export_interval}
+done
@@ -6,8 +6,11 @@ node_dir="$data_dir/node"
 node_data_dir="$node_dir/data"
 node="$bin_dir/octez-node"
 snapshot_file=${node_dir}/chain.snapshot
+# Written instead of the snapshot by snapshot-downloader in streaming mode
+snapshot_url_file=${snapshot_file}.url
+sha256_file=${snapshot_file}.sha256
 
-if [ ! -f ${snapshot_file} ]; then
+if [ ! -f ${snapshot_file} ] && [ ! -f ${snapshot_url_file} ]; then
     echo "No snapshot to import."
     exit 0
 fi
@@ -19,13 +22,77 @@ if [ -e ${node_data_dir}/context/store.dict ]; then
     exit 0
 fi
 
+mkdir -p ${node_data_dir}
 cp -v /etc/tezos/config.json ${node_data_dir}
 
 if [ -f ${node_dir}/chain.snapshot.block_hash ]; then
     block_hash_arg="--block $(cat ${node_dir}/chain.snapshot.block_hash)"
 fi
 
+if [ -f ${snapshot_url_file} ] && [ ! -f ${snapshot_file}.no_streaming ]; then
+    # Stream the download into octez-node, computing its sha256 on the way,
+    # so that the snapshot is never written to disk. It is imported into a
+    # data dir of its own, whose content is only moved to the node's data dir
+    # once the sha256 is checked.
+    echo "Streaming $(cat ${snapshot_url_file}) into octez-node"
+    importing_dir=${node_data_dir}.importing
+    rm -rf ${importing_dir}
+    mkdir -p ${importing_dir}
+    cp -v /etc/tezos/config.json ${importing_dir}
+    sha256_fifo=${snapshot_file}.sha256.fifo
+    # Which of the download and the import ended first, and how
+    exits=${snapshot_file}.exits
+    rm -f ${sha256_fifo} ${exits}
+    mkfifo ${sha256_fifo}
+    sha256sum < ${sha256_fifo} > ${snapshot_file}.sha256sum &
+    { status=0; wget -qO- "$(cat ${snapshot_url_file})" || status=$?;
+      echo "download $status" >> ${exits}; } \
+        | tee ${sha256_fifo} \
+        | { status=0; ${node} snapshot import /dev/stdin --data-dir ${importing_dir} || status=$?;
+            echo "import $status" >> ${exits}; }
+    wait
+    sha256=$(head -c 64 ${snapshot_file}.sha256sum)
+    rm -f ${sha256_fifo} ${snapshot_file}.sha256sum
+    if grep -qx "download 0" ${exits} && grep -qx "import 0" ${exits}; then
+        rm -f ${exits}
+        if [ -f ${sha256_file} ] && [ "$(cat ${sha256_file})" != "$sha256" ]; then
+            echo "Error: sha256 checksum of the snapshot is $sha256, the metadata says $(cat ${sha256_file})."
+            rm -rf ${importing_dir}
+            exit 1
+        fi
+        for entry in ${importing_dir}/*; do
+            rm -rf ${node_data_dir}/$(basename $entry)
+            mv $entry ${node_data_dir}/
+        done
+        rmdir ${importing_dir}
+        find ${node_dir}
+        rm -vf ${snapshot_url_file} ${sha256_file}
+        exit 0
+    fi
+    rm -rf ${importing_dir}
+    if head -n 1 ${exits} | grep -q "^download" && ! grep -qx "download 0" ${exits}; then
+        # Most likely a network error, the snapshot is streamed again on
+        # restart.
+        rm -f ${exits}
+        echo "Downloading the snapshot failed."
+        exit 1
+    fi
+    # E.g. this octez-node can't import from a pipe. snapshot-downloader
+    # downloads the snapshot to disk first on restart, as when streaming is
+    # off.
+    rm -f ${exits}
+    echo "Importing the snapshot from a stream failed, it will be downloaded to disk first."
+    touch ${snapshot_file}.no_streaming
+    exit 1
+fi
+
+if [ ! -f ${snapshot_file} ]; then
+    # Left to snapshot-downloader on restart
+    echo "No snapshot to import."
+    exit 1
+fi
+
 ${node} snapshot import ${snapshot_file} --data-dir ${node_data_dir}
 find ${node_dir}
 
-rm -rvf ${snapshot_file}
+rm -rvf ${snapshot_file} ${snapshot_url_file} ${sha256_file} ${snapshot_file}.no_streaming
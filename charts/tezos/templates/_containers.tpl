@@ -130,6 +130,10 @@
     - name: BAKER_INDEX
       value: "{{ .baker_index }}"
   {{- end }}
+  {{- if .peer_snapshots }}
+    - name: PEER_SNAPSHOTS
+      value: "{{ .peer_snapshots }}"
+  {{- end }}
 {{- $envdict := dict }}
 {{- $lenv := $.node_vals.env           | default dict }}
 {{- $genv := $.Values.node_globals.env | default dict }}
@@ -226,16 +230,18 @@
 {{- end }}
 
 {{- define "tezos.init_container.snapshot_downloader" }}
-  {{- if include "tezos.shouldDownloadSnapshot" . }}
+  {{- $peer_snapshots := has "snapshot_server" $.node_vals.runs }}
+  {{- if or (include "tezos.shouldDownloadSnapshot" .) $peer_snapshots }}
     {{- include "tezos.generic_container" (dict "root"  $
                                                 "type"  "snapshot-downloader"
                                                 "image" "utils"
+                                                "peer_snapshots" (ternary (print $.node_class ":31733") "" $peer_snapshots)
     ) | nindent 0 }}
   {{- end }}
 {{- end }}
 
 {{- define "tezos.init_container.snapshot_importer" }}
-  {{- if include "tezos.shouldDownloadSnapshot" . }}
+  {{- if or (include "tezos.shouldDownloadSnapshot" .) (has "snapshot_server" $.node_vals.runs) }}
     {{- include "tezos.generic_container" (dict "root"   $
                                            "type"        "snapshot-importer"
                                            "image"       "octez"
@@ -334,6 +340,19 @@
 {{- end }}
 
 
+{{- define "tezos.container.snapshot_server" }}
+  {{- if has "snapshot_server" $.node_vals.runs }}
+    {{- include "tezos.generic_container" (dict "root"        $
+                                                "type"        "snapshot-exporter"
+                                                "image"       "octez"
+    ) | nindent 0 }}
+    {{- include "tezos.generic_container" (dict "root"        $
+                                                "type"        "snapshot-server"
+                                                "image"       "utils"
+    ) | nindent 0 }}
+  {{- end }}
+{{- end }}
+
 {{- define "tezos.container.logger" }}
   {{- if has "logger" $.node_vals.runs }}
     {{- include "tezos.generic_container" (dict "root"        $
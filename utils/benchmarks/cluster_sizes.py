@@ -0,0 +1,316 @@
+"""
+Measure how config-generator scales with the size of the cluster.
+
+For every combination of account count, node instance count and pod type, a
+synthetic pod environment (CHAIN_PARAMS, NODES, ACCOUNTS, signers and rollup
+nodes) is generated in a temporary directory and the phases of
+config-generator that apply to the pod type are run against it. The wall time
+and the peak of memory allocated by each phase are reported.
+
+Peak memory is measured with tracemalloc, which slows python code down. Pass
+--no-memory to only measure wall times. Keys derived in worker processes are
+not accounted for in memory peaks.
+
+    python benchmarks/cluster_sizes.py --accounts 10 1000 --instances 1 100
+"""
+
+import argparse
+import contextlib
+import hashlib
+import http.server
+import json
+import os
+import random
+import tempfile
+import threading
+import time
+import tracemalloc
+
+from base58 import b58encode_check
+
+from common import load_config_generator
+from tezos_keys import SECRET_KEY_PREFIXES, Key
+
+POD_TYPES = ("node", "activating", "signing", "rollup")
+
+
+def synthetic_accounts(count, curves, rng):
+    """Every other account only has its public key."""
+    accounts = {}
+    for i in range(count):
+        curve = curves[i % len(curves)]
+        secret_key = b58encode_check(
+            SECRET_KEY_PREFIXES[curve] + rng.randbytes(32)
+        ).decode()
+        key = secret_key if i % 2 == 0 else Key.decode(secret_key).public_key()
+        accounts[f"account-{i}"] = {
+            "key": key,
+            "bootstrap_balance": "4000000000000",
+            "is_bootstrap_baker_account": i % 4 == 0,
+        }
+    return accounts
+
+
+def synthetic_nodes(instances, account_count):
+    """
+    A fifth of the instances bake, a fifth are archive nodes, the others are
+    rolling nodes. The first two instances of each class are bootstrap nodes.
+    """
+    baking = max(1, instances // 5)
+    archive = instances // 5
+    rolling = instances - baking - archive
+    nodes = {}
+    if rolling:
+        nodes["rolling-node"] = {
+            "runs": ["octez_node"],
+            "config": {"shell": {"history_mode": "rolling"}},
+            "instances": [{"is_bootstrap_node": i < 2} for i in range(rolling)],
+        }
+    if archive:
+        nodes["archive-node"] = {
+            "runs": ["octez_node"],
+            "config": {"shell": {"history_mode": "archive"}},
+            "instances": [{"is_bootstrap_node": i < 2} for i in range(archive)],
+        }
+    nodes["baking-node"] = {
+        "runs": ["octez_node", "baker"],
+        "config": {"shell": {"history_mode": "rolling"}},
+        "instances": [
+            {
+                "is_bootstrap_node": i < 2,
+                # Even accounts have a secret key
+                "bake_using_accounts": [f"account-{(2 * i) % account_count}"],
+            }
+            for i in range(baking)
+        ],
+    }
+    return nodes
+
+
+def synthetic_snapshot_metadata(count, rng):
+    return {
+        "data": [
+            {
+                "url": f"https://snapshots.example.com/{i}",
+                "chain_name": rng.choice(["mainnet", "ghostnet", "benchnet"]),
+                "history_mode": rng.choice(["rolling", "full", "archive"]),
+                "artifact_type": rng.choice(["tarball", "tezos-snapshot"]),
+                "block_height": rng.randrange(5_000_000),
+                "tezos_version": {"version": {"major": rng.choice([17, 18, 19])}},
+            }
+            for i in range(count)
+        ]
+    }
+
+
+class SnapshotMetadataHandler(http.server.BaseHTTPRequestHandler):
+    """Serves the server's metadata document, answering conditional requests."""
+
+    def do_GET(self):
+        body = self.server.metadata
+        etag = f'"{hashlib.sha256(body).hexdigest()}"'
+        if self.headers.get("If-None-Match") == etag:
+            self.send_response(304)
+            self.send_header("ETag", etag)
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header("ETag", etag)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def pod_environment(pod_type, accounts, nodes, snapshot_source, workers):
+    account_names = list(accounts)
+    # Odd accounts only have a public key
+    signed_accounts = account_names[::2][-10:]
+    authorized_key = account_names[0]
+    environ = {
+        "CHAIN_PARAMS": json.dumps(
+            {
+                "bootstrap_peers": [],
+                "network": {
+                    "chain_name": "benchnet",
+                    "genesis": {"block": "BLockGenesis", "timestamp": "2021"},
+                    "activation_account_name": account_names[0],
+                },
+                "protocol_activation": {
+                    "protocol_parameters": {"minimal_block_delay": "5"}
+                },
+            }
+        ),
+        "NODE_GLOBALS": "{}",
+        "NODES": json.dumps(nodes),
+        "OCTEZ_SIGNERS": json.dumps(
+            {
+                "octez-signer-0": {
+                    "accounts": signed_accounts,
+                    "authorized_keys": [authorized_key],
+                }
+            }
+        ),
+        "OCTEZ_ROLLUP_NODES": json.dumps(
+            {"rollup-0": {"operator_account": account_names[0]}}
+        ),
+        "MY_POD_TYPE": pod_type,
+        "MY_POD_NAME": {
+            "node": "baking-node-0",
+            "activating": "activate-job",
+            "signing": "octez-signer-0",
+            "rollup": "rollup-0",
+        }[pod_type],
+        "MY_POD_IP": "10.0.0.1",
+        "SNAPSHOT_SOURCE": snapshot_source,
+        "KEY_DERIVATION_WORKERS": str(workers),
+    }
+    return environ
+
+
+class PhaseTimer:
+    def __init__(self, trace_memory):
+        self.trace_memory = trace_memory
+        self.results = []
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        if self.trace_memory:
+            tracemalloc.reset_peak()
+            before, _ = tracemalloc.get_traced_memory()
+        start = time.perf_counter()
+        yield
+        elapsed = time.perf_counter() - start
+        peak = None
+        if self.trace_memory:
+            _, peak = tracemalloc.get_traced_memory()
+            peak -= before
+        self.results.append((name, elapsed, peak))
+
+
+def run_scenario(config_generator, environ, accounts, trace_memory):
+    timer = PhaseTimer(trace_memory)
+    with tempfile.TemporaryDirectory() as tmp:
+        with open(f"{tmp}/ACCOUNTS", "w") as f:
+            json.dump(accounts, f)
+        config = config_generator.Config(
+            environ=environ,
+            secret_volume=tmp,
+            etc_dir=f"{tmp}/etc",
+            var_dir=f"{tmp}/var",
+        )
+        config.fqdn = "baking-node-0.baking-node.tezos.svc.cluster.local"
+        for path in (config.etc_dir, config.client_dir):
+            os.makedirs(path)
+        config_generator.CONFIG = config
+        pod_type = config.my_pod_type
+
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            with timer.phase("import_keys"):
+                config_generator.import_keys(config.accounts)
+
+            if pod_type == "activating":
+                with timer.phase("create_protocol_parameters_json"):
+                    parameters = config_generator.create_protocol_parameters_json(
+                        config.accounts
+                    )
+                    config_generator.write_protocol_parameters_json(
+                        parameters, f"{config.etc_dir}/parameters.json"
+                    )
+
+            if pod_type == "node":
+                with timer.phase("create_node_config_json"):
+                    node_config = config_generator.create_node_config_json(
+                        config_generator.get_bootstrap_peers()
+                    )
+                for name in ("snapshot selection", "snapshot selection (cached)"):
+                    with timer.phase(name):
+                        snapshot = config_generator.create_node_snapshot_config_json(
+                            node_config["shell"]["history_mode"]
+                        )
+                    assert snapshot, "no snapshot found"
+
+    return timer.results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument(
+        "--accounts", type=int, nargs="+", default=[10, 100, 1000, 10000]
+    )
+    parser.add_argument("--instances", type=int, nargs="+", default=[1, 10, 100, 1000])
+    parser.add_argument("--pod-types", nargs="+", choices=POD_TYPES, default=POD_TYPES)
+    parser.add_argument(
+        "--curves",
+        nargs="+",
+        choices=("ed", "sp", "p2"),
+        default=["ed"],
+        help="curves of the account keys, assigned in turn",
+    )
+    parser.add_argument(
+        "--snapshots", type=int, default=2000, help="entries of the snapshot metadata"
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=len(os.sched_getaffinity(0)),
+        help="key derivation",
+    )
+    parser.add_argument("--no-memory", dest="trace_memory", action="store_false")
+    parser.add_argument("--json", help="also write the results to this file")
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    config_generator = load_config_generator()
+
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), SnapshotMetadataHandler)
+    server.metadata = json.dumps(
+        synthetic_snapshot_metadata(args.snapshots, rng)
+    ).encode()
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    snapshot_source = f"http://127.0.0.1:{server.server_address[1]}/snapshots.json"
+
+    if args.trace_memory:
+        tracemalloc.start()
+
+    print(f"{'pod type':<11}{'accounts':>9}{'instances':>10}  {'phase':<32}", end="")
+    print(f"{'wall (s)':>9}{'peak (MiB)':>11}")
+    results = []
+    for account_count in args.accounts:
+        accounts = synthetic_accounts(account_count, args.curves, rng)
+        for instance_count in args.instances:
+            nodes = synthetic_nodes(instance_count, account_count)
+            for pod_type in args.pod_types:
+                environ = pod_environment(
+                    pod_type, accounts, nodes, snapshot_source, args.workers
+                )
+                phases = run_scenario(
+                    config_generator, environ, accounts, args.trace_memory
+                )
+                for phase, elapsed, peak in phases:
+                    peak_mib = "-" if peak is None else f"{peak / (1 << 20):.1f}"
+                    print(
+                        f"{pod_type:<11}{account_count:>9}{instance_count:>10}  "
+                        f"{phase:<32}{elapsed:>9.3f}{peak_mib:>11}"
+                    )
+                    results.append(
+                        {
+                            "pod_type": pod_type,
+                            "accounts": account_count,
+                            "instances": instance_count,
+                            "phase": phase,
+                            "wall_time": elapsed,
+                            "peak_memory": peak,
+                        }
+                    )
+
+    server.shutdown()
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
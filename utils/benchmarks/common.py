@@ -0,0 +1,25 @@
+"""Helpers shared by the utils benchmarks."""
+
+import importlib.util
+import sys
+from pathlib import Path
+
+UTILS_DIR = Path(__file__).resolve().parents[1]
+CHARTS_DIR = UTILS_DIR.parent / "charts"
+
+# The utils scripts are copied flat into the root of the utils image and
+# import each other as top level modules.
+sys.path.insert(0, str(UTILS_DIR))
+
+
+def load_script(filename, module_name, directory=UTILS_DIR):
+    """Import one of the utils scripts whose file name isn't a module name."""
+    spec = importlib.util.spec_from_file_location(module_name, directory / filename)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[module_name] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+def load_config_generator():
+    return load_script("config-generator.py", "config_generator")
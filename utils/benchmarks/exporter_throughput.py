@@ -0,0 +1,197 @@
+"""
+Measure the throughput and latency of the services built on exporter_runtime
+under concurrent load: the sidecar's /is_synced probes and /metrics, and the
+/metrics of the signer and pyrometer exporters.
+
+Each service runs in its own process, next to a fake upstream (node, signer)
+served from a thread, while this process keeps `concurrency` requests in
+flight for `duration` seconds over keep-alive connections.
+
+    python benchmarks/exporter_throughput.py --concurrency 1 10 100
+"""
+
+import argparse
+import asyncio
+import contextlib
+import datetime
+import http.server
+import json
+import multiprocessing
+import os
+import threading
+import time
+
+import aiohttp
+
+from common import CHARTS_DIR, load_script
+
+TARGETS = {
+    # name: paths to load
+    "sidecar": ("/is_synced", "/metrics"),
+    "signer_exporter": ("/metrics",),
+    "pyrometer_exporter": ("/metrics",),
+}
+
+
+class UpstreamHandler(http.server.BaseHTTPRequestHandler):
+    """A node or signer answering instantly"""
+
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        if self.path == "/chains/main/blocks/head/header":
+            timestamp = datetime.datetime.utcnow().strftime("%Y-%m-%dT%H:%M:%SZ")
+            body = json.dumps({"level": 10, "timestamp": timestamp}).encode()
+        elif self.path == "/healthz":
+            body = b"# TYPE signer_power gauge\nsigner_power 1\n"
+        elif self.path == "/authorized_keys":
+            body = b"{}"
+        else:
+            self.send_response(404)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def load_service(target, upstream_url, bakers):
+    if target == "sidecar":
+        sidecar = load_script("sidecar.py", "sidecar")
+        sidecar.NODE_URL = upstream_url
+        # The heads stream isn't started, probes are served by polling
+        return sidecar.service
+    if target == "signer_exporter":
+        os.environ.update(
+            READINESS_PROBE_PATH="/authorized_keys",
+            SIGNER_METRICS="true",
+            SIGNER_PROBE_INTERVAL="1",
+        )
+        signer_exporter = load_script(
+            "signer_exporter.py",
+            "signer_exporter",
+            CHARTS_DIR / "tezos-signer-forwarder" / "scripts",
+        )
+        signer_exporter.signer_health.signer_url = upstream_url
+        return signer_exporter.service
+    pyrometer_exporter = load_script(
+        "pyrometer_exporter.py",
+        "pyrometer_exporter",
+        CHARTS_DIR / "pyrometer" / "scripts",
+    )
+    events = [
+        {"kind": kind, "baker": f"tz1baker{i}"}
+        for i in range(bakers)
+        for kind in ("baker_unhealthy", "missed_endorsement")
+    ]
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        pyrometer_exporter.baker_events.ingest(events)
+    return pyrometer_exporter.service
+
+
+def serve(target, bakers, ports):
+    """Run in the service's process: put its port in ports, then serve"""
+    upstream = http.server.ThreadingHTTPServer(("127.0.0.1", 0), UpstreamHandler)
+    upstream.daemon_threads = True
+    threading.Thread(target=upstream.serve_forever, daemon=True).start()
+    upstream_url = f"http://127.0.0.1:{upstream.server_address[1]}"
+    service = load_service(target, upstream_url, bakers)
+
+    async def run():
+        ports.put(await service.start("127.0.0.1", 0))
+        await asyncio.Event().wait()
+
+    asyncio.run(run())
+
+
+async def load(url, concurrency, duration):
+    """Return the latencies of the requests made, and the count of errors"""
+    latencies = []
+    errors = 0
+    deadline = time.monotonic() + duration
+    connector = aiohttp.TCPConnector(limit=concurrency)
+    async with aiohttp.ClientSession(connector=connector) as session:
+
+        async def worker():
+            nonlocal errors
+            while time.monotonic() < deadline:
+                start = time.monotonic()
+                try:
+                    async with session.get(url) as r:
+                        await r.read()
+                        if r.status != 200:
+                            errors += 1
+                except aiohttp.ClientError:
+                    errors += 1
+                latencies.append(time.monotonic() - start)
+
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return latencies, errors
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--targets", nargs="+", choices=TARGETS, default=list(TARGETS))
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 10, 50])
+    parser.add_argument("--duration", type=float, default=5, help="seconds per run")
+    parser.add_argument(
+        "--bakers", type=int, default=1000, help="bakers known to pyrometer_exporter"
+    )
+    parser.add_argument("--json", help="also write the results to this file")
+    args = parser.parse_args()
+
+    print(f"{'target':<20}{'path':<12}{'concurrency':>12}", end="")
+    print(f"{'req/s':>10}{'p50 (ms)':>10}{'p99 (ms)':>10}{'errors':>8}")
+    results = []
+    for target in args.targets:
+        ports = multiprocessing.Queue()
+        process = multiprocessing.Process(
+            target=serve, args=(target, args.bakers, ports), daemon=True
+        )
+        process.start()
+        port = ports.get(timeout=30)
+        try:
+            for path in TARGETS[target]:
+                url = f"http://127.0.0.1:{port}{path}"
+                for concurrency in args.concurrency:
+                    latencies, errors = asyncio.run(
+                        load(url, concurrency, args.duration)
+                    )
+                    result = {
+                        "target": target,
+                        "path": path,
+                        "concurrency": concurrency,
+                        "requests_per_second": len(latencies) / args.duration,
+                        "p50": percentile(latencies, 0.5),
+                        "p99": percentile(latencies, 0.99),
+                        "errors": errors,
+                    }
+                    results.append(result)
+                    print(
+                        f"{target:<20}{path:<12}{concurrency:>12}"
+                        f"{result['requests_per_second']:>10.0f}"
+                        f"{result['p50'] * 1000:>10.2f}{result['p99'] * 1000:>10.2f}"
+                        f"{errors:>8}"
+                    )
+        finally:
+            process.terminate()
+            process.join()
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
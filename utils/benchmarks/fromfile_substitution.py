@@ -0,0 +1,136 @@
+"""
+Compare the `fromfile#` substitution of config-generator with the one of
+chain-initiator.sh, for the kernels only present in the octez image, on a
+synthetic parameters.json referencing a kernel.
+
+The shell substitution is given a time budget, and its total run time is
+extrapolated from the share of the file it got through if it runs out of it.
+
+    python benchmarks/fromfile_substitution.py --kernel-mib 8 --accounts 2000
+"""
+
+import argparse
+import json
+import os
+import re
+import subprocess
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+from common import UTILS_DIR, load_config_generator
+
+CHAIN_INITIATOR = UTILS_DIR.parent / "charts/tezos/scripts/chain-initiator.sh"
+
+
+def substitution_script(parameters_file, tmp_parameters_file):
+    """The substitution part of chain-initiator.sh, working on the given files"""
+    script = CHAIN_INITIATOR.read_text()
+    script = script[
+        script.index("PARAMETERS_FILE=") : script.index("echo Activating chain:")
+    ]
+    script = re.sub(
+        r"^PARAMETERS_FILE=.*$", f"PARAMETERS_FILE='{parameters_file}'", script, 1, re.M
+    )
+    return re.sub(
+        r"^TMP_PARAMETERS_FILE=.*$",
+        f"TMP_PARAMETERS_FILE='{tmp_parameters_file}'",
+        script,
+        1,
+        re.M,
+    )
+
+
+def synthetic_parameters(accounts, kernel_path):
+    return {
+        "bootstrap_accounts": [
+            [f"edpk{i:050d}", "4000000000000"] for i in range(accounts)
+        ],
+        "bootstrap_smart_rollups": [
+            {
+                "address": "sr1RYurGZtN8KNSpkMcCt9CgWeUaNkzsAfXf",
+                "pvm_kind": "wasm_2_0_0",
+                "kernel": f"fromfile#{kernel_path}",
+                "parameters_ty": {"prim": "unit"},
+            }
+        ],
+    }
+
+
+def run_python(config_generator, parameters, output):
+    tracemalloc.start()
+    start = time.perf_counter()
+    config_generator.write_protocol_parameters_json(parameters, output)
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed, peak
+
+
+def run_shell(workdir, parameters, budget):
+    parameters_file = workdir / "shell_parameters.json"
+    tmp_parameters_file = workdir / "shell_tmp_parameters.json"
+    # chain-initiator.sh substitutes the file written by config-generator
+    # before this change, i.e. json.dumps with the marker left in place.
+    with open(parameters_file, "w") as f:
+        print(json.dumps(parameters, indent=2), file=f)
+    total = parameters_file.stat().st_size
+
+    start = time.perf_counter()
+    try:
+        subprocess.run(
+            ["bash", "-c", substitution_script(parameters_file, tmp_parameters_file)],
+            stdout=subprocess.DEVNULL,
+            timeout=budget,
+            check=True,
+        )
+        return time.perf_counter() - start, False
+    except subprocess.TimeoutExpired:
+        elapsed = time.perf_counter() - start
+        # Only count the characters copied from parameters.json, not the kernel
+        done = tmp_parameters_file.stat().st_size if tmp_parameters_file.exists() else 0
+        if done > total:
+            done = total
+        return elapsed * total / max(done, 1), True
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--kernel-mib", type=int, default=8)
+    parser.add_argument("--accounts", type=int, default=100)
+    parser.add_argument(
+        "--shell-budget",
+        type=float,
+        default=30,
+        help="seconds the shell loop may run before being extrapolated",
+    )
+    args = parser.parse_args()
+
+    config_generator = load_config_generator()
+    with tempfile.TemporaryDirectory() as tmp:
+        workdir = Path(tmp)
+        kernel_path = workdir / "kernel.wasm"
+        with open(kernel_path, "wb") as f:
+            for _ in range(args.kernel_mib):
+                f.write(os.urandom(1 << 20))
+        parameters = synthetic_parameters(args.accounts, kernel_path)
+
+        output = workdir / "parameters.json"
+        python_time, python_peak = run_python(config_generator, parameters, output)
+        print(
+            f"config-generator: {python_time:.3f}s, "
+            f"peak python memory {python_peak / (1 << 20):.1f} MiB, "
+            f"wrote {output.stat().st_size / (1 << 20):.1f} MiB"
+        )
+
+        shell_time, extrapolated = run_shell(workdir, parameters, args.shell_budget)
+        print(
+            f"chain-initiator.sh: {shell_time:.3f}s"
+            + (" (extrapolated)" if extrapolated else "")
+        )
+        print(f"speedup: {shell_time / python_time:.0f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,185 @@
+"""
+Measure the disk writes and space needed to import a tezos snapshot, when it
+is downloaded to disk then imported, and when it is streamed into the
+importer (SNAPSHOT_STREAMING=true).
+
+The snapshot-importer.sh script of the chart runs against a temporary
+/var/tezos, with an octez-node standing in for the real one that writes the
+snapshot it reads to its data dir, as much as an import roughly writes. The
+snapshot is served from a local HTTP server. Disk writes are the blocks
+written by the processes of each mode, as accounted by the kernel, and the
+space is the peak size of the temporary /var/tezos.
+
+    python benchmarks/snapshot_import_io.py --size-mib 512
+"""
+
+import argparse
+import functools
+import hashlib
+import http.server
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+from common import UTILS_DIR
+
+SNAPSHOT_IMPORTER = UTILS_DIR.parent / "charts/tezos/scripts/snapshot-importer.sh"
+
+FAKE_OCTEZ_NODE = """#!/bin/sh
+# octez-node snapshot import FILE --data-dir DIR
+cat "$3" > "$5/imported"
+"""
+
+
+def importer_script(root):
+    """snapshot-importer.sh working on the temporary /var/tezos under root"""
+    script = SNAPSHOT_IMPORTER.read_text()
+    script = script.replace('bin_dir="/usr/local/bin"', f'bin_dir="{root}/bin"')
+    script = script.replace('data_dir="/var/tezos"', f'data_dir="{root}/var/tezos"')
+    return script.replace("/etc/tezos/config.json", f"{root}/config.json")
+
+
+def written_bytes():
+    """Bytes written to disk by the children waited for so far"""
+    return resource.getrusage(resource.RUSAGE_CHILDREN).ru_oublock * 512
+
+
+def tree_size(path):
+    size = 0
+    for directory, _, files in os.walk(path):
+        for name in files:
+            try:
+                size += os.lstat(os.path.join(directory, name)).st_blocks * 512
+            except FileNotFoundError:
+                pass
+    return size
+
+
+class PeakSize(threading.Thread):
+    """Sample the size of the files under path until stopped"""
+
+    def __init__(self, path):
+        super().__init__(daemon=True)
+        self.path = path
+        self.peak = 0
+        self.stopping = threading.Event()
+
+    def run(self):
+        while not self.stopping.wait(0.05):
+            self.peak = max(self.peak, tree_size(self.path))
+
+    def stop(self):
+        self.stopping.set()
+        self.join()
+        self.peak = max(self.peak, tree_size(self.path))
+        return self.peak
+
+
+class FileHandler(http.server.SimpleHTTPRequestHandler):
+    """Serves files, without Range requests: downloader.py streams them"""
+
+    def log_message(self, format, *args):
+        pass
+
+
+class QuietHTTPServer(http.server.ThreadingHTTPServer):
+    def handle_error(self, request, client_address):
+        # downloader.py closes the response of its probe early
+        pass
+
+
+def run_mode(mode, url, sha256, workdir):
+    root = Path(tempfile.mkdtemp(prefix=f"{mode}-", dir=workdir))
+    node_dir = root / "var/tezos/node"
+    (node_dir / "data").mkdir(parents=True)
+    (root / "bin").mkdir()
+    octez_node = root / "bin/octez-node"
+    octez_node.write_text(FAKE_OCTEZ_NODE)
+    octez_node.chmod(0o755)
+    (root / "config.json").write_text("{}")
+    # What snapshot-downloader.sh leaves behind
+    (node_dir / "chain.snapshot.url").write_text(url + "\n")
+    (node_dir / "chain.snapshot.sha256").write_text(sha256 + "\n")
+
+    os.sync()
+    written = written_bytes()
+    peak = PeakSize(root / "var/tezos")
+    peak.start()
+    start = time.monotonic()
+    if mode == "two-step":
+        subprocess.run(
+            [
+                sys.executable,
+                UTILS_DIR / "downloader.py",
+                "--sha256",
+                sha256,
+                url,
+                node_dir / "chain.snapshot",
+            ],
+            check=True,
+            stdout=subprocess.DEVNULL,
+        )
+        (node_dir / "chain.snapshot.url").unlink()
+    subprocess.run(
+        ["bash", "-c", importer_script(root)],
+        check=True,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    elapsed = time.monotonic() - start
+    result = {
+        "mode": mode,
+        "seconds": elapsed,
+        "disk_bytes_written": written_bytes() - written,
+        "peak_disk_usage": peak.stop(),
+    }
+    assert (node_dir / "data/imported").stat().st_size > 0
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--size-mib", type=int, default=256)
+    parser.add_argument("--json", help="also write the results to this file")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        served = Path(workdir) / "served"
+        served.mkdir()
+        sha256 = hashlib.sha256()
+        with open(served / "chain.snapshot", "wb") as f:
+            for _ in range(args.size_mib):
+                block = os.urandom(1 << 20)
+                sha256.update(block)
+                f.write(block)
+        server = QuietHTTPServer(
+            ("127.0.0.1", 0), functools.partial(FileHandler, directory=str(served))
+        )
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        url = f"http://127.0.0.1:{server.server_address[1]}/chain.snapshot"
+
+        print(f"{'mode':<12}{'seconds':>10}{'written (MiB)':>16}{'peak (MiB)':>14}")
+        results = []
+        for mode in ("two-step", "streaming"):
+            result = run_mode(mode, url, sha256.hexdigest(), workdir)
+            results.append(result)
+            print(
+                f"{mode:<12}{result['seconds']:>10.2f}"
+                + f"{result['disk_bytes_written'] / (1 << 20):>16.1f}"
+                + f"{result['peak_disk_usage'] / (1 << 20):>14.1f}"
+            )
+        server.shutdown()
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
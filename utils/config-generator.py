@@ -1,133 +1,386 @@
 import argparse
 import collections
+import functools
+import hashlib
 import json
 import os
 import re
-import requests
 import socket
 import sys
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import contextmanager
 from grp import getgrnam
-from hashlib import blake2b
 from pathlib import Path
 from re import sub
-from shutil import chown
+from shutil import chown, copyfileobj
 from typing import Union
 
-import requests
-from base58 import b58encode_check
-from pytezos import Key
-
-with open("/etc/secret-volume/ACCOUNTS", "r") as secret_file:
-    ACCOUNTS = json.loads(secret_file.read())
-CHAIN_PARAMS = json.loads(os.environ["CHAIN_PARAMS"])
-DATA_DIR = "/var/tezos/node/data"
-NODE_GLOBALS = json.loads(os.environ["NODE_GLOBALS"]) or {}
-NODES = json.loads(os.environ["NODES"])
-NODE_IDENTITIES = json.loads(os.getenv("NODE_IDENTITIES", "{}"))
-OCTEZ_SIGNERS = json.loads(os.getenv("OCTEZ_SIGNERS", "{}"))
-OCTEZ_ROLLUP_NODES = json.loads(os.getenv("OCTEZ_ROLLUP_NODES", "{}"))
-TACOINFRA_SIGNERS = json.loads(os.getenv("TACOINFRA_SIGNERS", "{}"))
-
-MY_POD_NAME = os.environ["MY_POD_NAME"]
-MY_POD_TYPE = os.environ["MY_POD_TYPE"]
-
-MY_POD_CLASS = {}
-MY_POD_CONFIG = {}
-ALL_NODES = {}
-BAKING_NODES = {}
-
-for cl, val in NODES.items():
-    if val != None:
-        for i, inst in enumerate(val["instances"]):
-            name = f"{cl}-{i}"
-            ALL_NODES[name] = inst
-            if name == MY_POD_NAME:
-                MY_POD_CLASS = val
-                MY_POD_CONFIG = inst
-            if "runs" in val:
-                if "baker" in val["runs"]:
-                    BAKING_NODES[name] = inst
-
-# MY_POD_CLASS is not set after iterating nodes configurations,
-# this can happen when the pod is one which scaled out by autoscaler.
-# Set this value to the value mapped by MY_NODE_CLASS to read possible config specified in at NODES
-if not MY_POD_CLASS and "MY_NODE_CLASS" in os.environ:
-    my_node_class = os.environ["MY_NODE_CLASS"]
-    MY_POD_CLASS = NODES[my_node_class]
-
-if MY_POD_TYPE == "signing":
-    MY_POD_CONFIG = OCTEZ_SIGNERS[MY_POD_NAME]
-if MY_POD_TYPE == "rollup":
-    MY_POD_CONFIG = OCTEZ_ROLLUP_NODES[MY_POD_NAME]
-
-NETWORK_CONFIG = CHAIN_PARAMS["network"]
-
-# If there are no genesis params, we are dealing with a public network.
-THIS_IS_A_PUBLIC_NET = True if not NETWORK_CONFIG.get("genesis") else False
-# Even if we are dealing with a public network, we may not want to join it in a
-# case such as when creating a network replica.
-JOIN_PUBLIC_NETWORK = NETWORK_CONFIG.get("join_public_network", THIS_IS_A_PUBLIC_NET)
-if not THIS_IS_A_PUBLIC_NET and JOIN_PUBLIC_NETWORK:
-    raise ValueError(
-        "Instruction was given to join a public network while defining a private chain"
+from tezos_keys import Key
+
+
+def available_cpus():
+    """
+    The number of CPUs this process may use. os.cpu_count() is the host's:
+    count the CPUs it is allowed to run on instead, capped by the CPU quota of
+    its cgroup (the CPU limit of the container) if any.
+    """
+    cpus = len(os.sched_getaffinity(0))
+    try:
+        with open("/sys/fs/cgroup/cpu.max") as f:
+            quota, period = f.read().split()
+        if quota != "max":
+            cpus = min(cpus, max(-(-int(quota) // int(period)), 1))
+    except (OSError, ValueError):
+        pass
+    return cpus
+
+
+class Config:
+    """
+    The configuration of the pod config-generator runs in.
+
+    Nothing is read when a Config is created: the environment, the accounts
+    secret and the node classes are parsed and indexed the first time they
+    are used, so a pod only pays for the parts of the configuration its
+    MY_POD_TYPE needs. Passing a mapping as environ and other directories
+    allows building a Config outside of a pod, e.g. in benchmarks.
+    """
+
+    def __init__(
+        self,
+        environ=os.environ,
+        secret_volume="/etc/secret-volume",
+        etc_dir="/etc/tezos",
+        var_dir="/var/tezos",
+    ):
+        self.environ = environ
+        self.secret_volume = secret_volume
+        self.etc_dir = etc_dir
+        self.var_dir = var_dir
+        self.client_dir = f"{var_dir}/client"
+        self.data_dir = f"{var_dir}/node/data"
+
+    def json_env(self, name, default=None):
+        if default is None:
+            return json.loads(self.environ[name])
+        return json.loads(self.environ.get(name, default))
+
+    @functools.cached_property
+    def accounts(self):
+        with open(f"{self.secret_volume}/ACCOUNTS", "r") as secret_file:
+            return json.loads(secret_file.read())
+
+    @functools.cached_property
+    def chain_params(self):
+        return self.json_env("CHAIN_PARAMS")
+
+    @functools.cached_property
+    def node_globals(self):
+        return self.json_env("NODE_GLOBALS") or {}
+
+    @functools.cached_property
+    def nodes(self):
+        return self.json_env("NODES")
+
+    @functools.cached_property
+    def node_identities(self):
+        return self.json_env("NODE_IDENTITIES", "{}")
+
+    @functools.cached_property
+    def octez_signers(self):
+        return self.json_env("OCTEZ_SIGNERS", "{}")
+
+    @functools.cached_property
+    def octez_rollup_nodes(self):
+        return self.json_env("OCTEZ_ROLLUP_NODES", "{}")
+
+    @functools.cached_property
+    def tacoinfra_signers(self):
+        return self.json_env("TACOINFRA_SIGNERS", "{}")
+
+    @property
+    def my_pod_name(self):
+        return self.environ["MY_POD_NAME"]
+
+    @property
+    def my_pod_type(self):
+        return self.environ["MY_POD_TYPE"]
+
+    # Resolving the FQDN may be a DNS round-trip, do it once.
+    @functools.cached_property
+    def fqdn(self):
+        return socket.getfqdn()
+
+    # Deriving public keys and hashes from encoded keys is CPU bound. On chains
+    # with many accounts the work is fanned out over a process pool in batches,
+    # by default one worker per CPU the pod may use.
+    @property
+    def key_derivation_workers(self):
+        workers = self.environ.get("KEY_DERIVATION_WORKERS")
+        return int(workers) if workers else available_cpus()
+
+    @property
+    def key_derivation_batch_size(self):
+        return int(self.environ.get("KEY_DERIVATION_BATCH_SIZE", "64"))
+
+    # Maximum number of in-cluster bootstrap nodes a node connects to. Unset
+    # or 0 lists all of them.
+    @property
+    def bootstrap_peers_per_node(self):
+        return int(
+            self.my_pod_class.get(
+                "bootstrap_peers_per_node",
+                self.node_globals.get("bootstrap_peers_per_node", 0),
+            )
+        )
+
+    @property
+    def bootstrap_contract_fetch_workers(self):
+        return int(self.environ.get("BOOTSTRAP_CONTRACT_FETCH_WORKERS", "8"))
+
+    @property
+    def bootstrap_contracts_cache_dir(self):
+        return self.environ.get(
+            "BOOTSTRAP_CONTRACTS_CACHE_DIR", f"{self.var_dir}/cache/bootstrap_contracts"
+        )
+
+    @property
+    def snapshot_metadata_cache_dir(self):
+        return self.environ.get(
+            "SNAPSHOT_METADATA_CACHE_DIR", f"{self.var_dir}/cache/snapshot_metadata"
+        )
+
+    @functools.cached_property
+    def all_nodes(self):
+        """All of the node instances, by pod name"""
+        all_nodes = {}
+        for cl, val in self.nodes.items():
+            if val != None:
+                for i, inst in enumerate(val["instances"]):
+                    all_nodes[f"{cl}-{i}"] = inst
+        return all_nodes
+
+    @functools.cached_property
+    def baking_nodes(self):
+        """The node instances running a baker, by pod name"""
+        return {
+            f"{cl}-{i}": inst
+            for cl, val in self.nodes.items()
+            if val != None and "baker" in val.get("runs", [])
+            for i, inst in enumerate(val["instances"])
+        }
+
+    @functools.cached_property
+    def my_pod_class(self):
+        if self.my_pod_type == "node":
+            for cl, val in self.nodes.items():
+                if val != None:
+                    for i in range(len(val["instances"])):
+                        if f"{cl}-{i}" == self.my_pod_name:
+                            return val
+        # MY_POD_CLASS is not set after iterating nodes configurations,
+        # this can happen when the pod is one which scaled out by autoscaler.
+        # Set this value to the value mapped by MY_NODE_CLASS to read possible config specified in at NODES
+        if "MY_NODE_CLASS" in self.environ:
+            return self.nodes[self.environ["MY_NODE_CLASS"]]
+        return {}
+
+    @functools.cached_property
+    def my_pod_config(self):
+        if self.my_pod_type == "signing":
+            return self.octez_signers[self.my_pod_name]
+        if self.my_pod_type == "rollup":
+            return self.octez_rollup_nodes[self.my_pod_name]
+        if self.my_pod_type == "node":
+            return self.all_nodes.get(self.my_pod_name, {})
+        return {}
+
+    @functools.cached_property
+    def account_index(self):
+        return AccountIndex(
+            self.nodes,
+            self.octez_signers,
+            self.tacoinfra_signers,
+            self.octez_rollup_nodes,
+        )
+
+    @property
+    def network_config(self):
+        return self.chain_params["network"]
+
+    @property
+    def this_is_a_public_net(self):
+        # If there are no genesis params, we are dealing with a public network.
+        return True if not self.network_config.get("genesis") else False
+
+    @property
+    def join_public_network(self):
+        # Even if we are dealing with a public network, we may not want to join it in a
+        # case such as when creating a network replica.
+        return self.network_config.get("join_public_network", self.this_is_a_public_net)
+
+    def check_network_config(self):
+        if not self.this_is_a_public_net and self.join_public_network:
+            raise ValueError(
+                "Instruction was given to join a public network while defining a private chain"
+            )
+
+
+CONFIG = Config()
+
+
+# The fingerprint of the inputs of the last successful run is kept on the
+# persistent volume, along with the files that run generated, so that
+# container restarts with unchanged inputs don't redo all of the work.
+FINGERPRINT_FILE = "config-generator.fingerprint"
+FINGERPRINT_ENV_VARS = (
+    "ARCHIVE_TARBALL_URL",
+    "CHAIN_PARAMS",
+    "FULL_SNAPSHOT_URL",
+    "FULL_TARBALL_URL",
+    "MY_NODE_CLASS",
+    "MY_POD_IP",
+    "MY_POD_NAME",
+    "MY_POD_TYPE",
+    "NODE_GLOBALS",
+    "NODE_IDENTITIES",
+    "NODES",
+    "OCTEZ_ROLLUP_NODES",
+    "OCTEZ_SIGNERS",
+    "OCTEZ_VERSION",
+    "PREFER_TARBALLS",
+    "ROLLING_SNAPSHOT_URL",
+    "ROLLING_TARBALL_URL",
+    "SNAPSHOT_METADATA_NETWORK_NAME",
+    "SNAPSHOT_SOURCE",
+    "TACOINFRA_SIGNERS",
+)
+
+
+def inputs_fingerprint():
+    """
+    Hash everything the generated files depend on: the environment, the
+    mounted accounts and network config, and the code generating them.
+    """
+    inputs = {
+        "argv": sys.argv[1:],
+        "env": {name: CONFIG.environ.get(name) for name in FINGERPRINT_ENV_VARS},
+        "files": {},
+        "fqdn": CONFIG.fqdn,
+    }
+    input_files = (
+        f"{CONFIG.secret_volume}/ACCOUNTS",
+        f"{CONFIG.etc_dir}/data/config.json",
+        __file__,
+        f"{os.path.dirname(os.path.abspath(__file__))}/tezos_keys.py",
     )
+    for path in input_files:
+        try:
+            with open(path, "rb") as f:
+                inputs["files"][path] = hashlib.sha256(f.read()).hexdigest()
+        except FileNotFoundError:
+            inputs["files"][path] = None
+    return hashlib.sha256(json.dumps(inputs, sort_keys=True).encode()).hexdigest()
+
+
+def is_up_to_date(fingerprint):
+    """
+    Check whether the last successful run had the same inputs and all of the
+    files it generated are still there.
+    """
+    try:
+        with open(f"{CONFIG.var_dir}/{FINGERPRINT_FILE}", "r") as f:
+            last_run = json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return False
+    return last_run.get("fingerprint") == fingerprint and all(
+        os.path.exists(path) for path in last_run.get("outputs", [])
+    )
+
+
+def generated_files():
+    """List the files a successful run generates for this pod."""
+    tezdir = CONFIG.client_dir
+    outputs = [
+        f"{tezdir}/secret_keys",
+        f"{tezdir}/public_keys",
+        f"{tezdir}/public_key_hashs",
+    ]
+    if os.path.exists(f"{tezdir}/authorized_keys"):
+        outputs.append(f"{tezdir}/authorized_keys")
+    if CONFIG.node_identities.get(CONFIG.my_pod_name, False):
+        outputs.append(f"{CONFIG.data_dir}/identity.json")
+    if CONFIG.my_pod_type == "activating":
+        outputs += [
+            f"{CONFIG.etc_dir}/parameters.json",
+            f"{CONFIG.etc_dir}/activation_account_name",
+        ]
+    if CONFIG.my_pod_type == "node":
+        outputs.append(f"{CONFIG.etc_dir}/config.json")
+        if os.path.exists(f"{CONFIG.var_dir}/snapshot_config.json"):
+            outputs.append(f"{CONFIG.var_dir}/snapshot_config.json")
+    return outputs
 
 
 def main():
-    all_accounts = ACCOUNTS
+    # Fail early on inconsistent network settings, whatever the pod type
+    CONFIG.check_network_config()
+
+    fingerprint_path = f"{CONFIG.var_dir}/{FINGERPRINT_FILE}"
+    fingerprint = inputs_fingerprint()
+    if is_up_to_date(fingerprint):
+        print(f"Inputs are unchanged since the last run ({fingerprint}),")
+        print("and the generated files are present. Nothing to do.")
+        return
+    # Don't let an interrupted run pass for a completed one
+    if os.path.exists(fingerprint_path):
+        os.remove(fingerprint_path)
+
+    generate()
+
+    if (
+        CONFIG.my_pod_type == "node"
+        and CONFIG.environ.get("SNAPSHOT_SOURCE")
+        and not os.path.isdir(f"{CONFIG.data_dir}/context")
+        and not os.path.exists(f"{CONFIG.var_dir}/snapshot_config.json")
+    ):
+        # No snapshot could be found, look for one again on the next start
+        return
+    with open(fingerprint_path, "w") as f:
+        json.dump({"fingerprint": fingerprint, "outputs": generated_files()}, f)
+
+
+def generate():
+    all_accounts = CONFIG.accounts
 
     import_keys(all_accounts)
 
-    if MY_POD_NAME in BAKING_NODES:
+    if CONFIG.my_pod_type == "node" and CONFIG.my_pod_name in CONFIG.baking_nodes:
         # If this node is a baker, it must have an account with a secret key.
         verify_this_bakers_account(all_accounts)
 
     # Create the node's identity.json if its values are provided
-    if NODE_IDENTITIES.get(MY_POD_NAME, False):
+    if CONFIG.node_identities.get(CONFIG.my_pod_name, False):
         create_node_identity_json()
 
     # Create parameters.json
-    if MY_POD_TYPE == "activating":
+    if CONFIG.my_pod_type == "activating":
         print("Starting parameters.json file generation")
         protocol_parameters = create_protocol_parameters_json(all_accounts)
 
-        protocol_params_json = json.dumps(protocol_parameters, indent=2)
-        with open("/etc/tezos/parameters.json", "w") as json_file:
-            print(protocol_params_json, file=json_file)
+        write_protocol_parameters_json(
+            protocol_parameters, f"{CONFIG.etc_dir}/parameters.json"
+        )
 
-        with open("/etc/tezos/activation_account_name", "w") as file:
-            print(NETWORK_CONFIG["activation_account_name"], file=file)
+        with open(f"{CONFIG.etc_dir}/activation_account_name", "w") as file:
+            print(CONFIG.network_config["activation_account_name"], file=file)
 
     # Create config.json
-    if MY_POD_TYPE == "node":
+    if CONFIG.my_pod_type == "node":
         print("\nStarting config.json file generation")
-        bootstrap_peers = CHAIN_PARAMS.get("bootstrap_peers", [])
-
-        if JOIN_PUBLIC_NETWORK:
-            with open("/etc/tezos/data/config.json", "r") as f:
-                bootstrap_peers.extend(json.load(f)["p2p"]["bootstrap-peers"])
-        else:
-            local_bootstrap_peers = []
-            for name, settings in ALL_NODES.items():
-                print(" -- is " + name + " a bootstrap peer?\n")
-                my_pod_fqdn_with_port = f"{socket.getfqdn()}:9732"
-                if (
-                    settings.get("is_bootstrap_node", False)
-                    and name not in my_pod_fqdn_with_port
-                ):
-                    # Construct the FBN of the bootstrap node for all node's bootstrap_peers
-                    print(" -- YES!\n")
-                    bootstrap_peer_domain = sub(r"-\d+$", "", name)
-                    bootstrap_peer_fbn_with_port = (
-                        f"{name}.{bootstrap_peer_domain}:9732"
-                    )
-                    local_bootstrap_peers.append(bootstrap_peer_fbn_with_port)
-            bootstrap_peers.extend(local_bootstrap_peers)
-
-        if not bootstrap_peers and not MY_POD_CONFIG.get("is_bootstrap_node", False):
-            raise Exception(
-                "ERROR: No bootstrap peers found for this non-bootstrap node"
-            )
+        bootstrap_peers = get_bootstrap_peers()
 
         node_config = create_node_config_json(
             bootstrap_peers,
@@ -138,10 +391,10 @@ def main():
         )
         print("Generated config.json :")
         print(node_config_json)
-        with open("/etc/tezos/config.json", "w") as json_file:
+        with open(f"{CONFIG.etc_dir}/config.json", "w") as json_file:
             print(node_config_json, file=json_file)
 
-        if not os.path.isdir(f"{DATA_DIR}/context"):
+        if not os.path.isdir(f"{CONFIG.data_dir}/context"):
             node_snapshot_config = create_node_snapshot_config_json(
                 node_config["shell"]["history_mode"]
             )
@@ -152,7 +405,7 @@ def main():
             if node_snapshot_config:
                 print("Generated snapshot_config.json :")
                 print(node_snapshot_config_json)
-                with open("/var/tezos/snapshot_config.json", "w") as json_file:
+                with open(f"{CONFIG.var_dir}/snapshot_config.json", "w") as json_file:
                     print(node_snapshot_config_json, file=json_file)
 
 
@@ -161,7 +414,7 @@ def verify_this_bakers_account(accounts):
     Verify the current baker pod has an account with a secret key, unless the
     account is signed for via an external remote signer (e.g. Tacoinfra).
     """
-    accts = MY_POD_CONFIG.get("bake_using_accounts")
+    accts = CONFIG.my_pod_config.get("bake_using_accounts")
 
     if not accts or len(accts) < 1:
         raise Exception("ERROR: No baker accounts specified")
@@ -170,7 +423,7 @@ def verify_this_bakers_account(accounts):
         if not accounts.get(acct):
             raise Exception(f"ERROR: No account named {acct} found.")
         signer_url = accounts[acct].get("signer_url")
-        tacoinfra_signer = get_accounts_signer(TACOINFRA_SIGNERS, acct)
+        tacoinfra_signer = CONFIG.account_index.tacoinfra_signers.get(acct)
 
         # We can count on accounts[acct]["type"] because import_keys will
         # fill it in when it is missing.
@@ -195,58 +448,89 @@ def verify_this_bakers_account(accounts):
 # public key hash as a side-effect.  These are used later.
 
 
+class AccountIndex:
+    """
+    Lookup tables relating accounts to the signers and pods that use them.
+    They are built in a single pass over the signers, node instances and
+    rollup nodes so that per account lookups don't need to rescan them.
+
+    Pods are identified by (pod type, pod name) tuples, the pod types being
+    the values MY_POD_TYPE can take.
+    """
+
+    def __init__(self, nodes, octez_signers, tacoinfra_signers, rollup_nodes):
+        # account name -> {"name": signer name, "config": signer config}
+        self.octez_signers = self.index_signers(octez_signers)
+        self.tacoinfra_signers = self.index_signers(tacoinfra_signers)
+        # account name -> pods on which its secret key is exposed
+        self.exposing_pods = collections.defaultdict(set)
+        # pod -> account names of its authorized keys
+        self.authorized_keys = {}
+        # authorized keys known by all the node instances
+        self.all_node_authorized_keys = set()
+
+        for node_class, node_class_config in nodes.items():
+            if node_class_config == None:
+                continue
+            for i, instance in enumerate(node_class_config["instances"]):
+                pod = ("node", f"{node_class}-{i}")
+                self.authorized_keys[pod] = set(instance.get("authorized_keys", []))
+                self.all_node_authorized_keys.update(self.authorized_keys[pod])
+                for account_name in self.authorized_keys[pod].union(
+                    instance.get("bake_using_accounts", [])
+                ):
+                    self.exposing_pods[account_name].add(pod)
+
+        for signer_pod_name, signer_config in octez_signers.items():
+            pod = ("signing", signer_pod_name)
+            self.authorized_keys[pod] = set(signer_config.get("authorized_keys", []))
+            for account_name in signer_config["accounts"]:
+                self.exposing_pods[account_name].add(pod)
+
+        for rollup_pod_name, rollup_config in rollup_nodes.items():
+            operator_account = rollup_config.get("operator_account")
+            if operator_account:
+                self.exposing_pods[operator_account].add(("rollup", rollup_pod_name))
+
+    @staticmethod
+    def index_signers(signers):
+        """
+        Map each account to the signer signing for it. Error if the account is
+        specified in more than one signer.
+        """
+        index = {}
+        for signer_name, signer_config in signers.items():
+            for account_name in signer_config["accounts"]:
+                found_signer = index.get(account_name)
+                if found_signer and found_signer["name"] != signer_name:
+                    raise Exception(
+                        f"ERORR: Account '{account_name}' can't be specified in more than one signer."
+                    )
+                index[account_name] = {"name": signer_name, "config": signer_config}
+        return index
+
+
 def expose_secret_key(account_name):
     """
     Decides if an account needs to have its secret key exposed on the current
     pod.  It returns the obvious Boolean.
     """
-    if MY_POD_TYPE == "activating":
-        all_authorized_keys = [
-            key
-            for node in NODES.values()
-            for instance in node["instances"]
-            for key in instance.get("authorized_keys", [])
-        ]
-        if account_name in all_authorized_keys:
+    if CONFIG.my_pod_type == "activating":
+        if account_name in CONFIG.account_index.all_node_authorized_keys:
             # Populate authorized keys known by all bakers in the activation account.
             # This ensures that activation will succeed with a remote signer that requires auth,
             # regardless of which baker does it.
             return True
-        return NETWORK_CONFIG["activation_account_name"] == account_name
-
-    if MY_POD_TYPE == "signing":
-        return account_name in MY_POD_CONFIG.get("accounts")
+        return CONFIG.network_config["activation_account_name"] == account_name
 
-    if MY_POD_TYPE == "rollup":
-        return account_name == MY_POD_CONFIG.get("operator_account")
-
-    if MY_POD_TYPE == "node":
-        if account_name in MY_POD_CONFIG.get("authorized_keys", {}):
-            return True
-        return account_name in MY_POD_CONFIG.get("bake_using_accounts", {})
+    if CONFIG.my_pod_type in ("signing", "rollup", "node"):
+        my_pod = (CONFIG.my_pod_type, CONFIG.my_pod_name)
+        return my_pod in CONFIG.account_index.exposing_pods.get(account_name, ())
 
     return False
 
 
-def get_accounts_signer(signers, account_name):
-    """
-    Determine if there is a signer for the account. Error if the account is
-    specified in more than one signer.
-    """
-    found_signer = found_account = None
-    for signer in signers.items():
-        signer_name, signer_config = signer
-        if account_name in signer_config["accounts"]:
-            if account_name == found_account:
-                raise Exception(
-                    f"ERORR: Account '{account_name}' can't be specified in more than one signer."
-                )
-            found_account = account_name
-            found_signer = {"name": signer_name, "config": signer_config}
-    return found_signer
-
-
-def get_remote_signer_url(account: tuple[str, dict], key: Key) -> Union[str, None]:
+def get_remote_signer_url(account: tuple[str, dict], pkh: str) -> Union[str, None]:
     """
     Return the url of a remote signer, if any, that claims to sign for the
     account. Error if more than one signs for the account.
@@ -254,8 +538,8 @@ def get_remote_signer_url(account: tuple[str, dict], key: Key) -> Union[str, Non
     account_name, account_values = account
 
     signer_url = account_values.get("signer_url")
-    octez_signer = get_accounts_signer(OCTEZ_SIGNERS, account_name)
-    tacoinfra_signer = get_accounts_signer(TACOINFRA_SIGNERS, account_name)
+    octez_signer = CONFIG.account_index.octez_signers.get(account_name)
+    tacoinfra_signer = CONFIG.account_index.tacoinfra_signers.get(account_name)
 
     signers = (signer_url, octez_signer, tacoinfra_signer)
     if tuple(map(bool, (signers))).count(True) > 1:
@@ -269,10 +553,10 @@ def get_remote_signer_url(account: tuple[str, dict], key: Key) -> Union[str, Non
     if tacoinfra_signer:
         signer_url = f"http://{tacoinfra_signer['name']}:5000"
 
-    return signer_url and f"{signer_url}/{key.public_key_hash()}"
+    return signer_url and f"{signer_url}/{pkh}"
 
 
-def get_secret_key(account, key: Key):
+def get_secret_key(account, key: dict):
     """
     For nodes and activation job, check if there is a remote signer for the
     account. If found, use its url as the sk. If there is no signer and for all
@@ -280,10 +564,10 @@ def get_secret_key(account, key: Key):
     """
     account_name, _ = account
 
-    sk = (key.is_secret or None) and f"unencrypted:{key.secret_key()}"
-    if MY_POD_TYPE in ("node", "activating"):
-        signer_url = get_remote_signer_url(account, key)
-        octez_signer = get_accounts_signer(OCTEZ_SIGNERS, account_name)
+    sk = (key["is_secret"] or None) and f"unencrypted:{key['sk']}"
+    if CONFIG.my_pod_type in ("node", "activating"):
+        signer_url = get_remote_signer_url(account, key["pkh"])
+        octez_signer = CONFIG.account_index.octez_signers.get(account_name)
         if (sk and signer_url) and not octez_signer:
             raise Exception(
                 f"ERROR: Account {account_name} can't have both a secret key and cloud signer."
@@ -296,62 +580,125 @@ def get_secret_key(account, key: Key):
     return sk
 
 
+@contextmanager
+def timed_phase(name, timings):
+    """Record the wall time spent in the body of the block under `name`."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings[name] = time.perf_counter() - start
+
+
+def derive_key(encoded_key):
+    """
+    Parse an encoded key and derive its public key and public key hash. The
+    result is a plain dict so that it can be sent back from a worker process.
+    """
+    key = Key.from_encoded_key(encoded_key)
+    return {
+        "is_secret": key.is_secret,
+        "sk": key.secret_key() if key.is_secret else None,
+        "pk": key.public_key(),
+        "pkh": key.public_key_hash(),
+    }
+
+
+def derive_key_batch(encoded_keys):
+    return [derive_key(encoded_key) for encoded_key in encoded_keys]
+
+
+def derive_keys(
+    encoded_keys,
+    workers=None,
+    batch_size=None,
+):
+    """
+    Derive the keys of all encoded_keys, fanning batches out over a process
+    pool when there is more than one batch to do. Results are returned in the
+    same order as encoded_keys.
+    """
+    workers = workers or CONFIG.key_derivation_workers
+    batch_size = max(batch_size or CONFIG.key_derivation_batch_size, 1)
+    batches = [
+        encoded_keys[i : i + batch_size]
+        for i in range(0, len(encoded_keys), batch_size)
+    ]
+    workers = min(workers, len(batches))
+    if workers <= 1:
+        derived_batches = map(derive_key_batch, batches)
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            # executor.map yields results in submission order
+            derived_batches = list(executor.map(derive_key_batch, batches))
+    return [key for batch in derived_batches for key in batch]
+
+
 def import_keys(all_accounts):
     print("\nImporting keys")
-    tezdir = "/var/tezos/client"
+    tezdir = CONFIG.client_dir
     secret_keys = []
     public_keys = []
     public_key_hashs = []
     authorized_keys = []
+    timings = {}
+    my_authorized_keys = CONFIG.account_index.authorized_keys.get(
+        (CONFIG.my_pod_type, CONFIG.my_pod_name), ()
+    )
 
-    for account_name, account_values in all_accounts.items():
-        print("\n  Importing keys for account: " + account_name)
-        account_key = account_values.get("key")
-
-        if account_key == None:
-            raise Exception(f"{account_name} defined w/o a key")
-
-        key = Key.from_encoded_key(account_key)
-        account_values["type"] = "secret" if key.is_secret else "public"
-
-        # restrict which private key is exposed to which pod
-        if expose_secret_key(account_name):
-            sk = get_secret_key((account_name, account_values), key)
-            if not sk:
-                raise Exception("Secret key required but not provided.")
-            print("    Appending secret key")
-            secret_keys.append({"name": account_name, "value": sk})
-
-        pk_b58 = key.public_key()
-        print(f"    Appending public key: {pk_b58}")
-        public_keys.append(
-            {
-                "name": account_name,
-                "value": {"locator": "unencrypted:" + pk_b58, "key": pk_b58},
-            }
-        )
-        account_values["pk"] = pk_b58
+    with timed_phase("parse", timings):
+        for account_name, account_values in all_accounts.items():
+            if account_values.get("key") == None:
+                raise Exception(f"{account_name} defined w/o a key")
 
-        pkh_b58 = key.public_key_hash()
-        print(f"    Appending public key hash: {pkh_b58}")
-        public_key_hashs.append({"name": account_name, "value": pkh_b58})
-        account_values["pkh"] = pkh_b58
+    with timed_phase("derive", timings):
+        derived_keys = derive_keys(
+            [account_values["key"] for account_values in all_accounts.values()]
+        )
 
-        if MY_POD_TYPE == "signing" and account_name in MY_POD_CONFIG.get(
-            "authorized_keys", {}
+    with timed_phase("assemble", timings):
+        for (account_name, account_values), key in zip(
+            all_accounts.items(), derived_keys
         ):
-            print(f"    Appending authorized key: {pk_b58}")
-            authorized_keys.append({"name": account_name, "value": pk_b58})
+            print("\n  Importing keys for account: " + account_name)
+            account_values["type"] = "secret" if key["is_secret"] else "public"
+
+            # restrict which private key is exposed to which pod
+            if expose_secret_key(account_name):
+                sk = get_secret_key((account_name, account_values), key)
+                if not sk:
+                    raise Exception("Secret key required but not provided.")
+                print("    Appending secret key")
+                secret_keys.append({"name": account_name, "value": sk})
+
+            pk_b58 = key["pk"]
+            print(f"    Appending public key: {pk_b58}")
+            public_keys.append(
+                {
+                    "name": account_name,
+                    "value": {"locator": "unencrypted:" + pk_b58, "key": pk_b58},
+                }
+            )
+            account_values["pk"] = pk_b58
 
-        print(f"    Account key type: {account_values.get('type')}")
-        print(
-            f"    Account bootstrap balance: "
-            + f"{account_values.get('bootstrap_balance')}"
-        )
-        print(
-            f"    Is account a bootstrap baker: "
-            + f"{account_values.get('is_bootstrap_baker_account', False)}"
-        )
+            pkh_b58 = key["pkh"]
+            print(f"    Appending public key hash: {pkh_b58}")
+            public_key_hashs.append({"name": account_name, "value": pkh_b58})
+            account_values["pkh"] = pkh_b58
+
+            if CONFIG.my_pod_type == "signing" and account_name in my_authorized_keys:
+                print(f"    Appending authorized key: {pk_b58}")
+                authorized_keys.append({"name": account_name, "value": pk_b58})
+
+            print(f"    Account key type: {account_values.get('type')}")
+            print(
+                f"    Account bootstrap balance: "
+                + f"{account_values.get('bootstrap_balance')}"
+            )
+            print(
+                f"    Is account a bootstrap baker: "
+                + f"{account_values.get('is_bootstrap_baker_account', False)}"
+            )
 
     sk_path, pk_path, pkh_path, ak_path = (
         f"{tezdir}/secret_keys",
@@ -359,35 +706,42 @@ def import_keys(all_accounts):
         f"{tezdir}/public_key_hashs",
         f"{tezdir}/authorized_keys",
     )
-    print(f"\n  Writing {sk_path}")
-    json.dump(secret_keys, open(sk_path, "w"), indent=4)
-    print(f"  Writing {pk_path}")
-    json.dump(public_keys, open(pk_path, "w"), indent=4)
-    print(f"  Writing {pkh_path}")
-    json.dump(public_key_hashs, open(pkh_path, "w"), indent=4)
-    if MY_POD_TYPE == "signing" and len(authorized_keys) > 0:
-        print(f"  Writing {ak_path}")
-        json.dump(authorized_keys, open(ak_path, "w"), indent=4)
+    with timed_phase("write", timings):
+        print(f"\n  Writing {sk_path}")
+        json.dump(secret_keys, open(sk_path, "w"), indent=4)
+        print(f"  Writing {pk_path}")
+        json.dump(public_keys, open(pk_path, "w"), indent=4)
+        print(f"  Writing {pkh_path}")
+        json.dump(public_key_hashs, open(pkh_path, "w"), indent=4)
+        if CONFIG.my_pod_type == "signing" and len(authorized_keys) > 0:
+            print(f"  Writing {ak_path}")
+            json.dump(authorized_keys, open(ak_path, "w"), indent=4)
+
+    print(
+        f"\n  Imported {len(all_accounts)} accounts in "
+        + ", ".join(f"{phase} {secs:.3f}s" for phase, secs in timings.items())
+    )
 
 
 def create_node_identity_json():
-    identity_file_path = f"{DATA_DIR}/identity.json"
+    identity_file_path = f"{CONFIG.data_dir}/identity.json"
 
     # Manually create the data directory and identity.json, and give the
     # same dir/file permissions that tezos gives when it creates them.
     print("\nWriting identity.json file from the instance config")
-    print(f"Node id: {NODE_IDENTITIES.get(MY_POD_NAME)['peer_id']}")
+    node_identity = CONFIG.node_identities.get(CONFIG.my_pod_name)
+    print(f"Node id: {node_identity['peer_id']}")
 
-    os.makedirs(DATA_DIR, 0o700, exist_ok=True)
+    os.makedirs(CONFIG.data_dir, 0o700, exist_ok=True)
     with open(
         identity_file_path,
         "w",
         opener=lambda path, flags: os.open(path, flags, 0o644),
     ) as identity_file:
-        print(json.dumps(NODE_IDENTITIES.get(MY_POD_NAME)), file=identity_file)
+        print(json.dumps(node_identity), file=identity_file)
 
     nogroup = getgrnam("nogroup").gr_gid
-    chown(DATA_DIR, user=1000, group=nogroup)
+    chown(CONFIG.data_dir, user=1000, group=nogroup)
     chown(identity_file_path, user=1000, group=nogroup)
     print(f"Identity file written at {identity_file_path}")
 
@@ -415,6 +769,130 @@ def get_genesis_accounts_pubkey_and_balance(accounts):
 
 
 #
+# Settings of the HTTP sessions used to fetch remote files.
+HTTP_TIMEOUT = 30
+HTTP_RETRIES = 5
+HTTP_BACKOFF_FACTOR = 0.5
+
+
+def http_session(pool_size=1):
+    """
+    Create a requests session keeping up to pool_size connections alive per
+    host, and retrying failed requests with exponential backoff.
+    """
+    # requests is imported where it is needed, keeping startup fast for the
+    # runs that don't need to fetch anything.
+    import requests
+    from requests.adapters import HTTPAdapter
+    from urllib3.util.retry import Retry
+
+    adapter = HTTPAdapter(
+        pool_connections=pool_size,
+        pool_maxsize=pool_size,
+        max_retries=Retry(
+            total=HTTP_RETRIES,
+            backoff_factor=HTTP_BACKOFF_FACTOR,
+            status_forcelist=(429, 500, 502, 503, 504),
+        ),
+    )
+    session = requests.Session()
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+def write_json_atomically(path, data):
+    with open(f"{path}.tmp", "w") as f:
+        json.dump(data, f, indent=2)
+    os.replace(f"{path}.tmp", path)
+
+
+def cached_contract_is_intact(cache_dir, sha256):
+    try:
+        digest = hashlib.sha256()
+        with open(f"{cache_dir}/{sha256}.json", "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 16), b""):
+                digest.update(chunk)
+    except FileNotFoundError:
+        return False
+    return digest.hexdigest() == sha256
+
+
+def fetch_bootstrap_contract(session, url, cache_dir, cached=None):
+    """
+    Download a bootstrap contract to the cache dir. A copy previously cached
+    for the url is revalidated with a conditional GET, and used if the server
+    reports that the contract didn't change. The contract is streamed to disk
+    rather than held in memory. Return its cache entry: its sha256 and the
+    validators the server sent with it.
+    """
+    if isinstance(cached, str):
+        # Entries of older caches only have the sha256, which can't be
+        # revalidated.
+        cached = {"sha256": cached}
+    headers = {}
+    if cached and cached_contract_is_intact(cache_dir, cached["sha256"]):
+        if cached.get("etag"):
+            headers["If-None-Match"] = cached["etag"]
+        if cached.get("last_modified"):
+            headers["If-Modified-Since"] = cached["last_modified"]
+
+    sha256 = hashlib.sha256()
+    tmp_path = f"{cache_dir}/.download-{threading.get_ident()}"
+    with session.get(
+        url, headers=headers, stream=True, timeout=HTTP_TIMEOUT
+    ) as response:
+        response.raise_for_status()
+        if response.status_code == 304:
+            print(f"Using cached bootstrap contract from {url}")
+            return cached
+        print(f"Downloading bootstrap contract from {url}")
+        with open(tmp_path, "wb") as f:
+            for chunk in response.iter_content(chunk_size=1 << 16):
+                sha256.update(chunk)
+                f.write(chunk)
+    os.replace(tmp_path, f"{cache_dir}/{sha256.hexdigest()}.json")
+    return {
+        "sha256": sha256.hexdigest(),
+        "etag": response.headers.get("ETag"),
+        "last_modified": response.headers.get("Last-Modified"),
+    }
+
+
+def fetch_bootstrap_contracts(urls, cache_dir, workers=None):
+    """
+    Fetch the bootstrap contracts concurrently, through an on-disk cache keyed
+    by url and content hash. Return references to the cached contracts, in
+    the order of urls: they are only read when parameters.json is written,
+    see write_protocol_parameters_json.
+    """
+    workers = workers or CONFIG.bootstrap_contract_fetch_workers
+    workers = max(1, min(workers, len(urls)))
+    os.makedirs(cache_dir, exist_ok=True)
+    index_path = f"{cache_dir}/index.json"
+    try:
+        with open(index_path, "r") as f:
+            index = json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        index = {}
+
+    with http_session(pool_size=workers) as session:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            entries = list(
+                executor.map(
+                    lambda url: fetch_bootstrap_contract(
+                        session, url, cache_dir, index.get(url)
+                    ),
+                    urls,
+                )
+            )
+
+    index.update(zip(urls, entries))
+    write_json_atomically(index_path, index)
+
+    return [f"cached_contract#{cache_dir}/{entry['sha256']}.json" for entry in entries]
+
+
 # bootstrap_contracts are not part of `CHAIN_PARAMS["protocol_parameters"]`.
 # We are mounting a file containing them, since they are too large to be passed
 # as helm parameters.
@@ -424,7 +902,7 @@ def create_protocol_parameters_json(accounts):
 
     pubkeys_with_balances = get_genesis_accounts_pubkey_and_balance(accounts)
 
-    protocol_activation = CHAIN_PARAMS["protocol_activation"]
+    protocol_activation = CONFIG.chain_params["protocol_activation"]
     protocol_params = protocol_activation["protocol_parameters"]
     protocol_params["bootstrap_accounts"] = pubkeys_with_balances
 
@@ -433,10 +911,10 @@ def create_protocol_parameters_json(accounts):
     # genesis contracts are downloaded from a http location (like a bucket)
     # they are typically too big to be passed directly to helm
     if protocol_activation.get("bootstrap_contract_urls"):
-        protocol_params["bootstrap_contracts"] = []
-        for url in protocol_activation["bootstrap_contract_urls"]:
-            print(f"Injecting bootstrap contract from {url}")
-            protocol_params["bootstrap_contracts"].append(requests.get(url).json())
+        protocol_params["bootstrap_contracts"] = fetch_bootstrap_contracts(
+            protocol_activation["bootstrap_contract_urls"],
+            CONFIG.bootstrap_contracts_cache_dir,
+        )
 
     # Append any additional bootstrap params such as smart rollups, if any
     if protocol_activation.get("bootstrap_parameters"):
@@ -448,12 +926,58 @@ def create_protocol_parameters_json(accounts):
     return protocol_params
 
 
+# Values of the form `fromfile#<path>`, typically smart rollup kernels, are
+# replaced by the hex encoded content of the file. Values of the form
+# `cached_contract#<path>`, the bootstrap contracts, are replaced by the JSON
+# of the file.
+FROMFILE_PATTERN = re.compile(
+    r'"cached_contract#(?P<contract>(?:[^"\\]|\\.)*)"'
+    + r'|fromfile#(?P<kernel>(?:[^"\\]|\\.)*)"'
+)
+FROMFILE_CHUNK_SIZE = 1 << 20
+
+
+def write_protocol_parameters_json(protocol_params, path):
+    """
+    Write parameters.json, streaming the files referenced by `fromfile#`
+    values into it as hex, and the cached bootstrap contracts as they are, one
+    chunk at a time. References to files that don't exist in this container
+    are left for chain-initiator to substitute.
+    """
+    encoder = json.JSONEncoder(indent=2)
+    with open(path, "w") as json_file:
+        # iterencode yields every string value as a whole within one chunk
+        for chunk in encoder.iterencode(protocol_params):
+            position = 0
+            for match in FROMFILE_PATTERN.finditer(chunk):
+                if match.group("contract") is not None:
+                    filename = json.loads(f'"{match.group("contract")}"')
+                    json_file.write(chunk[position : match.start()])
+                    with open(filename, "r") as contract_file:
+                        copyfileobj(contract_file, json_file)
+                    position = match.end()
+                    continue
+                filename = json.loads(f'"{match.group("kernel")}"')
+                if not os.path.isfile(filename):
+                    print(f"Kernel file {filename} not found, leaving it as is")
+                    continue
+                print(f"Found kernel file: {filename}")
+                json_file.write(chunk[position : match.start()])
+                with open(filename, "rb") as kernel_file:
+                    while data := kernel_file.read(FROMFILE_CHUNK_SIZE):
+                        json_file.write(data.hex())
+                json_file.write('"')
+                position = match.end()
+            json_file.write(chunk[position:])
+        json_file.write("\n")
+
+
 def get_genesis_pubkey():
-    with open("/var/tezos/client/public_keys", "r") as f:
+    with open(f"{CONFIG.client_dir}/public_keys", "r") as f:
         pubkeys = json.load(f)
         genesis_pubkey = None
         for _, pubkey in enumerate(pubkeys):
-            if pubkey["name"] == NETWORK_CONFIG["activation_account_name"]:
+            if pubkey["name"] == CONFIG.network_config["activation_account_name"]:
                 genesis_pubkey = pubkey["value"]["key"]
                 break
         if not genesis_pubkey:
@@ -480,17 +1004,81 @@ def recursive_update(d, u):
     return d
 
 
+def get_bootstrap_peers():
+    """List the bootstrap peers of this node"""
+    bootstrap_peers = list(CONFIG.chain_params.get("bootstrap_peers", []))
+
+    if CONFIG.join_public_network:
+        with open(f"{CONFIG.etc_dir}/data/config.json", "r") as f:
+            bootstrap_peers.extend(json.load(f)["p2p"]["bootstrap-peers"])
+    else:
+        my_pod_fqdn_with_port = f"{CONFIG.fqdn}:9732"
+        local_bootstrap_nodes = [
+            name
+            for name, settings in CONFIG.all_nodes.items()
+            if settings.get("is_bootstrap_node", False)
+            and name not in my_pod_fqdn_with_port
+        ]
+        if CONFIG.bootstrap_peers_per_node:
+            local_bootstrap_nodes = select_bootstrap_peers(
+                CONFIG.my_pod_name,
+                local_bootstrap_nodes,
+                CONFIG.bootstrap_peers_per_node,
+            )
+        print(f"Bootstrap peers in the cluster: {local_bootstrap_nodes}")
+        for name in local_bootstrap_nodes:
+            # Construct the FBN of the bootstrap node for all node's bootstrap_peers
+            bootstrap_peer_domain = sub(r"-\d+$", "", name)
+            bootstrap_peers.append(f"{name}.{bootstrap_peer_domain}:9732")
+
+    if not bootstrap_peers and not CONFIG.my_pod_config.get("is_bootstrap_node", False):
+        raise Exception("ERROR: No bootstrap peers found for this non-bootstrap node")
+
+    return bootstrap_peers
+
+
+def select_bootstrap_peers(my_pod_name, bootstrap_nodes, count):
+    """
+    Deterministically pick up to count of the bootstrap_nodes for this pod.
+
+    Node classes take turns, so that the peers are spread across classes.
+    Within a class, and for the order of the turns, candidates are ranked by
+    rendezvous hashing of their name with the pod's name. This spreads the
+    fan-in evenly over the bootstrap nodes of a class, and adding or removing
+    a bootstrap node only changes the peers of the pods that picked it.
+    """
+
+    def rank(name):
+        return hashlib.sha256(f"{my_pod_name}/{name}".encode()).digest()
+
+    node_classes = collections.defaultdict(list)
+    for name in bootstrap_nodes:
+        node_classes[sub(r"-\d+$", "", name)].append(name)
+    turns = [
+        sorted(node_classes[node_class], key=rank)
+        for node_class in sorted(node_classes, key=rank)
+    ]
+
+    selected = []
+    while len(selected) < count and any(turns):
+        for candidates in turns:
+            if candidates and len(selected) < count:
+                selected.append(candidates.pop(0))
+    return selected
+
+
 def create_node_config_json(
     bootstrap_peers,
     net_addr=None,
 ):
     """Create the node's config.json file"""
 
+    my_pod_ip = CONFIG.environ.get("MY_POD_IP")
     computed_node_config = {
-        "data-dir": DATA_DIR,
+        "data-dir": CONFIG.data_dir,
         "rpc": {
-            "listen-addrs": [f"{os.getenv('MY_POD_IP')}:8732", "127.0.0.1:8732"],
-            "acl": [{"address": os.getenv("MY_POD_IP"), "blacklist": []}],
+            "listen-addrs": [f"{my_pod_ip}:8732", "127.0.0.1:8732"],
+            "acl": [{"address": my_pod_ip, "blacklist": []}],
         },
         "p2p": {
             "bootstrap-peers": bootstrap_peers,
@@ -498,18 +1086,18 @@ def create_node_config_json(
         },
         # "log": {"level": "debug"},
     }
-    node_config = NODE_GLOBALS.get("config", {})
-    node_config = recursive_update(node_config, MY_POD_CLASS.get("config", {}))
-    node_config = recursive_update(node_config, MY_POD_CONFIG.get("config", {}))
+    node_config = CONFIG.node_globals.get("config", {})
+    node_config = recursive_update(node_config, CONFIG.my_pod_class.get("config", {}))
+    node_config = recursive_update(node_config, CONFIG.my_pod_config.get("config", {}))
     node_config = recursive_update(node_config, computed_node_config)
 
-    if THIS_IS_A_PUBLIC_NET:
+    if CONFIG.this_is_a_public_net:
         # `octez-node config --network ...` will have been run in config-init.sh
         #  producing a config.json. The value passed to the `--network` flag may
         #  have been the chain name or a url to the config.json of the chain.
         #  Either way, set the `network` field here as the `network` object of the
         #  produced config.json.
-        with open("/etc/tezos/data/config.json", "r") as f:
+        with open(f"{CONFIG.etc_dir}/data/config.json", "r") as f:
             node_config_orig = json.load(f)
             if "network" in node_config_orig:
                 node_config["network"] = node_config_orig["network"]
@@ -517,14 +1105,14 @@ def create_node_config_json(
                 node_config["network"] = "mainnet"
 
     else:
-        if CHAIN_PARAMS.get("expected-proof-of-work") != None:
-            node_config["p2p"]["expected-proof-of-work"] = CHAIN_PARAMS[
+        if CONFIG.chain_params.get("expected-proof-of-work") != None:
+            node_config["p2p"]["expected-proof-of-work"] = CONFIG.chain_params[
                 "expected-proof-of-work"
             ]
 
         # Make a shallow copy of NETWORK_CONFIG so we can delete top level props
         # without mutating the original dict.
-        node_config["network"] = dict(NETWORK_CONFIG)
+        node_config["network"] = dict(CONFIG.network_config)
         # Delete props that are not part of the node config.json spec
         node_config["network"].pop("activation_account_name")
         node_config["network"].pop("join_public_network", None)
@@ -540,22 +1128,23 @@ def create_node_config_json(
 
 def create_node_snapshot_config_json(history_mode):
     """Create this node's snapshot config"""
+    import requests
 
-    if os.environ.get("SNAPSHOT_METADATA_NETWORK_NAME"):
-        network_name = os.environ.get("SNAPSHOT_METADATA_NETWORK_NAME")
+    if CONFIG.environ.get("SNAPSHOT_METADATA_NETWORK_NAME"):
+        network_name = CONFIG.environ.get("SNAPSHOT_METADATA_NETWORK_NAME")
     else:
-        network_name = NETWORK_CONFIG.get("chain_name")
-    prefer_tarballs = os.environ.get("PREFER_TARBALLS", "").lower() in (
+        network_name = CONFIG.network_config.get("chain_name")
+    prefer_tarballs = CONFIG.environ.get("PREFER_TARBALLS", "").lower() in (
         "true",
         "1",
         "t",
     )
     artifact_type = "tarball" if prefer_tarballs else "tezos-snapshot"
-    rolling_tarball_url = os.environ.get("ROLLING_TARBALL_URL")
-    full_tarball_url = os.environ.get("FULL_TARBALL_URL")
-    archive_tarball_url = os.environ.get("ARCHIVE_TARBALL_URL")
-    rolling_snapshot_url = os.environ.get("ROLLING_SNAPSHOT_URL")
-    full_snapshot_url = os.environ.get("FULL_SNAPSHOT_URL")
+    rolling_tarball_url = CONFIG.environ.get("ROLLING_TARBALL_URL")
+    full_tarball_url = CONFIG.environ.get("FULL_TARBALL_URL")
+    archive_tarball_url = CONFIG.environ.get("ARCHIVE_TARBALL_URL")
+    rolling_snapshot_url = CONFIG.environ.get("ROLLING_SNAPSHOT_URL")
+    full_snapshot_url = CONFIG.environ.get("FULL_SNAPSHOT_URL")
     if (
         rolling_tarball_url
         or full_tarball_url
@@ -588,16 +1177,17 @@ def create_node_snapshot_config_json(history_mode):
                 print(f"Error: history mode {history_mode} is not known.")
                 sys.exit(1)
 
-    if "images" in MY_POD_CLASS and "octez" in MY_POD_CLASS["images"]:
-        octez_container_version = MY_POD_CLASS["images"]["octez"]
+    my_pod_class = CONFIG.my_pod_class
+    if "images" in my_pod_class and "octez" in my_pod_class["images"]:
+        octez_container_version = my_pod_class["images"]["octez"]
     else:
-        octez_container_version = os.environ.get("OCTEZ_VERSION")
-    snapshot_source = os.environ.get("SNAPSHOT_SOURCE")
+        octez_container_version = CONFIG.environ.get("OCTEZ_VERSION")
+    snapshot_source = CONFIG.environ.get("SNAPSHOT_SOURCE")
     if snapshot_source:
         try:
-            response = requests.get(snapshot_source)
-            response.raise_for_status()  # Raises an HTTPError if the HTTP request returned an unsuccessful status code
-            all_snapshots = response.json()
+            snapshot_index = fetch_snapshot_index(
+                snapshot_source, CONFIG.snapshot_metadata_cache_dir
+            )
         except (
             requests.exceptions.RequestException,
             requests.exceptions.JSONDecodeError,
@@ -622,26 +1212,113 @@ and chain name {network_name}
 and octez version {octez_version}.
     """
     )
-    # find snapshot matching all the requested fields
-    matching_snapshots = [
-        s
-        for s in all_snapshots.get("data", [])
-        if s.get("history_mode") == history_mode
-        and s.get("artifact_type") == artifact_type
-        and s.get("chain_name") == network_name
-    ]
-    if octez_version:
-        version_matching_snapshots = [
-            s
-            for s in matching_snapshots
-            if int(octez_version) == s.get("tezos_version").get("version").get("major")
-        ]
-        if len(version_matching_snapshots):
-            # If we can't find snapshots of the right octez version, we just pick the most recent available.
-            matching_snapshots = version_matching_snapshots
-    matching_snapshots = sorted(matching_snapshots, key=lambda s: s.get("block_height"))
+    return snapshot_index.lookup(
+        network_name, history_mode, artifact_type, octez_version
+    )
 
-    return matching_snapshots[-1] if len(matching_snapshots) else None
+
+class SnapshotIndex:
+    """
+    The latest snapshot of a snapshot metadata document for each chain name,
+    history mode, artifact type and octez major version. The major version
+    None stands for the latest snapshot of any version.
+    """
+
+    # Bump when the layout of the index changes, to invalidate cached indexes.
+    VERSION = 1
+
+    def __init__(self, latest):
+        self.latest = latest
+
+    @classmethod
+    def from_metadata(cls, all_snapshots):
+        latest = {}
+        for snapshot in all_snapshots.get("data", []):
+            try:
+                major = snapshot["tezos_version"]["version"]["major"]
+            except (KeyError, TypeError):
+                major = None
+            fields = (
+                snapshot.get("chain_name"),
+                snapshot.get("history_mode"),
+                snapshot.get("artifact_type"),
+            )
+            block_height = snapshot.get("block_height")
+            for key in (fields + (None,), fields + (major,)):
+                # On equal heights, the last snapshot of the document wins.
+                if key not in latest or block_height >= latest[key]["block_height"]:
+                    latest[key] = snapshot
+        return cls(latest)
+
+    @classmethod
+    def from_json(cls, entries):
+        return cls({tuple(key): snapshot for key, snapshot in entries})
+
+    def to_json(self):
+        return [[list(key), snapshot] for key, snapshot in self.latest.items()]
+
+    def lookup(self, chain_name, history_mode, artifact_type, octez_version=None):
+        """
+        Return the latest snapshot of octez_version's major version, or the
+        latest snapshot of any version if there is none of that version.
+        """
+        fields = (chain_name, history_mode, artifact_type)
+        if octez_version:
+            snapshot = self.latest.get(fields + (int(octez_version),))
+            if snapshot:
+                return snapshot
+        return self.latest.get(fields + (None,))
+
+
+def fetch_snapshot_index(url, cache_dir):
+    """
+    Return the SnapshotIndex of the snapshot metadata document at url. The
+    index of the document is cached with its validators, and the document is
+    only downloaded again when the server reports that it changed, or when
+    the cached index is unusable.
+    """
+    os.makedirs(cache_dir, exist_ok=True)
+    cache_path = f"{cache_dir}/{hashlib.sha256(url.encode()).hexdigest()}"
+    try:
+        with open(f"{cache_path}.meta.json", "r") as f:
+            cache_meta = json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        cache_meta = {}
+
+    headers = {}
+    if cache_meta.get("index_version") == SnapshotIndex.VERSION:
+        if cache_meta.get("etag"):
+            headers["If-None-Match"] = cache_meta["etag"]
+        if cache_meta.get("last_modified"):
+            headers["If-Modified-Since"] = cache_meta["last_modified"]
+
+    with http_session() as session:
+        response = session.get(url, headers=headers, timeout=HTTP_TIMEOUT)
+        response.raise_for_status()
+        if response.status_code == 304:
+            try:
+                with open(f"{cache_path}.index.json", "r") as f:
+                    snapshot_index = SnapshotIndex.from_json(json.load(f))
+                print(f"Snapshot metadata from {url} is unchanged, using cached index")
+                return snapshot_index
+            except (FileNotFoundError, ValueError, TypeError) as e:
+                print(f"Cached snapshot index is unusable ({e!r}), downloading again")
+            response = session.get(url, timeout=HTTP_TIMEOUT)
+            response.raise_for_status()
+
+    snapshot_index = SnapshotIndex.from_metadata(response.json())
+    write_json_atomically(f"{cache_path}.index.json", snapshot_index.to_json())
+    # Written last, so that validators are only sent for a complete cache
+    write_json_atomically(
+        f"{cache_path}.meta.json",
+        {
+            "url": url,
+            "etag": response.headers.get("ETag"),
+            "last_modified": response.headers.get("Last-Modified"),
+            "index_version": SnapshotIndex.VERSION,
+        },
+    )
+    return snapshot_index
 
 
 if __name__ == "__main__":
@@ -0,0 +1,483 @@
+#! /usr/bin/env python
+"""
+Download a snapshot artifact over several HTTP connections.
+
+The artifact is split into chunks of DOWNLOAD_CHUNK_SIZE bytes, fetched with
+Range requests by DOWNLOAD_CONNECTIONS workers and written in place into a
+file preallocated to the artifact's size. Meanwhile, the sha256 of the file
+is computed over the chunks in order as soon as they are written, so it is
+ready when the last chunk lands. The chunks written ahead of it are kept in
+memory, up to DOWNLOAD_HASH_BUFFER bytes, so that they aren't read back from
+disk. Servers that don't support Range requests are downloaded over a single
+stream.
+
+The sha256 of every chunk written is appended to a checkpoint log,
+OUTPUT.progress, once the chunk is flushed to disk. When the download is
+interrupted, e.g. the container is killed, the next one resumes from the
+checkpoint as long as the artifact didn't change: the chunks already on disk
+are checked against their recorded sha256 as they are read back, those that
+don't match are downloaded again, and so are the chunks missing. The sha256
+of the file is still computed over the whole artifact.
+
+    downloader.py [--sha256 HEX] URL OUTPUT
+"""
+
+import argparse
+import collections
+import hashlib
+import json
+import os
+import queue
+import random
+import re
+import sys
+import threading
+import time
+
+import requests
+
+DOWNLOAD_CONNECTIONS = int(os.environ.get("DOWNLOAD_CONNECTIONS", "8"))
+DOWNLOAD_CHUNK_SIZE = int(os.environ.get("DOWNLOAD_CHUNK_SIZE", str(8 << 20)))
+# Chunks downloaded ahead of the sha256 of the file are kept in memory up to
+# this many bytes, to be hashed without being read back from disk
+DOWNLOAD_HASH_BUFFER = int(os.environ.get("DOWNLOAD_HASH_BUFFER", str(128 << 20)))
+READ_SIZE = 1 << 20
+# Data of a response that breaks is kept up to the last block of this size
+STREAM_READ_SIZE = 1 << 16
+# Connect and read timeouts of every request
+TIMEOUT = (10, 60)
+# Attempts at each chunk before giving up on the download
+CHUNK_ATTEMPTS = 5
+PROGRESS_INTERVAL = 10
+
+CONTENT_RANGE_PATTERN = re.compile(r"bytes (\d+)-(\d+)/(\d+)")
+CHECKPOINT_LINE_PATTERN = re.compile(r"(\d+) ([0-9a-f]{64}|-)\n")
+
+
+class ChecksumError(Exception):
+    """Raised when a download doesn't match its expected sha256."""
+
+
+def probe(session, url):
+    """
+    Return the URL to download from once redirects are followed, the size of
+    the artifact, or None if the server can't serve ranges of it, and the
+    validator of this version of the artifact, its ETag or Last-Modified.
+    """
+    with session.get(
+        url, headers={"Range": "bytes=0-0"}, stream=True, timeout=TIMEOUT
+    ) as r:
+        if r.status_code == 416:
+            # Empty artifact
+            return r.url, None, None
+        r.raise_for_status()
+        validator = r.headers.get("ETag") or r.headers.get("Last-Modified")
+        match = CONTENT_RANGE_PATTERN.fullmatch(r.headers.get("Content-Range", ""))
+        if r.status_code != 206 or not match:
+            return r.url, None, validator
+        return r.url, int(match.group(3)), validator
+
+
+def preallocate(fd, size):
+    try:
+        os.posix_fallocate(fd, 0, size)
+    except (AttributeError, OSError):
+        # Not supported by the filesystem, at least set the file's size
+        os.ftruncate(fd, size)
+
+
+def format_rate(byte_count, elapsed):
+    return f"{byte_count / (1 << 20) / max(elapsed, 1e-9):.1f} MiB/s"
+
+
+class Checkpoint:
+    """
+    The sha256 of the chunks of a download that are on disk, in a log file.
+    Its first line is the JSON of what identifies the download: the URL, size
+    and validator of the artifact and the size of the chunks. Each of the
+    next lines records a chunk, "INDEX SHA256", or that it is no longer on
+    disk, "INDEX -". Lines are appended and fsynced one at a time, so a chunk
+    costs one short write whatever the size of the artifact. The log is
+    compacted when the download starts.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.file = None
+
+    def load(self, identity):
+        """
+        Start recording the chunks of the download identified by identity.
+        Return the chunks already recorded for it, or None when the
+        checkpoint is of another download, or there is none.
+        """
+        chunks = None
+        try:
+            with open(self.path) as f:
+                if json.loads(f.readline()) == identity:
+                    chunks = {}
+                    for line in f:
+                        match = CHECKPOINT_LINE_PATTERN.fullmatch(line)
+                        if match is None:
+                            # Cut short by a crash, nothing was recorded after
+                            break
+                        if match[2] == "-":
+                            chunks.pop(int(match[1]), None)
+                        else:
+                            chunks[int(match[1])] = match[2]
+        except (OSError, ValueError):
+            pass
+        self.start(identity, chunks or {})
+        return chunks
+
+    def start(self, identity, chunks):
+        """Rewrite the log with identity and chunks, then append to it"""
+        self.close()
+        # Written to a temporary file renamed over the checkpoint, so that a
+        # crash never leaves a truncated checkpoint behind
+        tmp = f"{self.path}.tmp"
+        with open(tmp, "w") as f:
+            f.write(json.dumps(identity) + "\n")
+            for index, sha256 in sorted(chunks.items()):
+                f.write(f"{index} {sha256}\n")
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.path)
+        self.file = open(self.path, "a")
+
+    def append(self, line):
+        with self.lock:
+            self.file.write(f"{line}\n")
+            self.file.flush()
+            os.fsync(self.file.fileno())
+
+    def record(self, index, sha256):
+        self.append(f"{index} {sha256}")
+
+    def forget(self, index):
+        self.append(f"{index} -")
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+    def remove(self):
+        self.close()
+        for path in (self.path, f"{self.path}.tmp"):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+
+class RangedDownload:
+    """
+    Download url into path with `connections` concurrent Range requests of
+    chunk_size bytes, resuming from the checkpoint at checkpoint_path,
+    path.progress by default. run() returns the sha256 of the artifact.
+    Chunks are kept in memory from their download until they are hashed, up
+    to hash_buffer_size bytes, beyond which they are read back from disk.
+    """
+
+    def __init__(
+        self,
+        url,
+        path,
+        connections=DOWNLOAD_CONNECTIONS,
+        chunk_size=DOWNLOAD_CHUNK_SIZE,
+        progress_interval=PROGRESS_INTERVAL,
+        checkpoint_path=None,
+        hash_buffer_size=DOWNLOAD_HASH_BUFFER,
+    ):
+        self.url = url
+        self.path = path
+        self.connections = connections
+        self.chunk_size = chunk_size
+        self.progress_interval = progress_interval
+        self.hash_buffer_size = hash_buffer_size
+        self.checkpoint = Checkpoint(checkpoint_path or f"{path}.progress")
+        self.size = None
+        self.condition = threading.Condition()
+        self.done = []
+        # sha256 of the chunks written
+        self.chunk_hashes = {}
+        # Data of the chunks written, not hashed yet, and its size
+        self.chunk_data = {}
+        self.buffered = 0
+        self.error = None
+        self.stopping = threading.Event()
+        self.downloaded = 0
+        # Chunks resumed from the checkpoint
+        self.resumed = set()
+        self.started_at = None
+
+    def chunk_range(self, index):
+        start = index * self.chunk_size
+        return start, min(start + self.chunk_size, self.size) - 1
+
+    def run(self):
+        self.started_at = time.monotonic()
+        session = requests.Session()
+        url, self.size, validator = probe(session, self.url)
+        if self.size is None:
+            print(f"{self.url} doesn't support range requests, downloading it at once")
+            self.checkpoint.remove()
+            sha256 = self.stream(session, url)
+        else:
+            sha256 = self.download_chunks(
+                url,
+                {
+                    "url": self.url,
+                    "size": self.size,
+                    "chunk_size": self.chunk_size,
+                    "validator": validator,
+                },
+            )
+        elapsed = time.monotonic() - self.started_at
+        print(
+            f"Downloaded {self.downloaded} bytes in {elapsed:.1f}s, "
+            + f"{format_rate(self.downloaded, elapsed)}"
+        )
+        return sha256
+
+    def stream(self, session, url):
+        """Download url in one request, for servers without range support"""
+        sha256 = hashlib.sha256()
+        with session.get(url, stream=True, timeout=TIMEOUT) as r, open(
+            self.path, "wb"
+        ) as f:
+            r.raise_for_status()
+            for data in r.iter_content(READ_SIZE):
+                f.write(data)
+                sha256.update(data)
+                self.downloaded += len(data)
+        return sha256.hexdigest()
+
+    def chunk_length(self, index):
+        start, end = self.chunk_range(index)
+        return end + 1 - start
+
+    def download_chunks(self, url, identity):
+        chunk_count = -(-self.size // self.chunk_size)
+        resumed = None
+        if os.path.isfile(self.path) and os.path.getsize(self.path) == self.size:
+            resumed = self.checkpoint.load(identity)
+        if resumed:
+            print(
+                f"Resuming the download of {self.url}, {len(resumed)} of "
+                + f"{chunk_count} chunks are already on disk"
+            )
+        else:
+            resumed = {}
+            self.checkpoint.start(identity, resumed)
+        self.chunk_hashes = resumed
+        self.resumed = set(resumed)
+        self.done = [index in resumed for index in range(chunk_count)]
+        chunks = queue.Queue()
+        for index in range(chunk_count):
+            if not self.done[index]:
+                chunks.put(index)
+        flags = os.O_RDWR | os.O_CREAT | (0 if resumed else os.O_TRUNC)
+        fd = os.open(self.path, flags, 0o644)
+        try:
+            preallocate(fd, self.size)
+            workers = [
+                threading.Thread(
+                    target=self.worker, args=(url, fd, chunks), daemon=True
+                )
+                for _ in range(min(self.connections, chunk_count))
+            ]
+            for worker in workers:
+                worker.start()
+            try:
+                return self.hash_chunks(fd, chunks)
+            finally:
+                self.stopping.set()
+                for _ in workers:
+                    chunks.put(None)
+                for worker in workers:
+                    worker.join()
+        finally:
+            os.close(fd)
+            self.checkpoint.close()
+
+    def worker(self, url, fd, chunks):
+        # Workers wait for chunks until the download stops, rather than
+        # leaving once the queue is empty, as chunks found corrupted on disk
+        # are queued again.
+        session = requests.Session()
+        while not self.stopping.is_set():
+            index = chunks.get()
+            if index is None:
+                return
+            try:
+                sha256, data = self.download_chunk(session, url, fd, index)
+                # The chunk must be on disk before it is in the checkpoint
+                os.fdatasync(fd)
+                self.checkpoint.record(index, sha256)
+            except Exception as e:
+                with self.condition:
+                    self.error = self.error or e
+                    self.condition.notify_all()
+                return
+            with self.condition:
+                self.chunk_hashes[index] = sha256
+                if self.buffered + len(data) <= self.hash_buffer_size:
+                    self.chunk_data[index] = data
+                    self.buffered += len(data)
+                self.done[index] = True
+                self.condition.notify_all()
+
+    def download_chunk(self, session, url, fd, index):
+        """Write chunk index into fd, return its sha256 and its data"""
+        start, end = self.chunk_range(index)
+        offset = start
+        # Kept across attempts, which go on from where the previous one broke
+        sha256 = hashlib.sha256()
+        chunk = bytearray()
+        for attempt in range(1, CHUNK_ATTEMPTS + 1):
+            try:
+                with session.get(
+                    url,
+                    headers={"Range": f"bytes={offset}-{end}"},
+                    stream=True,
+                    timeout=TIMEOUT,
+                ) as r:
+                    r.raise_for_status()
+                    match = CONTENT_RANGE_PATTERN.fullmatch(
+                        r.headers.get("Content-Range", "")
+                    )
+                    if r.status_code != 206 or not match or int(match[1]) != offset:
+                        raise Exception(
+                            "ERROR: Unexpected answer to the range request of "
+                            + f"bytes {offset}-{end}: {r.status_code} "
+                            + f"{r.headers.get('Content-Range')}"
+                        )
+                    for data in r.iter_content(STREAM_READ_SIZE):
+                        if self.stopping.is_set():
+                            raise Exception("ERROR: Download stopped")
+                        data = data[: end + 1 - offset]
+                        os.pwrite(fd, data, offset)
+                        sha256.update(data)
+                        chunk += data
+                        offset += len(data)
+                        with self.condition:
+                            self.downloaded += len(data)
+                if offset > end:
+                    return sha256.hexdigest(), chunk
+                raise requests.ConnectionError(f"Chunk {index} ended early")
+            except requests.RequestException as e:
+                if attempt == CHUNK_ATTEMPTS or self.stopping.is_set():
+                    raise
+                print(f"Chunk {index} failed at byte {offset}, retrying: {e!r}")
+                time.sleep(min(0.5 * 2**attempt, 30) * random.uniform(0.5, 1))
+
+    def wait_for_chunk(self, index):
+        """Wait until chunk index is written, logging the progress meanwhile"""
+        with self.condition:
+            while not self.done[index]:
+                if self.error is not None:
+                    raise self.error
+                if not self.condition.wait(self.progress_interval):
+                    self.log_progress()
+
+    def log_progress(self):
+        elapsed = time.monotonic() - self.started_at
+        on_disk = self.downloaded + sum(map(self.chunk_length, self.resumed))
+        print(
+            f"Downloaded {on_disk} of {self.size} bytes "
+            + f"({100 * on_disk / max(self.size, 1):.1f}%), "
+            + f"{format_rate(self.downloaded, elapsed)}"
+        )
+
+    def hash_chunks(self, fd, chunks):
+        """
+        Return the sha256 of the file, hashing its chunks in order as they
+        are written. The chunks still in memory are hashed as downloaded. The
+        others, resumed from the checkpoint or beyond the hash buffer, are
+        read back from disk: one that doesn't match the sha256 it was
+        downloaded with is queued to be downloaded again.
+        """
+        sha256 = hashlib.sha256()
+        corruptions = collections.Counter()
+        index = 0
+        while index < len(self.done):
+            self.wait_for_chunk(index)
+            with self.condition:
+                data = self.chunk_data.pop(index, None)
+                if data is not None:
+                    self.buffered -= len(data)
+            if data is not None:
+                sha256.update(data)
+                index += 1
+                continue
+            chunk_sha256 = hashlib.sha256()
+            # The chunk only goes into the sha256 of the file once it is good
+            file_sha256 = sha256.copy()
+            start, end = self.chunk_range(index)
+            offset = start
+            while offset <= end:
+                data = os.pread(fd, min(READ_SIZE, end + 1 - offset), offset)
+                chunk_sha256.update(data)
+                file_sha256.update(data)
+                offset += len(data)
+            if chunk_sha256.hexdigest() == self.chunk_hashes[index]:
+                sha256 = file_sha256
+                index += 1
+                continue
+            corruptions[index] += 1
+            if corruptions[index] >= CHUNK_ATTEMPTS:
+                raise Exception(f"ERROR: Chunk {index} keeps being corrupted on disk")
+            print(f"Chunk {index} doesn't match its sha256, downloading it again")
+            with self.condition:
+                self.resumed.discard(index)
+                self.done[index] = False
+                del self.chunk_hashes[index]
+                self.checkpoint.forget(index)
+            chunks.put(index)
+        return sha256.hexdigest()
+
+
+def download(url, path, sha256=None, **kwargs):
+    """
+    Download url into path and check its sha256, if given. When the download
+    fails, its checkpoint is kept for the next attempt to resume it.
+    """
+    ranged_download = RangedDownload(url, path, **kwargs)
+    actual = ranged_download.run()
+    # Complete, there is nothing to resume anymore, even if the sha256 is wrong
+    ranged_download.checkpoint.remove()
+    if sha256 and actual != sha256:
+        raise ChecksumError(
+            f"ERROR: sha256 checksum of the downloaded file is {actual}, "
+            + f"the metadata says {sha256}."
+        )
+    print(f"sha256 of {path} is {actual}")
+    return actual
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("url")
+    parser.add_argument("output")
+    parser.add_argument("--sha256", help="expected sha256 of the artifact")
+    parser.add_argument("--connections", type=int, default=DOWNLOAD_CONNECTIONS)
+    parser.add_argument("--chunk-size", type=int, default=DOWNLOAD_CHUNK_SIZE)
+    args = parser.parse_args()
+    try:
+        download(
+            args.url,
+            args.output,
+            args.sha256,
+            connections=args.connections,
+            chunk_size=args.chunk_size,
+        )
+    except ChecksumError as e:
+        print(e, file=sys.stderr)
+        sys.exit(2)
+
+
+if __name__ == "__main__":
+    main()
@@ -5,10 +5,11 @@ shift
 
 case "$CMD" in
 	config-generator)	exec /config-generator.sh	"$@"	;;
-	logger)			exec /logger.sh			"$@"	;;
+	logger)			exec /logger.py			"$@"	;;
 	sidecar)		exec /sidecar.py		"$@"	;;
 	snapshot-downloader)	exec /snapshot-downloader.sh	"$@"	;;
-	wait-for-dns)		exec /wait-for-dns.sh		"$@"	;;
+	snapshot-server)	exec /snapshot-server.py	"$@"	;;
+	wait-for-dns)		exec /wait-for-dns.py		"$@"	;;
 esac
 
 #
@@ -22,6 +23,7 @@ echo "	config-generator"
 echo "	logger"
 echo "	sidecar"
 echo "	snapshot-downloader"
+echo "	snapshot-server"
 echo "	wait-for-dns"
 
 exit 1
@@ -0,0 +1,324 @@
+"""
+Shared runtime of the small HTTP services running next to tezos-k8s pods:
+the node sidecar and the signer and pyrometer exporters.
+
+A Service is an aiohttp application that bundles:
+
+* a keep-alive connection pool, `session`, for the requests the service makes
+  to what it watches (the node, the signer),
+* a Registry of Prometheus metrics, served on /metrics,
+* background tasks, either long running or repeated at a fixed interval,
+* a graceful shutdown on SIGTERM and SIGINT: the listener is closed, in
+  flight requests are given SHUTDOWN_TIMEOUT seconds to complete, then the
+  background tasks are cancelled and the connection pool is closed.
+"""
+
+import asyncio
+import logging
+import math
+import signal
+import threading
+import time
+
+import aiohttp
+from aiohttp import web
+
+PORT = 31732
+SHUTDOWN_TIMEOUT = 5
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 0.75, 0.9, 1, 2.5)
+EXPOSITION_CONTENT_TYPE = "text/plain; version=0.0.4"
+
+log = logging.getLogger("exporter_runtime")
+
+
+#
+# Prometheus metrics, in the text exposition format. Metrics may be updated
+# from other threads than the event loop's, e.g. by octez_monitor's streams.
+
+
+def format_value(value):
+    if isinstance(value, float):
+        if math.isinf(value):
+            return "+Inf" if value > 0 else "-Inf"
+        if value.is_integer():
+            return str(int(value))
+    return str(value)
+
+
+def format_labels(names, values):
+    if not names:
+        return ""
+    pairs = []
+    for name, value in zip(names, values):
+        value = str(value).replace("\\", "\\\\").replace('"', '\\"')
+        value = value.replace("\n", "\\n")
+        pairs.append(f'{name}="{value}"')
+    return "{" + ",".join(pairs) + "}"
+
+
+class Metric:
+    """
+    A metric, with a sample for each combination of values of its labels.
+
+    The samples of a metric built with `collect` are computed by calling it
+    at every scrape. It returns either the value of an unlabeled metric, or
+    a dict of label values tuples to values. None omits the metric.
+    """
+
+    type = None
+
+    def __init__(self, name, help, labels=(), collect=None):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.collect = collect
+        self.lock = threading.Lock()
+        self.values = {}
+
+    def samples(self):
+        if self.collect is None:
+            with self.lock:
+                return list(self.values.items())
+        collected = self.collect()
+        if collected is None:
+            return []
+        if not isinstance(collected, dict):
+            return [((), collected)]
+        return list(collected.items())
+
+    def exposition(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.type}"]
+        for label_values, value in sorted(self.samples()):
+            labels = format_labels(self.labels, label_values)
+            lines.append(f"{self.name}{labels} {format_value(value)}")
+        return lines
+
+
+class Counter(Metric):
+    type = "counter"
+
+    def inc(self, *label_values, amount=1):
+        with self.lock:
+            self.values[label_values] = self.values.get(label_values, 0) + amount
+
+
+class Gauge(Metric):
+    type = "gauge"
+
+    def set(self, value, *label_values):
+        with self.lock:
+            self.values[label_values] = value
+
+
+class Histogram(Metric):
+    type = "histogram"
+
+    def __init__(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = buckets
+
+    def observe(self, value, *label_values):
+        with self.lock:
+            counts, _, _ = series = self.values.setdefault(
+                label_values, [[0] * len(self.buckets), 0, 0]
+            )
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+            series[1] += value
+            series[2] += 1
+
+    def time(self, *label_values):
+        """A context manager observing the time spent in its block"""
+        return Timer(self, label_values)
+
+    def exposition(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self.lock:
+            series = sorted(
+                (k, (list(c), s, n)) for k, (c, s, n) in self.values.items()
+            )
+        for label_values, (counts, total, count) in series:
+            for bound, bucket_count in zip(
+                self.buckets + (math.inf,), counts + [count]
+            ):
+                labels = format_labels(
+                    self.labels + ("le",), label_values + (format_value(float(bound)),)
+                )
+                lines.append(f"{self.name}_bucket{labels} {bucket_count}")
+            labels = format_labels(self.labels, label_values)
+            lines.append(f"{self.name}_sum{labels} {format_value(total)}")
+            lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+
+class Timer:
+    def __init__(self, histogram, label_values):
+        self.histogram = histogram
+        self.label_values = label_values
+
+    def __enter__(self):
+        self.start = time.monotonic()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.histogram.observe(time.monotonic() - self.start, *self.label_values)
+
+
+class Registry:
+    """
+    The metrics of a service. Collectors are functions returning exposition
+    lines, e.g. metrics relayed from elsewhere, appended after the metrics.
+    """
+
+    def __init__(self):
+        self.metrics = {}
+        self.collectors = []
+
+    def register(self, metric):
+        if metric.name in self.metrics:
+            raise Exception(f"ERROR: Metric {metric.name} is already registered")
+        self.metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name, help, labels=(), collect=None):
+        return self.register(Counter(name, help, labels, collect))
+
+    def gauge(self, name, help, labels=(), collect=None):
+        return self.register(Gauge(name, help, labels, collect))
+
+    def histogram(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        return self.register(Histogram(name, help, labels, buckets))
+
+    def add_collector(self, collector):
+        self.collectors.append(collector)
+
+    def exposition(self):
+        lines = []
+        for metric in self.metrics.values():
+            lines += metric.exposition()
+        for collector in self.collectors:
+            lines += collector()
+        return "\n".join(lines) + "\n"
+
+
+#
+# Services
+
+
+class Service:
+    """
+    An HTTP service listening on host:port. Handlers are added with the
+    route() decorator, background tasks with background() and every().
+    """
+
+    def __init__(
+        self,
+        host="0.0.0.0",
+        port=PORT,
+        connection_limit=16,
+        keepalive_timeout=30,
+        shutdown_timeout=SHUTDOWN_TIMEOUT,
+    ):
+        self.host = host
+        self.port = port
+        self.connection_limit = connection_limit
+        self.keepalive_timeout = keepalive_timeout
+        self.shutdown_timeout = shutdown_timeout
+        self.registry = Registry()
+        self.app = web.Application()
+        self.app.router.add_get("/metrics", self.metrics)
+        self.app.on_startup.append(self.on_startup)
+        self.app.on_cleanup.append(self.on_cleanup)
+        self.task_factories = []
+        self.tasks = []
+        self.session = None
+        self.runner = None
+
+    def route(self, method, path):
+        def decorator(handler):
+            self.app.router.add_route(method, path, handler)
+            return handler
+
+        return decorator
+
+    def background(self, coroutine_function):
+        """Run coroutine_function() while the service runs"""
+        self.task_factories.append(coroutine_function)
+        return coroutine_function
+
+    def every(self, interval, coroutine_function):
+        """
+        Run coroutine_function() every interval seconds while the service
+        runs, starting right away. Exceptions are logged, they don't stop
+        the next runs.
+        """
+
+        async def repeat():
+            while True:
+                start = time.monotonic()
+                try:
+                    await coroutine_function()
+                except asyncio.CancelledError:
+                    raise
+                except Exception:
+                    log.exception(f"{coroutine_function.__name__} failed")
+                await asyncio.sleep(max(0, interval - (time.monotonic() - start)))
+
+        repeat.__name__ = coroutine_function.__name__
+        return self.background(repeat)
+
+    async def metrics(self, request):
+        return web.Response(
+            body=self.registry.exposition().encode(),
+            headers={"Content-Type": EXPOSITION_CONTENT_TYPE},
+        )
+
+    async def on_startup(self, app):
+        self.session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(
+                limit=self.connection_limit, keepalive_timeout=self.keepalive_timeout
+            )
+        )
+        self.tasks = [
+            asyncio.create_task(factory(), name=factory.__name__)
+            for factory in self.task_factories
+        ]
+
+    async def on_cleanup(self, app):
+        for task in self.tasks:
+            task.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+        self.tasks = []
+        await self.session.close()
+
+    async def start(self, host=None, port=None):
+        """Start serving, return the port listened on"""
+        self.runner = web.AppRunner(
+            self.app, access_log=None, shutdown_timeout=self.shutdown_timeout
+        )
+        await self.runner.setup()
+        site = web.TCPSite(
+            self.runner,
+            self.host if host is None else host,
+            self.port if port is None else port,
+        )
+        await site.start()
+        return self.runner.addresses[0][1]
+
+    async def stop(self):
+        await self.runner.cleanup()
+
+    async def serve(self):
+        await self.start()
+        stopping = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for signum in (signal.SIGTERM, signal.SIGINT):
+            loop.add_signal_handler(signum, stopping.set)
+        await stopping.wait()
+        log.info("Shutting down")
+        await self.stop()
+
+    def run(self):
+        logging.basicConfig(level=logging.INFO)
+        asyncio.run(self.serve())
@@ -0,0 +1,460 @@
+#! /usr/bin/env python
+"""
+Download, verify, decompress and extract an lz4 compressed tarball.
+
+The stages run concurrently, each in its own thread, connected by bounded
+buffers of PIPELINE_BUFFERS blocks, so that the slowest stage sets the pace
+and the others wait rather than pile up data in memory:
+
+    fetch -> verify -> decompress -> extract -> writers
+
+* fetch streams the artifact from its URL, or reads it from a file, e.g. a
+  tarball downloaded to the volume by downloader.py,
+* verify computes its sha256, and when the sha256 of each chunk of the
+  artifact is known, holds back every chunk until it is checked, so that the
+  extraction is aborted before anything of a corrupted chunk is written.
+  Otherwise, the sha256 of the artifact is only checked once it is all
+  extracted, the caller has to delete the data on a ChecksumError,
+* decompress decompresses the lz4 frames, checking their checksums,
+* extract reads the tar stream and writes the large files, leaving the small
+  ones, most of the context and store directories, to a pool of
+  EXTRACT_WRITERS threads.
+
+Every stage counts the bytes it handled, the time it waited for input and the
+time it waited for room downstream, logged every PROGRESS_INTERVAL seconds.
+The stage that waits the least is the bottleneck. The writers only count the
+bytes they write, the time the extraction waits for a free writer is counted
+as its own wait for room downstream.
+
+    extractor.py [--sha256 HEX] [--chunk-sha256 FILE] URL|TARBALL DIRECTORY
+
+FILE is a JSON object with the size of the chunks, "chunk_size", and the list
+of their sha256, "sha256".
+"""
+
+import argparse
+import concurrent.futures
+import hashlib
+import json
+import os
+import queue
+import sys
+import tarfile
+import threading
+import time
+
+import lz4.frame
+import requests
+
+from downloader import TIMEOUT, ChecksumError, format_rate
+
+PIPELINE_BUFFERS = int(os.environ.get("PIPELINE_BUFFERS", "16"))
+EXTRACT_WRITERS = int(os.environ.get("EXTRACT_WRITERS", "8"))
+# Files up to this size are written by the writers
+SMALL_FILE_SIZE = 1 << 20
+BLOCK_SIZE = 1 << 20
+PROGRESS_INTERVAL = 10
+# How often blocked stages check whether the pipeline is aborted
+POLL_INTERVAL = 0.1
+
+
+class Aborted(Exception):
+    """Raised in the stages of a pipeline aborted by another stage."""
+
+
+class StageStats:
+    def __init__(self, name):
+        self.name = name
+        self.bytes = 0
+        # Seconds spent waiting for input, and for room downstream
+        self.starved = 0.0
+        self.blocked = 0.0
+        self.lock = threading.Lock()
+
+    def add_bytes(self, count):
+        # For stages running in several threads
+        with self.lock:
+            self.bytes += count
+
+    def format(self, elapsed):
+        return (
+            f"{self.name}: {self.bytes} bytes, {format_rate(self.bytes, elapsed)}, "
+            + f"waited {self.starved:.1f}s for input and "
+            + f"{self.blocked:.1f}s for room downstream"
+        )
+
+
+class Buffer:
+    """A bounded buffer of blocks between two stages. None ends the stream."""
+
+    def __init__(self, aborted, size=PIPELINE_BUFFERS):
+        self.aborted = aborted
+        self.queue = queue.Queue(size)
+
+    def put(self, block, stats):
+        start = time.monotonic()
+        try:
+            while True:
+                if self.aborted.is_set():
+                    raise Aborted()
+                try:
+                    return self.queue.put(block, timeout=POLL_INTERVAL)
+                except queue.Full:
+                    pass
+        finally:
+            stats.blocked += time.monotonic() - start
+
+    def get(self, stats):
+        start = time.monotonic()
+        try:
+            while True:
+                if self.aborted.is_set():
+                    raise Aborted()
+                try:
+                    return self.queue.get(timeout=POLL_INTERVAL)
+                except queue.Empty:
+                    pass
+        finally:
+            stats.starved += time.monotonic() - start
+
+
+class BufferReader:
+    """A file object reading the blocks of a buffer, for tarfile"""
+
+    def __init__(self, buffer, stats):
+        self.buffer = buffer
+        self.stats = stats
+        self.block = b""
+        self.offset = 0
+        self.eof = False
+
+    def read(self, size=-1):
+        parts = []
+        while size != 0 and not self.eof:
+            if self.offset == len(self.block):
+                block = self.buffer.get(self.stats)
+                if block is None:
+                    self.eof = True
+                    break
+                self.block, self.offset = block, 0
+                continue
+            end = len(self.block) if size < 0 else self.offset + size
+            part = self.block[self.offset : end]
+            self.offset += len(part)
+            self.stats.bytes += len(part)
+            if size > 0:
+                size -= len(part)
+            parts.append(part)
+        return b"".join(parts)
+
+
+def member_path(directory, member, safe_directories=None):
+    """
+    The path to extract member to, making sure it is inside directory, also
+    once the symbolic links extracted so far are followed. The directories
+    found to be inside directory are added to safe_directories, if given.
+    """
+    name = os.path.normpath(member.name)
+    if os.path.isabs(name) or name == ".." or name.startswith("../"):
+        raise Exception(f"ERROR: Refusing to extract {member.name} out of {directory}")
+    path = os.path.join(directory, name)
+    parent = os.path.dirname(path)
+    if safe_directories is None or parent not in safe_directories:
+        root = os.path.realpath(directory)
+        if os.path.commonpath([root, os.path.realpath(parent)]) != root:
+            raise Exception(
+                f"ERROR: Refusing to extract {member.name} out of {directory}"
+            )
+        if safe_directories is not None:
+            safe_directories.add(parent)
+    return path
+
+
+class Pipeline:
+    """
+    Extract the lz4 compressed tarball at url into directory. run() returns
+    the sha256 of the tarball, raising ChecksumError when it, or the sha256
+    of one of its chunks, doesn't match the expected one.
+    """
+
+    def __init__(
+        self,
+        url,
+        directory,
+        sha256=None,
+        chunk_size=None,
+        chunk_sha256=None,
+        writers=EXTRACT_WRITERS,
+        buffers=PIPELINE_BUFFERS,
+        progress_interval=PROGRESS_INTERVAL,
+    ):
+        self.url = url
+        self.directory = directory
+        self.sha256 = sha256
+        self.chunk_size = chunk_size
+        self.chunk_sha256 = chunk_sha256
+        self.writers = writers
+        self.progress_interval = progress_interval
+        self.aborted = threading.Event()
+        self.error = None
+        self.fetched = Buffer(self.aborted, buffers)
+        self.verified = Buffer(self.aborted, buffers)
+        self.decompressed = Buffer(self.aborted, buffers)
+        self.stats = {
+            name: StageStats(name)
+            for name in ("fetch", "verify", "decompress", "extract", "writers")
+        }
+        self.artifact_sha256 = None
+        self.files = 0
+
+    def run(self):
+        stages = [
+            threading.Thread(target=self.run_stage, args=(stage,), daemon=True)
+            for stage in (self.fetch, self.verify, self.decompress, self.extract)
+        ]
+        start = time.monotonic()
+        for stage in stages:
+            stage.start()
+        for stage in stages:
+            while stage.is_alive():
+                stage.join(self.progress_interval)
+                if stage.is_alive():
+                    self.log_progress(time.monotonic() - start)
+        self.log_progress(time.monotonic() - start)
+        if self.error is not None:
+            raise self.error
+        print(f"Extracted {self.files} files from {self.url}")
+        return self.artifact_sha256
+
+    def run_stage(self, stage):
+        try:
+            stage()
+        except Aborted:
+            pass
+        except Exception as e:
+            if not self.aborted.is_set():
+                self.error = e
+                self.aborted.set()
+
+    def log_progress(self, elapsed):
+        for stats in self.stats.values():
+            if stats.name == "writers":
+                print(
+                    f"writers: {stats.bytes} bytes, "
+                    + f"{format_rate(stats.bytes, elapsed)}"
+                )
+            else:
+                print(stats.format(elapsed))
+
+    def fetch(self):
+        stats = self.stats["fetch"]
+        if "://" not in self.url:
+            with open(self.url, "rb") as f:
+                while block := f.read(BLOCK_SIZE):
+                    stats.bytes += len(block)
+                    self.fetched.put(block, stats)
+            self.fetched.put(None, stats)
+            return
+        with requests.get(self.url, stream=True, timeout=TIMEOUT) as r:
+            r.raise_for_status()
+            for block in r.iter_content(BLOCK_SIZE):
+                stats.bytes += len(block)
+                self.fetched.put(block, stats)
+        self.fetched.put(None, stats)
+
+    def verify(self):
+        stats = self.stats["verify"]
+        sha256 = hashlib.sha256()
+        # Blocks of the current chunk, held back until the chunk is checked
+        held = []
+        chunk = hashlib.sha256()
+        chunk_index = 0
+        chunk_offset = 0
+        while (block := self.fetched.get(stats)) is not None:
+            stats.bytes += len(block)
+            sha256.update(block)
+            if self.chunk_sha256 is None:
+                self.verified.put(block, stats)
+                continue
+            while block:
+                part = block[: self.chunk_size - chunk_offset]
+                block = block[len(part) :]
+                chunk.update(part)
+                held.append(part)
+                chunk_offset += len(part)
+                if chunk_offset == self.chunk_size:
+                    self.check_chunk(chunk_index, chunk)
+                    for part in held:
+                        self.verified.put(part, stats)
+                    held = []
+                    chunk = hashlib.sha256()
+                    chunk_index += 1
+                    chunk_offset = 0
+        if self.chunk_sha256 is not None:
+            if chunk_offset:
+                self.check_chunk(chunk_index, chunk)
+                chunk_index += 1
+            if chunk_index != len(self.chunk_sha256):
+                raise ChecksumError(
+                    f"ERROR: The tarball has {chunk_index} chunks, "
+                    + f"{len(self.chunk_sha256)} were expected."
+                )
+            for part in held:
+                self.verified.put(part, stats)
+        self.artifact_sha256 = sha256.hexdigest()
+        if self.sha256 and self.artifact_sha256 != self.sha256:
+            raise ChecksumError(
+                f"ERROR: sha256 checksum of the tarball is {self.artifact_sha256}, "
+                + f"the metadata says {self.sha256}."
+            )
+        self.verified.put(None, stats)
+
+    def check_chunk(self, index, chunk):
+        if index >= len(self.chunk_sha256) or (
+            chunk.hexdigest() != self.chunk_sha256[index]
+        ):
+            raise ChecksumError(
+                f"ERROR: sha256 checksum of chunk {index} of the tarball is "
+                + f"{chunk.hexdigest()}, which doesn't match, aborting."
+            )
+
+    def decompress(self):
+        stats = self.stats["decompress"]
+        decompressor = lz4.frame.LZ4FrameDecompressor()
+        in_frame = False
+        while (block := self.verified.get(stats)) is not None:
+            while block:
+                in_frame = True
+                data = decompressor.decompress(block)
+                stats.bytes += len(data)
+                if data:
+                    self.decompressed.put(data, stats)
+                block = b""
+                # The tarball may be made of several frames
+                if decompressor.eof:
+                    block = decompressor.unused_data or b""
+                    decompressor = lz4.frame.LZ4FrameDecompressor()
+                    in_frame = False
+        if in_frame:
+            raise Exception("ERROR: The tarball ends in the middle of an lz4 frame")
+        self.decompressed.put(None, stats)
+
+    def extract(self):
+        stats = self.stats["extract"]
+        reader = BufferReader(self.decompressed, stats)
+        directories = []
+        # Forgotten whenever a symbolic link is extracted
+        safe_directories = set()
+        with concurrent.futures.ThreadPoolExecutor(self.writers) as pool:
+            pending = set()
+            try:
+                with tarfile.open(fileobj=reader, mode="r|") as tar:
+                    for member in tar:
+                        path = member_path(self.directory, member, safe_directories)
+                        if os.path.islink(path) and not member.issym():
+                            # Replaced rather than followed
+                            os.remove(path)
+                        if member.isdir():
+                            os.makedirs(path, exist_ok=True)
+                            directories.append((path, member))
+                            continue
+                        os.makedirs(os.path.dirname(path), exist_ok=True)
+                        if member.isreg() and member.size <= SMALL_FILE_SIZE:
+                            data = tar.extractfile(member).read()
+                            if len(pending) >= 2 * self.writers:
+                                start = time.monotonic()
+                                done, pending = concurrent.futures.wait(
+                                    pending,
+                                    return_when=concurrent.futures.FIRST_COMPLETED,
+                                )
+                                stats.blocked += time.monotonic() - start
+                                for future in done:
+                                    future.result()
+                            pending.add(pool.submit(self.write, path, member, data))
+                        elif member.isreg():
+                            self.write_large_file(tar, path, member)
+                        elif member.issym():
+                            if os.path.lexists(path):
+                                os.remove(path)
+                            os.symlink(member.linkname, path)
+                            safe_directories.clear()
+                        elif member.islnk():
+                            # The target may still be waiting for a writer
+                            for future in concurrent.futures.as_completed(pending):
+                                future.result()
+                            pending = set()
+                            target = member_path(
+                                self.directory, tarfile.TarInfo(member.linkname)
+                            )
+                            if os.path.lexists(path):
+                                os.remove(path)
+                            os.link(target, path)
+                        else:
+                            print(f"Skipping {member.name}, of unsupported type")
+                            continue
+                        self.files += 1
+                # Read the padding after the end of the archive
+                while reader.read(BLOCK_SIZE):
+                    pass
+            finally:
+                for future in concurrent.futures.as_completed(pending):
+                    future.result()
+        # Set directories' times last, the files written into them change them
+        for path, member in reversed(directories):
+            os.chmod(path, member.mode)
+            os.utime(path, (member.mtime, member.mtime))
+
+    def write(self, path, member, data):
+        fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, member.mode)
+        try:
+            os.write(fd, data)
+        finally:
+            os.close(fd)
+        os.utime(path, (member.mtime, member.mtime))
+        self.stats["writers"].add_bytes(len(data))
+
+    def write_large_file(self, tar, path, member):
+        source = tar.extractfile(member)
+        fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, member.mode)
+        try:
+            while data := source.read(BLOCK_SIZE):
+                os.write(fd, data)
+        finally:
+            os.close(fd)
+        os.utime(path, (member.mtime, member.mtime))
+
+
+def extract(url, directory, sha256=None, chunk_sha256=None, **kwargs):
+    """
+    Extract the lz4 compressed tarball at url, or in a file, into directory,
+    checking its sha256, and the sha256 of its chunks, if given.
+    """
+    chunk_size = None
+    if chunk_sha256 is not None:
+        chunk_size = chunk_sha256["chunk_size"]
+        chunk_sha256 = chunk_sha256["sha256"]
+    return Pipeline(url, directory, sha256, chunk_size, chunk_sha256, **kwargs).run()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("url", help="URL or path of the tarball")
+    parser.add_argument("directory")
+    parser.add_argument("--sha256", help="expected sha256 of the tarball")
+    parser.add_argument(
+        "--chunk-sha256", help="JSON file of the expected sha256 of each chunk"
+    )
+    args = parser.parse_args()
+    chunk_sha256 = None
+    if args.chunk_sha256:
+        with open(args.chunk_sha256) as f:
+            chunk_sha256 = json.load(f)
+    try:
+        extract(args.url, args.directory, args.sha256, chunk_sha256)
+    except ChecksumError as e:
+        print(e, file=sys.stderr)
+        sys.exit(2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,275 @@
+#! /usr/bin/env python
+"""
+Follow the local Tezos node's heads and emit a single line of JSON each time
+a block is baked.  Each line will be of the form:
+    {
+        "logtype": "new-block-on-node",
+        "node": "private-node-0",
+        "level": 7896,
+        "priority": 0,
+        "hash": "BMYz...",
+        "last_hash": null,
+        "predecessor": "BLeH...",
+        "timestamp": "2021-06-21T20:35:39Z",
+        "reorg": false,
+        "operations": {
+            "endorsement_with_slot": 3
+            .
+            .
+            .
+        },
+        "num_endorsements": 3,
+        "possible_endorsements": 5,
+        "percent_endorsed": 60
+        "pending_operations" : {
+            "validated" : { ... },
+            .
+            .
+            .
+        }
+    }
+
+Heads come from the node's /monitor/heads/main stream. The hashes of the
+recent blocks are kept in a ring, so that a head whose predecessor is not the
+last logged block reveals either missed blocks, which are then logged too, or
+a reorganisation.
+
+pending_operations counts the kinds of the operations of each mempool class
+in MEMPOOL_CLASSES, as of the reception of the head. They are maintained from
+one /mempool/monitor_operations stream per class. The node ends these streams
+whenever it flushes its mempool, on new heads and reorganisations, and
+replays the mempool's content when they reconnect, so the counts start over
+on every connection. As the streams may only reconnect after the head is
+received, the operations of the logged blocks are taken out of the counts
+first. monitor_operations can't stream the unprocessed class, which is
+fetched from /mempool/pending_operations on every head instead.
+"""
+
+import collections
+import json
+import os
+import socket
+import threading
+
+import requests
+
+from octez_monitor import StreamMonitor
+
+NODE_URL = "http://127.0.0.1:8732"
+TOP = f"{NODE_URL}/chains/main"
+
+# How far back to look for a known block when a head doesn't follow the
+# last logged block, and how many recent hashes to remember.
+MAX_WALK = 20
+RING_SIZE = 256
+
+# Octez 17 and later call the applied class "validated", list "applied"
+# instead for older nodes.
+MEMPOOL_CLASSES = os.environ.get(
+    "MEMPOOL_CLASSES",
+    "validated,refused,outdated,branch_refused,branch_delayed,unprocessed",
+).split(",")
+# The classes monitor_operations can't stream
+POLLED_MEMPOOL_CLASSES = ("unprocessed",)
+
+
+def count_kinds(operations):
+    counts = {}
+    for operation in operations:
+        for content in operation["contents"]:
+            counts[content["kind"]] = counts.get(content["kind"], 0) + 1
+    return counts
+
+
+def pending_operation_counts(pending_operations, classes):
+    """Count the kinds of operations of classes of the mempool"""
+    return {
+        cls: count_kinds(
+            # Some classes list [hash, operation] pairs
+            op[1] if isinstance(op, list) else op
+            for op in pending_operations.get(cls, [])
+        )
+        for cls in classes
+    }
+
+
+class MempoolCounter:
+    """
+    The kind counts of the operations in each class of the mempool, but
+    the polled classes
+    """
+
+    def __init__(self, classes):
+        self.lock = threading.Lock()
+        streamed = [cls for cls in classes if cls not in POLLED_MEMPOOL_CLASSES]
+        self.polled = [cls for cls in classes if cls in POLLED_MEMPOOL_CLASSES]
+        self.counts = {cls: collections.Counter() for cls in streamed}
+        # The kinds of each operation counted, by hash. Operations may be sent
+        # again, e.g. when a stream reconnects.
+        self.kinds = {cls: {} for cls in streamed}
+
+    def add(self, cls, operations):
+        with self.lock:
+            for operation in operations:
+                if operation["hash"] in self.kinds[cls]:
+                    continue
+                kinds = [content["kind"] for content in operation["contents"]]
+                self.kinds[cls][operation["hash"]] = kinds
+                self.counts[cls].update(kinds)
+
+    def remove(self, hashes):
+        """Take operations out of the counts, e.g. once they are in a block"""
+        with self.lock:
+            for op_hash in hashes:
+                for cls, kinds in self.kinds.items():
+                    if op_hash in kinds:
+                        self.counts[cls].subtract(kinds.pop(op_hash))
+            for counts in self.counts.values():
+                for kind in [kind for kind, count in counts.items() if count <= 0]:
+                    del counts[kind]
+
+    def reset(self, cls=None):
+        with self.lock:
+            for c in [cls] if cls else self.counts:
+                self.counts[c].clear()
+                self.kinds[c].clear()
+
+    def snapshot(self):
+        with self.lock:
+            return {cls: dict(counts) for cls, counts in self.counts.items()}
+
+    def monitors(self, top=TOP, **kwargs):
+        """The StreamMonitors feeding each class from the node"""
+        return [
+            StreamMonitor(
+                f"{top}/mempool/monitor_operations?"
+                + "&".join(
+                    f"{c}={'true' if c == cls else 'false'}" for c in self.counts
+                ),
+                on_value=lambda operations, cls=cls: self.add(cls, operations),
+                on_connect=lambda cls=cls: self.reset(cls),
+                **kwargs,
+            )
+            for cls in self.counts
+        ]
+
+
+def percentage(num, total):
+    if total == 0:
+        return -1
+    percent = num / total * 100
+    return int(percent) if percent.is_integer() else percent
+
+
+class BlockLogger:
+    def __init__(self, node_name, mempool, session=None, top=TOP):
+        self.node_name = node_name
+        self.mempool = mempool
+        self.session = session or requests.Session()
+        self.top = top
+        self.last_hash = None
+        # Hashes of the recent blocks, oldest first
+        self.recent_hashes = collections.OrderedDict()
+
+    def get(self, path):
+        r = self.session.get(f"{self.top}/{path}", timeout=30)
+        r.raise_for_status()
+        return r.json()
+
+    def remember(self, block_hash):
+        self.recent_hashes[block_hash] = None
+        self.recent_hashes.move_to_end(block_hash)
+        while len(self.recent_hashes) > RING_SIZE:
+            self.recent_hashes.popitem(last=False)
+
+    def new_blocks(self, header):
+        """
+        Return the headers of the blocks from the last logged block's
+        successor to header, and whether the chain was reorganised.
+        """
+        if self.last_hash is None:
+            return [header], False
+        blocks = [header]
+        while blocks[0]["predecessor"] != self.last_hash:
+            if blocks[0]["predecessor"] in self.recent_hashes:
+                # The head is on another branch than the last logged block
+                return blocks, True
+            if len(blocks) > MAX_WALK:
+                # Too far away from the blocks we know of, only log the head
+                return [header], True
+            blocks.insert(0, self.get(f"blocks/{blocks[0]['predecessor']}/header"))
+        return blocks, False
+
+    def on_head(self, header):
+        if header["hash"] in self.recent_hashes:
+            # Already logged, e.g. the current head sent again by the stream
+            return
+        headers, reorg = self.new_blocks(header)
+        blocks = [self.get(f"blocks/{h['hash']}") for h in headers]
+        # Until the node flushes its mempool and the streams reconnect, the
+        # counts still have the operations of the blocks
+        self.mempool.remove(
+            operation.get("hash")
+            for block in blocks
+            for operations in block["operations"]
+            for operation in operations
+        )
+        pending_operations = self.pending_operations()
+        for block in blocks:
+            self.emit(self.block_log(block, reorg, pending_operations))
+            self.remember(block["hash"])
+            self.last_hash = block["hash"]
+
+    def pending_operations(self):
+        pending_operations = self.mempool.snapshot()
+        if self.mempool.polled:
+            # Leave out the classes that are streamed
+            query = "&".join(f"{cls}=false" for cls in pending_operations)
+            pending_operations.update(
+                pending_operation_counts(
+                    self.get(f"mempool/pending_operations?{query}"),
+                    self.mempool.polled,
+                )
+            )
+        return pending_operations
+
+    def block_log(self, block, reorg, pending_operations):
+        endorsing_rights = self.get(
+            f"blocks/{block['header']['predecessor']}/helpers/endorsing_rights"
+        )
+        num_endorsements = len(block["operations"][0])
+        return {
+            "logtype": "new-block-on-node",
+            "node": self.node_name,
+            "level": block["header"]["level"],
+            "priority": block["header"].get("priority"),
+            "hash": block["hash"],
+            "last_hash": None,
+            "predecessor": block["header"]["predecessor"],
+            "timestamp": block["header"]["timestamp"],
+            "reorg": reorg,
+            "operations": count_kinds(
+                operation
+                for operations in block["operations"]
+                for operation in operations
+            ),
+            "num_endorsements": num_endorsements,
+            "possible_endorsements": len(endorsing_rights),
+            "percent_endorsed": percentage(num_endorsements, len(endorsing_rights)),
+            "pending_operations": pending_operations,
+        }
+
+    def emit(self, log):
+        print(json.dumps(log, separators=(",", ":")), flush=True)
+
+
+def main():
+    mempool = MempoolCounter(MEMPOOL_CLASSES)
+    for monitor in mempool.monitors():
+        monitor.start()
+    logger = BlockLogger(socket.gethostname(), mempool)
+    StreamMonitor(f"{NODE_URL}/monitor/heads/main", logger.on_head).run()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,158 @@
+"""
+Consume the streaming RPCs of octez-node, such as /monitor/heads/main.
+
+Monitoring RPCs answer with a never ending HTTP response in which the node
+writes one JSON value per event. StreamMonitor runs such a request in a
+background thread, reconnecting with exponential backoff whenever the stream
+breaks, and hands every value over to a callback.
+"""
+
+import codecs
+import json
+import random
+import threading
+import time
+
+import requests
+
+
+class JSONStreamDecoder:
+    """
+    Split a stream of concatenated JSON values into the values. Values, and
+    UTF-8 characters, may be cut anywhere across the chunks of bytes fed to
+    the decoder.
+    """
+
+    def __init__(self):
+        self.decoder = json.JSONDecoder()
+        self.text_decoder = codecs.getincrementaldecoder("utf-8")()
+        self.buffer = ""
+
+    def feed(self, chunk):
+        """Return the list of values completed by chunk."""
+        self.buffer += self.text_decoder.decode(chunk)
+        values = []
+        position = 0
+        while True:
+            # Skip the whitespace, typically newlines, separating values
+            while position < len(self.buffer) and self.buffer[position].isspace():
+                position += 1
+            if position == len(self.buffer):
+                break
+            try:
+                value, position = self.decoder.raw_decode(self.buffer, position)
+            except json.JSONDecodeError:
+                # Wait for the rest of the value
+                break
+            values.append(value)
+        self.buffer = self.buffer[position:]
+        return values
+
+
+class StreamMonitor(threading.Thread):
+    """
+    Follow the streaming RPC at url, calling on_value with every value it
+    yields, and on_connect, if given, every time the stream (re)connects.
+    The `connected` event is set while the stream is up.
+    """
+
+    def __init__(
+        self,
+        url,
+        on_value,
+        on_connect=None,
+        session=None,
+        connect_timeout=5,
+        read_timeout=120,
+        min_backoff=0.5,
+        max_backoff=30,
+    ):
+        super().__init__(daemon=True, name=f"monitor {url}")
+        self.url = url
+        self.on_value = on_value
+        self.on_connect = on_connect
+        self.session = session or requests.Session()
+        self.timeout = (connect_timeout, read_timeout)
+        self.min_backoff = min_backoff
+        self.max_backoff = max_backoff
+        self.connected = threading.Event()
+        # time.monotonic() of the latest connection
+        self.connected_at = None
+        self.stopped = threading.Event()
+        self.reconnections = 0
+
+    def run(self):
+        backoff = self.min_backoff
+        while not self.stopped.is_set():
+            try:
+                for value in self.stream():
+                    # The stream works, start over from the shortest backoff
+                    # when it breaks.
+                    backoff = self.min_backoff
+                    self.on_value(value)
+                # Ended by the node, e.g. monitor_operations on a mempool
+                # flush, even without yielding a value: reconnect as usual
+                failed = False
+            except (requests.RequestException, ValueError) as e:
+                print(f"Stream {self.url} failed: {e!r}", flush=True)
+                failed = True
+            self.connected.clear()
+            if not failed:
+                backoff = self.min_backoff
+            if self.stopped.wait(backoff * random.uniform(0.5, 1)):
+                break
+            if failed:
+                backoff = min(backoff * 2, self.max_backoff)
+            self.reconnections += 1
+
+    def stream(self):
+        decoder = JSONStreamDecoder()
+        with self.session.get(self.url, stream=True, timeout=self.timeout) as r:
+            r.raise_for_status()
+            self.connected_at = time.monotonic()
+            self.connected.set()
+            if self.on_connect:
+                self.on_connect()
+            for chunk in r.iter_content(chunk_size=None):
+                if self.stopped.is_set():
+                    return
+                yield from decoder.feed(chunk)
+
+    def stop(self):
+        self.stopped.set()
+
+
+class HeadMonitor(StreamMonitor):
+    """
+    Keep the latest head of a chain in memory, from the node's
+    /monitor/heads/<chain> stream.
+    """
+
+    def __init__(self, node_url, chain="main", on_head=None, **kwargs):
+        super().__init__(f"{node_url}/monitor/heads/{chain}", self.set_head, **kwargs)
+        self.on_head = on_head
+        self.lock = threading.Lock()
+        self.head = None
+        # time.monotonic() of the reception of the head
+        self.head_received_at = None
+
+    def set_head(self, header):
+        with self.lock:
+            self.head = header
+            self.head_received_at = time.monotonic()
+        if self.on_head:
+            self.on_head(header)
+
+    def latest_head(self):
+        """
+        Return the latest head received since the stream (re)connected, None
+        otherwise, as the node may have moved on while the stream was down.
+        """
+        if not self.connected.is_set():
+            return None
+        with self.lock:
+            if self.head_received_at is None or (
+                self.head_received_at < self.connected_at
+            ):
+                return None
+            return self.head
@@ -0,0 +1,119 @@
+#! /usr/bin/env python
+"""
+Find the snapshot of a synced node of its class for the node to bootstrap
+from, served by the snapshot-server container of the sibling pods, see
+snapshot-server.py.
+
+The siblings are the addresses of PEERS, the headless service of the node
+class, but this pod's. The latest snapshot they export, the one at the
+highest level, is written to OUTPUT as a tezos-snapshot artifact, in the
+format of snapshot_config.json. snapshot-downloader.sh then downloads it and
+the snapshot-importer container imports it as any other tezos snapshot: the
+sha256 of the export is checked, and so is its block. The full snapshots
+of archive nodes aren't imported by their siblings.
+
+When OUTPUT names the export of a previous run and a sibling still serves it,
+it is kept, for downloader.py to resume its download rather than start over.
+
+    peer-snapshot.py PEERS OUTPUT
+
+PEERS is host:port. Exits with NO_PEER when no sibling has a snapshot to
+share, for snapshot-downloader.sh to fall back to the snapshot_source.
+"""
+
+import argparse
+import json
+import os
+import socket
+import sys
+
+import requests
+
+NO_PEER = 3
+STATUS_TIMEOUT = 2
+
+
+def sibling_addresses(host, port):
+    """The addresses of host, but this pod's"""
+    try:
+        infos = socket.getaddrinfo(host, port, type=socket.SOCK_STREAM)
+    except OSError as e:
+        print(f"Can't resolve {host}: {e}")
+        return []
+    addresses = dict.fromkeys(info[4][0] for info in infos)
+    addresses.pop(os.environ.get("MY_POD_IP"), None)
+    return list(addresses)
+
+
+def peer_status(url):
+    try:
+        r = requests.get(f"{url}/status", timeout=STATUS_TIMEOUT)
+        r.raise_for_status()
+        return r.json()
+    except (requests.RequestException, ValueError) as e:
+        print(f"{url} has no snapshot to share: {e!r}")
+        return None
+
+
+def previous_snapshot(output):
+    """The snapshot config of OUTPUT, if its export is still served"""
+    try:
+        with open(output) as f:
+            snapshot_config = json.load(f)
+        url = snapshot_config["url"]
+    except (OSError, ValueError, KeyError, TypeError):
+        return None
+    try:
+        with requests.get(url, stream=True, timeout=STATUS_TIMEOUT) as r:
+            r.raise_for_status()
+    except requests.RequestException as e:
+        print(f"{url} is no longer shared: {e!r}")
+        return None
+    return snapshot_config
+
+
+def best_snapshot(peers):
+    """The snapshot config of the export at the highest level, if any"""
+    host, port = peers.rsplit(":", 1)
+    best = None
+    for address in sibling_addresses(host, port):
+        if ":" in address:
+            address = f"[{address}]"
+        url = f"http://{address}:{port}"
+        status = peer_status(url)
+        if status is None or not status.get("available"):
+            continue
+        if status["history_mode"] != status["node_history_mode"]:
+            print(f"{url} only shares the snapshots of an archive node")
+            continue
+        print(f"{url} shares a snapshot at level {status['level']}")
+        if best is None or status["level"] > best["level"]:
+            best = dict(status, url=f"{url}{status['path']}")
+    if best is None:
+        return None
+    return {
+        "url": best["url"],
+        "artifact_type": "tezos-snapshot",
+        "history_mode": best["history_mode"],
+        "block_hash": best["block_hash"],
+        "filesize_bytes": best["filesize_bytes"],
+        "sha256": best["sha256"],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("peers", help="host:port of the snapshot servers")
+    parser.add_argument("output", help="the snapshot config to write")
+    args = parser.parse_args()
+    snapshot_config = previous_snapshot(args.output) or best_snapshot(args.peers)
+    if snapshot_config is None:
+        print(f"No node of {args.peers} has a snapshot to share")
+        sys.exit(NO_PEER)
+    print(f"Bootstrapping from {snapshot_config['url']}")
+    with open(args.output, "w") as f:
+        json.dump(snapshot_config, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,67 +1,409 @@
 #! /usr/bin/env python
-from flask import Flask
-import requests
-from requests.exceptions import ConnectTimeout, ReadTimeout, RequestException
+import aiohttp
+from aiohttp import web
+import asyncio
 import datetime
+import json
+import os
+import threading
+import time
 
 import logging
 
-log = logging.getLogger("werkzeug")
-log.setLevel(logging.ERROR)
+from exporter_runtime import Service
+from octez_monitor import HeadMonitor
 
-application = Flask(__name__)
+log = logging.getLogger("sidecar")
+
+service = Service()
 
 AGE_LIMIT_IN_SECS = 600
 # https://kubernetes.io/docs/tasks/configure-pod-container/configure-liveness-readiness-startup-probes/
 # Default readiness probe timeoutSeconds is 1s, timeout sync request before that and return a
 # connect timeout error if necessary
 NODE_CONNECT_TIMEOUT = 0.9
+NODE_URL = "http://127.0.0.1:8732"
+
+
+def node_timeout(timeout=None):
+    timeout = NODE_CONNECT_TIMEOUT if timeout is None else timeout
+    return aiohttp.ClientTimeout(total=timeout, sock_connect=timeout)
+
+
+#
+# Prometheus metrics. They are only fed by probes and the head stream, so
+# scrapes don't query the node.
+
+NODE_RPC_DURATION = service.registry.histogram(
+    "sidecar_node_rpc_duration_seconds",
+    "Duration of the node RPCs of the sidecar, by path.",
+    ["path"],
+)
+PROBE_DURATION = service.registry.histogram(
+    "sidecar_probe_duration_seconds", "Duration of the /is_synced probes."
+)
+PROBE_OUTCOMES = service.registry.counter(
+    "sidecar_probes_total", "Outcomes of the /is_synced probes.", ["outcome"]
+)
+READINESS_CHECK_FAILURES = service.registry.counter(
+    "sidecar_readiness_check_failures_total",
+    "Failures of the readiness checks.",
+    ["check"],
+)
+
+
+class HeadState:
+    """The latest head the sidecar knows of, and when it last changed."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.header = None
+        self.changed_at = None
+
+    def observe(self, header):
+        with self.lock:
+            if self.header is None or (header.get("hash"), header["level"]) != (
+                self.header.get("hash"),
+                self.header["level"],
+            ):
+                self.changed_at = time.monotonic()
+            self.header = header
+
+    def get(self):
+        with self.lock:
+            return self.header, self.changed_at
 
-@application.route("/is_synced")
-def sync_checker():
+
+head_state = HeadState()
+
+# Follows the node's head in the background, so that probes don't need to
+# wait for the node's RPC server.
+head_monitor = HeadMonitor(NODE_URL, on_head=head_state.observe)
+
+
+# How long a node RPC result is reused for all the probes
+PROBE_CACHE_TTL = float(os.environ.get("PROBE_CACHE_TTL", "0.5"))
+
+
+class SingleFlightCache:
+    """
+    Calls to get() share one in-flight call of fn, a coroutine function,
+    whose result, or exception, is then reused by the calls made within ttl
+    seconds.
+    """
+
+    def __init__(self, fn, ttl):
+        self.fn = fn
+        self.ttl = ttl
+        self.in_flight = None
+        self.result = None
+        self.expires_at = 0
+        # Served from the cached result, from another call's in-flight
+        # request, or by calling fn.
+        self.hits = 0
+        self.coalesced = 0
+        self.misses = 0
+
+    async def get(self):
+        if time.monotonic() < self.expires_at:
+            self.hits += 1
+            return self.unwrap(self.result)
+        if self.in_flight:
+            self.coalesced += 1
+        else:
+            self.misses += 1
+            self.in_flight = asyncio.ensure_future(self.call())
+        # A probe giving up must not cancel the call the others wait for
+        return await asyncio.shield(self.in_flight)
+
+    async def call(self):
+        try:
+            result = (await self.fn(), None)
+        except Exception as e:
+            result = (None, e)
+        self.result = result
+        self.expires_at = time.monotonic() + self.ttl
+        self.in_flight = None
+        return self.unwrap(result)
+
+    @staticmethod
+    def unwrap(result):
+        value, exception = result
+        if exception:
+            raise exception
+        return value
+
+    def stats(self):
+        return {"hits": self.hits, "coalesced": self.coalesced, "misses": self.misses}
+
+
+async def node_get(path, timeout=None):
+    with NODE_RPC_DURATION.time(path):
+        async with service.session.get(
+            f"{NODE_URL}{path}", timeout=node_timeout(timeout)
+        ) as r:
+            r.raise_for_status()
+            return await r.json(content_type=None)
+
+
+async def poll_head_header():
+    header = await node_get("/chains/main/blocks/head/header")
+    if not isinstance(header, dict) or not {"level", "timestamp"} <= header.keys():
+        raise ValueError(f"Not a block header: {header!r}")
+    head_state.observe(header)
+    return header
+
+
+head_header_cache = SingleFlightCache(poll_head_header, PROBE_CACHE_TTL)
+
+
+async def get_head_header():
+    """
+    Return the header of the node's head. It comes from the head monitor's
+    stream, unless the stream is down, in which case the node is polled.
+    """
+    header = head_monitor.latest_head()
+    if header is None:
+        header = await head_header_cache.get()
+    return header
+
+
+def head_age_in_secs(header):
+    block_age = datetime.datetime.utcnow() - datetime.datetime.strptime(
+        header["timestamp"], "%Y-%m-%dT%H:%M:%SZ"
+    )
+    return block_age.total_seconds()
+
+
+async def check_sync():
     """
     Here we don't trust the /is_bootstrapped endpoint of
     octez-node. We have seen it return true when the node is
     in a bad state (for example, some crashed threads)
     Instead, we query the head block and verify timestamp is
     not too old.
+
+    Returns the outcome of the check and the response to the probe.
     """
     try:
-        r = requests.get("http://127.0.0.1:8732/chains/main/blocks/head/header", timeout=NODE_CONNECT_TIMEOUT)
-    except ConnectTimeout as e:
+        header = await get_head_header()
+    except aiohttp.ConnectionTimeoutError as e:
         err = "Timeout connect to node, %s" % repr(e), 500
-        application.logger.error(err)
-        return err
-    except ReadTimeout as e:
+        log.error(err)
+        return "connect_timeout", err
+    except asyncio.TimeoutError as e:
         err = "Timeout read from node, %s" % repr(e), 500
-        application.logger.error(err)
-        return err
-    except RequestException as e:
+        log.error(err)
+        return "read_timeout", err
+    except aiohttp.ClientError as e:
         err = "Could not connect to node, %s" % repr(e), 500
-        application.logger.error(err)
-        return err
+        log.error(err)
+        return "unreachable", err
+    except ValueError as e:
+        err = "Invalid response from node, %s" % repr(e), 500
+        log.error(err)
+        return "invalid_response", err
 
-    header = r.json()
     if header["level"] == 0:
         # when chain has not been activated, bypass age check
         # and return successfully to mark as ready
         # otherwise it will never activate (activation uses rpc service)
-        return "Chain has not been activated yet"
-    timestamp = r.json()["timestamp"]
-    block_age = datetime.datetime.utcnow() - datetime.datetime.strptime(
-        timestamp, "%Y-%m-%dT%H:%M:%SZ"
-    )
-    age_in_secs = block_age.total_seconds()
+        return "not_activated", ("Chain has not been activated yet", 200)
+    age_in_secs = head_age_in_secs(header)
     if age_in_secs > AGE_LIMIT_IN_SECS:
         err = (
             "Error: Chain head is %s secs old, older than %s"
             % (age_in_secs, AGE_LIMIT_IN_SECS),
             500,
         )
-        application.logger.error(err)
-        return err
-    return "Chain is bootstrapped"
+        log.error(err)
+        return "head_too_old", err
+    return "synced", ("Chain is bootstrapped", 200)
+
+
+#
+# Multi-signal readiness. When READINESS_CHECKS is set, /is_synced runs the
+# checks it lists concurrently, within NODE_CONNECT_TIMEOUT overall, and the
+# node is ready when the weights of the passing checks add up to at least
+# READINESS_THRESHOLD of the total weight. For example:
+#
+#   {"head_age": {}, "bootstrapped": {}, "peers": {"min": 3, "weight": 0.5},
+#    "mempool": {"max_latency": 0.3, "weight": 0.5}}
+
+
+async def check_head_age(settings, timeout):
+    header = await get_head_header()
+    if header["level"] == 0:
+        return True, "chain has not been activated yet"
+    age_in_secs = head_age_in_secs(header)
+    max_age = settings.get("max_age", AGE_LIMIT_IN_SECS)
+    return age_in_secs <= max_age, f"head is {age_in_secs} secs old, limit {max_age}"
+
+
+async def check_bootstrapped(settings, timeout):
+    status = await node_get("/chains/main/is_bootstrapped", timeout)
+    return status["bootstrapped"], f"sync state is {status.get('sync_state')}"
+
+
+async def check_peers(settings, timeout):
+    peers = len(await node_get("/network/connections", timeout))
+    min_peers = settings.get("min", 1)
+    return peers >= min_peers, f"{peers} connected peers, minimum {min_peers}"
+
+
+async def check_mempool(settings, timeout):
+    start = time.monotonic()
+    await node_get("/chains/main/mempool/filter", timeout)
+    latency = time.monotonic() - start
+    max_latency = settings.get("max_latency", 0.5)
+    return (
+        latency <= max_latency,
+        f"mempool answered in {latency:.3f}s, limit {max_latency}",
+    )
+
+
+READINESS_CHECK_FUNCTIONS = {
+    "head_age": check_head_age,
+    "bootstrapped": check_bootstrapped,
+    "peers": check_peers,
+    "mempool": check_mempool,
+}
+READINESS_CHECKS = json.loads(os.environ.get("READINESS_CHECKS") or "{}")
+READINESS_THRESHOLD = float(os.environ.get("READINESS_THRESHOLD", "1"))
+for check in READINESS_CHECKS:
+    if check not in READINESS_CHECK_FUNCTIONS:
+        raise Exception(
+            f"ERROR: Unknown readiness check {check}, "
+            + f"known checks are {list(READINESS_CHECK_FUNCTIONS)}"
+        )
+
+
+async def check_readiness():
+    """
+    Run the readiness checks concurrently, under a single deadline. Returns
+    the outcome and the response to the probe, which details every check.
+    """
+    tasks = {
+        name: asyncio.ensure_future(
+            READINESS_CHECK_FUNCTIONS[name](settings, NODE_CONNECT_TIMEOUT)
+        )
+        for name, settings in READINESS_CHECKS.items()
+    }
+    await asyncio.wait(tasks.values(), timeout=NODE_CONNECT_TIMEOUT)
+
+    checks = {}
+    for name, task in tasks.items():
+        if not task.done():
+            task.cancel()
+            ok, detail = False, "no answer before the deadline"
+        elif task.exception():
+            ok, detail = False, repr(task.exception())
+        else:
+            ok, detail = task.result()
+        checks[name] = {
+            "ok": ok,
+            "weight": READINESS_CHECKS[name].get("weight", 1),
+            "detail": detail,
+        }
+        if not ok:
+            READINESS_CHECK_FAILURES.inc(name)
+
+    total_weight = sum(check["weight"] for check in checks.values())
+    score = sum(check["weight"] for check in checks.values() if check["ok"])
+    score = score / total_weight if total_weight else 1
+    failing = [name for name, check in checks.items() if not check["ok"]]
+    body = {
+        "score": score,
+        "threshold": READINESS_THRESHOLD,
+        "failing": failing,
+        "checks": checks,
+    }
+    if score < READINESS_THRESHOLD:
+        log.error(f"Not ready, failing checks: {failing}")
+        return "not_ready", (body, 500)
+    return "ready", (body, 200)
+
+
+readiness_cache = SingleFlightCache(check_readiness, PROBE_CACHE_TTL)
+
+
+@service.route("GET", "/is_synced")
+async def sync_checker(request):
+    with PROBE_DURATION.time():
+        if READINESS_CHECKS:
+            outcome, (body, status) = await readiness_cache.get()
+        else:
+            outcome, (body, status) = await check_sync()
+    PROBE_OUTCOMES.inc(outcome)
+    if isinstance(body, dict):
+        return web.json_response(body, status=status)
+    return web.Response(text=body, status=status)
+
+
+@service.route("GET", "/probe_cache")
+async def probe_cache_stats(request):
+    """How node RPCs of the probes were served, by cache"""
+    return web.json_response(
+        {name: cache.stats() for name, cache in probe_caches().items()}
+    )
+
+
+def probe_caches():
+    return {"head_header": head_header_cache, "readiness": readiness_cache}
+
+
+def head_metric(value):
+    """Collects value(header, changed_at), once a head is known"""
+
+    def collect():
+        header, changed_at = head_state.get()
+        if header is not None:
+            return value(header, changed_at)
+
+    return collect
+
+
+service.registry.gauge(
+    "sidecar_head_stream_up",
+    "Whether the sidecar follows the node's heads stream.",
+    collect=lambda: int(head_monitor.connected.is_set()),
+)
+service.registry.counter(
+    "sidecar_head_stream_reconnections_total",
+    "Reconnections of the heads stream.",
+    collect=lambda: head_monitor.reconnections,
+)
+service.registry.gauge(
+    "sidecar_head_level",
+    "Level of the node's head.",
+    collect=head_metric(lambda header, _: header["level"]),
+)
+service.registry.gauge(
+    "sidecar_head_age_seconds",
+    "Age of the node's head, from its timestamp.",
+    collect=head_metric(lambda header, _: head_age_in_secs(header)),
+)
+service.registry.gauge(
+    "sidecar_head_unchanged_seconds",
+    "Time since the sidecar saw the node's head change.",
+    collect=head_metric(lambda _, changed_at: time.monotonic() - changed_at),
+)
+service.registry.counter(
+    "sidecar_probe_cache_total",
+    "How node RPCs of the probes were served.",
+    ["cache", "result"],
+    collect=lambda: {
+        (name, result): count
+        for name, cache in probe_caches().items()
+        for result, count in (
+            ("hit", cache.hits),
+            ("coalesced", cache.coalesced),
+            ("miss", cache.misses),
+        )
+    },
+)
 
 
 if __name__ == "__main__":
-    application.run(host="0.0.0.0", port=31732, debug=False)
+    head_monitor.start()
+    service.run()
@@ -19,24 +19,34 @@ fi
 
 echo "Did not find a pre-existing blockchain."
 
-if [ ! -f ${data_dir}/snapshot_config.json ]; then
+snapshot_config=${data_dir}/snapshot_config.json
+if [ ! -z "${PEER_SNAPSHOTS}" ]; then
+  # The nodes of this class run the snapshot-server container: download the
+  # snapshot exported by a synced sibling, see peer-snapshot.py, rather than
+  # the snapshot source's, which is the fallback when none is shared.
+  if /peer-snapshot.py "${PEER_SNAPSHOTS}" "${data_dir}/peer_snapshot_config.json"; then
+    snapshot_config=${data_dir}/peer_snapshot_config.json
+  fi
+fi
+
+if [ ! -f ${snapshot_config} ]; then
   echo "No snapshot config found, nothing to do."
   exit 0
 fi
 
 echo "Tezos snapshot config is:"
-cat ${data_dir}/snapshot_config.json
+cat ${snapshot_config}
 
-artifact_url=$(cat ${data_dir}/snapshot_config.json | jq -r '.url')
-artifact_type=$(cat ${data_dir}/snapshot_config.json | jq -r '.artifact_type')
+artifact_url=$(cat ${snapshot_config} | jq -r '.url')
+artifact_type=$(cat ${snapshot_config} | jq -r '.artifact_type')
 mkdir -p "$node_data_dir"
 
-download() {
-  # Smart Downloading function. When relevant metadata is accessible, it:
-  # * checks that there is enough space to download the file
-  # * verifies the sha256sum
-  filesize_bytes=$(cat ${data_dir}/snapshot_config.json | jq -r '.filesize_bytes // empty')
-  sha256=$(cat ${data_dir}/snapshot_config.json | jq -r '.sha256 // empty')
+sha256=$(cat ${snapshot_config} | jq -r '.sha256 // empty')
+
+check_disk_space() {
+  # When the size of the artifact is known, check that there is enough space
+  # to download it.
+  filesize_bytes=$(cat ${snapshot_config} | jq -r '.filesize_bytes // empty')
   if [ ! -z "${filesize_bytes}" ]; then
     free_space=$(findmnt -bno size -T ${data_dir})
     echo "Free space available in filesystem: ${free_space}" >&2
@@ -48,40 +58,107 @@ download() {
       echo "There is sufficient free space to download the artifact of size ${filesize_bytes}." >&2
     fi
   fi
-  curl -LfsS $1 | tee >(sha256sum > ${snapshot_file}.sha256sum)
-  if [ ! -z "${sha256}" ]; then
-    if [ "${sha256}" != "$(cat ${snapshot_file}.sha256sum | head -c 64)" ]; then
-      echo "Error: sha256 checksum of the downloaded file did not match checksum from metadata file." >&2
-      touch ${data_dir}/sha256sum_failed
-      return 1
-    else
-      echo "Snapshot sha256sum check successful." >&2
-    fi
-  fi
 }
 
 if [ "${artifact_type}" == "tezos-snapshot" ]; then
-  echo "Downloading $artifact_url"
   echo '{ "version": "0.0.4" }' > "$node_dir/version.json"
-  block_hash=$(cat ${data_dir}/snapshot_config.json | jq -r '.block_hash // empty')
-  download "$artifact_url" > "$snapshot_file"
-  if [ -f "${data_dir}/sha256sum_failed" ]; then
-    # sha256 failure
-    rm -rvf ${snapshot_file}
-    rm -rvf "${data_dir}/sha256sum_failed"
-    exit 1
+  block_hash=$(cat ${snapshot_config} | jq -r '.block_hash // empty')
+  rm -f ${snapshot_file}.url ${snapshot_file}.sha256
+  if [ "${SNAPSHOT_STREAMING}" == "true" ] && [ ! -e ${snapshot_file} ] \
+    && [ ! -e ${snapshot_file}.no_streaming ]; then
+    # The snapshot-importer container streams the snapshot straight into
+    # octez-node, it is never written to disk.
+    echo "Leaving the download of $artifact_url to the snapshot importer"
+    echo "$artifact_url" > ${snapshot_file}.url
+    if [ ! -z "${sha256}" ]; then
+      echo "$sha256" > ${snapshot_file}.sha256
+    fi
+  # Fetched over DOWNLOAD_CONNECTIONS concurrent range requests, and checked
+  # against the sha256 of the metadata, see downloader.py. When the download
+  # fails otherwise than on its sha256, the partial file and its checkpoint
+  # are kept for the restarted container to resume the download.
+  elif check_disk_space; then
+    echo "Downloading $artifact_url"
+    status=0
+    /downloader.py ${sha256:+--sha256 "$sha256"} "$artifact_url" "$snapshot_file" || status=$?
+    if [ "$status" -eq 2 ]; then
+      rm -rvf ${snapshot_file} ${snapshot_file}.progress
+      exit 1
+    elif [ "$status" -ne 0 ]; then
+      echo "Download interrupted, it will be resumed on restart." >&2
+      exit 1
+    fi
   fi
   if [ ! -z "${block_hash}" ]; then
     echo ${block_hash} > ${snapshot_file}.block_hash
   fi
 elif [ "${artifact_type}" == "tarball" ]; then
-  echo "Downloading and extracting tarball from $artifact_url"
-  download "$artifact_url" | lz4 -d | tar -x -C "$data_dir"
-  if [ -f "${data_dir}/sha256sum_failed" ]; then
-    echo "sha256 check failed, deleting data"
-    rm -rvf "${node_data_dir}"
-    rm -rvf "${data_dir}/sha256sum_failed"
-    exit 1
+  tarball_file=${data_dir}/chain.tarball
+  # Tarballs are staged on the volume, that is downloaded by downloader.py,
+  # resuming an interrupted download like for tezos snapshots, checked
+  # against the sha256 of the metadata, then extracted. This needs room for
+  # the tarball on top of its data. TARBALL_STAGING set to "true" or "false"
+  # forces it or streams the tarball into the extraction instead. By default
+  # the tarball is staged when the volume has room for 3 times its size: the
+  # tarball, and its data estimated at twice its size.
+  stage_tarball=${TARBALL_STAGING:-auto}
+  filesize_bytes=$(cat ${snapshot_config} | jq -r '.filesize_bytes // empty')
+  if [ "$stage_tarball" == "auto" ]; then
+    stage_tarball=false
+    available=$(findmnt -bno avail -T ${data_dir})
+    if [ -e "$tarball_file" ] || [ -e "${tarball_file}.part" ]; then
+      stage_tarball=true
+    elif [ ! -z "${filesize_bytes}" ] && [ "$((3 * filesize_bytes))" -le "${available}" ]; then
+      stage_tarball=true
+    fi
+  fi
+  if [ "$stage_tarball" == "true" ]; then
+    if [ -e "$tarball_file" ] && [ "$(cat ${tarball_file}.url 2>/dev/null)" != "$artifact_url" ]; then
+      echo "Deleting $tarball_file, staged for another artifact"
+      rm -f "$tarball_file" "${tarball_file}.url"
+    fi
+    if [ ! -e "$tarball_file" ] && check_disk_space; then
+      echo "Downloading tarball from $artifact_url"
+      status=0
+      /downloader.py ${sha256:+--sha256 "$sha256"} "$artifact_url" "${tarball_file}.part" || status=$?
+      if [ "$status" -eq 2 ]; then
+        rm -rvf ${tarball_file}.part ${tarball_file}.part.progress
+        exit 1
+      elif [ "$status" -ne 0 ]; then
+        echo "Download interrupted, it will be resumed on restart." >&2
+        exit 1
+      fi
+      echo "$artifact_url" > "${tarball_file}.url"
+      mv "${tarball_file}.part" "$tarball_file"
+    fi
+    if [ -e "$tarball_file" ]; then
+      echo "Extracting $tarball_file"
+      # Members are written over on restart, so the data is kept
+      if ! /extractor.py "$tarball_file" "$data_dir"; then
+        echo "Extraction failed, it will be restarted from the tarball." >&2
+        exit 1
+      fi
+      rm -f "$tarball_file" "${tarball_file}.url"
+    fi
+  else
+    echo "Downloading and extracting tarball from $artifact_url"
+    # Downloaded, checked against the sha256 of the metadata, decompressed
+    # and extracted by concurrent stages, see extractor.py. When the metadata
+    # has the sha256 of each chunk of the tarball, the extraction stops at the
+    # first chunk that doesn't match. The stream can't be resumed.
+    chunk_sha256_file="${data_dir}/chunk_sha256.json"
+    chunk_sha256_args=""
+    if jq -e '.chunk_sha256' ${snapshot_config} > /dev/null; then
+      jq '.chunk_sha256' ${snapshot_config} > "$chunk_sha256_file"
+      chunk_sha256_args="--chunk-sha256 $chunk_sha256_file"
+    fi
+    if check_disk_space; then
+      if ! /extractor.py ${sha256:+--sha256 "$sha256"} ${chunk_sha256_args} "$artifact_url" "$data_dir"; then
+        echo "Extraction failed, deleting data"
+        rm -rvf "${node_data_dir}"
+        exit 1
+      fi
+    fi
   fi
 fi
 if [ -f "${data_dir}/disk_space_failed" ]; then
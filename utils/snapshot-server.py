@@ -0,0 +1,92 @@
+#! /usr/bin/env python
+"""
+Share a snapshot of the node with the new nodes of its class, so that they
+bootstrap from a synced sibling rather than from a snapshot downloaded from
+the internet, see peer-snapshot.py.
+
+The snapshots are exported by the snapshot-exporter container of the pod,
+which runs `octez-node snapshot export` while the node is synced, so that they
+are a consistent copy of the chain at their block. Each export is written to
+EXPORT_DIR as NAME.snapshot, with NAME.info.json, the output of
+`octez-node snapshot info --json`, and NAME.sha256. The name of the latest
+complete export is then written to EXPORT_DIR/latest. The previous export is
+kept until the next one, for the downloads still fetching it. The history
+mode of the node is written to EXPORT_DIR/history_mode: archive nodes export
+full snapshots.
+
+GET /status describes the latest export: its URL path, block, level, history
+mode, the history mode of the node, size and sha256. It is a 503 while there
+is none.
+
+GET /snapshot/NAME serves an export, with Range requests for downloader.py to
+fetch it over several connections and resume it.
+"""
+
+import json
+import os
+
+from aiohttp import web
+
+from exporter_runtime import Service
+
+SNAPSHOT_SERVER_PORT = int(os.environ.get("SNAPSHOT_SERVER_PORT", "31733"))
+EXPORT_DIR = "/var/tezos/peer-snapshot"
+
+service = Service(port=SNAPSHOT_SERVER_PORT)
+
+REQUESTS = service.registry.counter(
+    "snapshot_server_requests_total",
+    "Snapshot downloads requested, by outcome.",
+    ["outcome"],
+)
+
+
+def latest_export(export_dir):
+    """The description of the latest complete export, or None"""
+    try:
+        with open(os.path.join(export_dir, "latest")) as f:
+            name = f.read().strip()
+        with open(os.path.join(export_dir, f"{name}.info.json")) as f:
+            header = json.load(f)["snapshot_header"]
+        with open(os.path.join(export_dir, "history_mode")) as f:
+            node_history_mode = f.read().strip()
+        with open(os.path.join(export_dir, f"{name}.sha256")) as f:
+            sha256 = f.read().strip()
+        size = os.path.getsize(os.path.join(export_dir, f"{name}.snapshot"))
+        export = {
+            "path": f"/snapshot/{name}",
+            "block_hash": header["block_hash"],
+            "level": header["level"],
+            "history_mode": header["mode"],
+            "node_history_mode": node_history_mode,
+            "filesize_bytes": size,
+            "sha256": sha256,
+        }
+    except (OSError, ValueError, KeyError, TypeError) as e:
+        print(f"No snapshot to share: {e!r}")
+        return None
+    return export
+
+
+@service.route("GET", "/status")
+async def status(request):
+    export = latest_export(EXPORT_DIR)
+    if export is None:
+        return web.json_response({"available": False}, status=503)
+    return web.json_response(dict(export, available=True))
+
+
+@service.route("GET", r"/snapshot/{name:\d+}")
+async def snapshot(request):
+    path = os.path.join(EXPORT_DIR, f"{request.match_info['name']}.snapshot")
+    if not os.path.isfile(path):
+        # Removed by the export that followed
+        REQUESTS.inc("missing")
+        return web.Response(status=404, text="No such snapshot")
+    REQUESTS.inc("served")
+    print(f"Serving {path} to {request.remote}")
+    return web.FileResponse(path)
+
+
+if __name__ == "__main__":
+    service.run()
@@ -0,0 +1,219 @@
+import asyncio
+import collections
+import hashlib
+import importlib.util
+import json
+import queue
+import re
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+import pytest
+import requests
+
+UTILS_DIR = Path(__file__).resolve().parents[1]
+CHARTS_DIR = UTILS_DIR.parent / "charts"
+
+# The utils scripts are copied flat into the root of the utils image and
+# import each other as top level modules.
+sys.path.insert(0, str(UTILS_DIR))
+
+
+def load_script(filename, module_name, directory=UTILS_DIR):
+    """Import one of the utils scripts whose file name isn't a module name."""
+    spec = importlib.util.spec_from_file_location(module_name, directory / filename)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[module_name] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+@pytest.fixture
+def config_generator():
+    return load_script("config-generator.py", "config_generator")
+
+
+class LocalHTTPServer(ThreadingHTTPServer):
+    """
+    Serves `responses`, a mapping of paths to lists of (status, headers, body)
+    tuples served in turn, the last one being repeated. Received requests are
+    recorded as (method, path, headers).
+
+    Paths added to `streams` are served like the monitoring RPCs of
+    octez-node: a chunked response that goes on with every value published to
+    the path, until the streams of the path are closed.
+
+    `files` maps paths to contents served with support for Range requests,
+    unless `ranges` is False. The next `truncations[path]` responses of a
+    file stop halfway through, as if the connection broke.
+    """
+
+    daemon_threads = True
+
+    def __init__(self):
+        self.responses = {}
+        self.requests = []
+        self.streams = set()
+        self.files = {}
+        self.ranges = True
+        self.truncations = collections.Counter()
+        self.subscribers = collections.defaultdict(list)
+        super().__init__(("127.0.0.1", 0), LocalHTTPRequestHandler)
+
+    def publish(self, path, value):
+        """Send value, JSON encoded unless it is bytes, on the streams of path"""
+        if not isinstance(value, bytes):
+            value = json.dumps(value).encode() + b"\n"
+        for subscriber in list(self.subscribers[path]):
+            subscriber.put(value)
+
+    def close_streams(self, path):
+        for subscriber in list(self.subscribers[path]):
+            subscriber.put(None)
+
+    def wait_for_subscribers(self, path, count=1, timeout=5):
+        deadline = time.monotonic() + timeout
+        while len(self.subscribers[path]) < count:
+            assert time.monotonic() < deadline, f"no subscriber on {path}"
+            time.sleep(0.01)
+
+    @property
+    def url(self):
+        host, port = self.server_address
+        return f"http://{host}:{port}"
+
+
+class LocalHTTPRequestHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        self.server.requests.append(("GET", self.path, dict(self.headers)))
+        if self.path in self.server.streams:
+            return self.stream()
+        if self.path in self.server.files:
+            return self.serve_file()
+        responses = self.server.responses.get(self.path, [(404, {}, b"")])
+        status, headers, body = responses[0]
+        if len(responses) > 1:
+            responses.pop(0)
+        self.send_response(status)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def serve_file(self):
+        content = self.server.files[self.path]
+        start, end = 0, len(content) - 1
+        match = re.fullmatch(r"bytes=(\d+)-(\d*)", self.headers.get("Range", ""))
+        if match and self.server.ranges:
+            start = int(match[1])
+            if match[2]:
+                end = min(int(match[2]), end)
+            if start >= len(content):
+                self.send_response(416)
+                self.send_header("Content-Range", f"bytes */{len(content)}")
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+            self.send_response(206)
+            self.send_header("Content-Range", f"bytes {start}-{end}/{len(content)}")
+        else:
+            self.send_response(200)
+        body = content[start : end + 1]
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("ETag", f'"{hashlib.sha256(content).hexdigest()[:16]}"')
+        if self.server.ranges:
+            self.send_header("Accept-Ranges", "bytes")
+        self.end_headers()
+        if self.server.truncations[self.path] > 0:
+            self.server.truncations[self.path] -= 1
+            body = body[: len(body) // 2]
+            self.close_connection = True
+        try:
+            self.wfile.write(body)
+        except OSError:
+            self.close_connection = True
+
+    def stream(self):
+        subscriber = queue.Queue()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        self.server.subscribers[self.path].append(subscriber)
+        try:
+            while (data := subscriber.get()) is not None:
+                self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+                self.wfile.flush()
+            self.wfile.write(b"0\r\n\r\n")
+        except OSError:
+            pass
+        finally:
+            self.server.subscribers[self.path].remove(subscriber)
+        self.close_connection = True
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def http_server():
+    server = LocalHTTPServer()
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    for path in list(server.subscribers):
+        server.close_streams(path)
+    server.shutdown()
+    server.server_close()
+
+
+class ServiceRunner:
+    """
+    Serves an exporter_runtime Service on a local port, from an event loop
+    running in a background thread, so that tests can query it with requests.
+    """
+
+    def __init__(self, service):
+        self.service = service
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, daemon=True)
+        self.thread.start()
+        port = self.run(service.start("127.0.0.1", 0))
+        self.url = f"http://127.0.0.1:{port}"
+        self.session = requests.Session()
+
+    def run(self, coroutine):
+        """Run coroutine in the service's event loop and return its result"""
+        return asyncio.run_coroutine_threadsafe(coroutine, self.loop).result()
+
+    def get(self, path, **kwargs):
+        return self.session.get(f"{self.url}{path}", **kwargs)
+
+    def post(self, path, **kwargs):
+        return self.session.post(f"{self.url}{path}", **kwargs)
+
+    def stop(self):
+        self.run(self.service.stop())
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+        self.loop.close()
+
+
+@pytest.fixture
+def run_service():
+    """Start serving the Service passed to the fixture, until the test ends"""
+    runners = []
+
+    def run_service(service):
+        runners.append(ServiceRunner(service))
+        return runners[-1]
+
+    yield run_service
+    for runner in runners:
+        runner.stop()
@@ -0,0 +1,430 @@
+import collections
+import itertools
+import json
+import os
+import random
+import re
+
+import pytest
+
+
+def test_import_reads_nothing(config_generator):
+    # Importing must not need a pod environment or the secret volume
+    assert "accounts" not in vars(config_generator.CONFIG)
+    assert "nodes" not in vars(config_generator.CONFIG)
+
+
+def make_config(config_generator, tmp_path, **env):
+    environ = {
+        "CHAIN_PARAMS": json.dumps({"network": {"chain_name": "mainnet"}}),
+        "NODE_GLOBALS": "{}",
+        "NODES": json.dumps(
+            {
+                "rolling-node": {"instances": [{}, {"is_bootstrap_node": True}]},
+                "baking-node": {
+                    "runs": ["octez_node", "baker"],
+                    "instances": [{"bake_using_accounts": ["baker0"]}],
+                },
+                "unused": None,
+            }
+        ),
+        **env,
+    }
+    return config_generator.Config(
+        environ=environ,
+        secret_volume=str(tmp_path),
+        etc_dir=str(tmp_path / "etc"),
+        var_dir=str(tmp_path / "var"),
+    )
+
+
+def test_node_pod_config(config_generator, tmp_path):
+    config = make_config(
+        config_generator, tmp_path, MY_POD_NAME="baking-node-0", MY_POD_TYPE="node"
+    )
+    assert config.my_pod_config == {"bake_using_accounts": ["baker0"]}
+    assert config.my_pod_class["runs"] == ["octez_node", "baker"]
+    assert list(config.all_nodes) == [
+        "rolling-node-0",
+        "rolling-node-1",
+        "baking-node-0",
+    ]
+    assert list(config.baking_nodes) == ["baking-node-0"]
+    assert config.data_dir == f"{tmp_path}/var/node/data"
+
+
+def test_autoscaled_node_uses_its_node_class(config_generator, tmp_path):
+    config = make_config(
+        config_generator,
+        tmp_path,
+        MY_POD_NAME="rolling-node-7",
+        MY_POD_TYPE="node",
+        MY_NODE_CLASS="rolling-node",
+    )
+    assert config.my_pod_config == {}
+    assert config.my_pod_class is config.nodes["rolling-node"]
+
+
+def test_signing_pod_does_not_load_nodes(config_generator, tmp_path):
+    config = make_config(
+        config_generator,
+        tmp_path,
+        MY_POD_NAME="octez-signer-0",
+        MY_POD_TYPE="signing",
+        OCTEZ_SIGNERS=json.dumps({"octez-signer-0": {"accounts": ["baker0"]}}),
+        NODES="this is not parsed",
+    )
+    assert config.my_pod_config == {"accounts": ["baker0"]}
+    assert "nodes" not in vars(config)
+
+
+def test_accounts_are_read_lazily(config_generator, tmp_path):
+    config = make_config(config_generator, tmp_path)
+    (tmp_path / "ACCOUNTS").write_text(json.dumps({"baker0": {"key": "edpk..."}}))
+    assert config.accounts == {"baker0": {"key": "edpk..."}}
+
+
+def use_config(config_generator, tmp_path, **env):
+    env = {"MY_POD_NAME": "rolling-node-0", "MY_POD_TYPE": "node", **env}
+    config = make_config(config_generator, tmp_path, **env)
+    config.fqdn = "rolling-node-0.rolling-node.tezos.svc.cluster.local"
+    config_generator.CONFIG = config
+    return config
+
+
+def test_fingerprint_covers_the_environment(config_generator):
+    # Every variable the generated files depend on, but the tuning knobs
+    source = open(config_generator.__file__).read()
+    read = set(
+        re.findall(r'(?:environ(?:\.get\()?\[?|json_env\()\s*"([A-Z_]+)"', source)
+    )
+    tuning = {
+        "BOOTSTRAP_CONTRACTS_CACHE_DIR",
+        "BOOTSTRAP_CONTRACT_FETCH_WORKERS",
+        "KEY_DERIVATION_BATCH_SIZE",
+        "KEY_DERIVATION_WORKERS",
+        "SNAPSHOT_METADATA_CACHE_DIR",
+    }
+    assert read - tuning == set(config_generator.FINGERPRINT_ENV_VARS)
+
+
+def test_fingerprint_changes_with_each_input(config_generator, tmp_path):
+    (tmp_path / "ACCOUNTS").write_text(json.dumps({"baker0": {"key": "edpk"}}))
+    use_config(config_generator, tmp_path)
+    fingerprint = config_generator.inputs_fingerprint()
+    assert config_generator.inputs_fingerprint() == fingerprint
+
+    fingerprints = {fingerprint}
+    for name in config_generator.FINGERPRINT_ENV_VARS:
+        use_config(config_generator, tmp_path, **{name: "changed"})
+        fingerprints.add(config_generator.inputs_fingerprint())
+    assert len(fingerprints) == len(config_generator.FINGERPRINT_ENV_VARS) + 1
+
+    config = use_config(config_generator, tmp_path)
+    config.fqdn = "rolling-node-0.rolling-node.other.svc.cluster.local"
+    fingerprints.add(config_generator.inputs_fingerprint())
+
+    use_config(config_generator, tmp_path)
+    (tmp_path / "ACCOUNTS").write_text(json.dumps({"baker0": {"key": "edpk2"}}))
+    fingerprints.add(config_generator.inputs_fingerprint())
+
+    # The network config mounted by the chart
+    (tmp_path / "etc/data").mkdir(parents=True)
+    (tmp_path / "etc/data/config.json").write_text("{}")
+    fingerprints.add(config_generator.inputs_fingerprint())
+    assert len(fingerprints) == len(config_generator.FINGERPRINT_ENV_VARS) + 4
+
+
+def test_unchanged_inputs_skip_generation(config_generator, tmp_path, monkeypatch):
+    runs = []
+
+    def generate():
+        runs.append(1)
+        for path in config_generator.generated_files():
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            open(path, "w").close()
+
+    monkeypatch.setattr(config_generator, "generate", generate)
+    config = use_config(config_generator, tmp_path)
+    os.makedirs(config.var_dir)
+
+    config_generator.main()
+    config_generator.main()
+    assert len(runs) == 1
+
+    # A deleted output is generated again
+    os.remove(f"{config.client_dir}/public_keys")
+    config_generator.main()
+    assert len(runs) == 2
+    config_generator.main()
+    assert len(runs) == 2
+
+    # So is everything when an input changes
+    use_config(config_generator, tmp_path, NODE_IDENTITIES="{}")
+    config_generator.main()
+    assert len(runs) == 3
+
+
+def test_key_derivation_workers(config_generator, tmp_path):
+    config = make_config(config_generator, tmp_path)
+    assert 1 <= config.key_derivation_workers <= len(os.sched_getaffinity(0))
+    config = make_config(config_generator, tmp_path, KEY_DERIVATION_WORKERS="3")
+    assert config.key_derivation_workers == 3
+
+
+def test_parallel_key_derivation(config_generator):
+    encoded_keys = [
+        "edsk3gUfUPyBSfrS9CCgmCiQsTCHGkviBDusMxDJstFtojtc1zcpsh",
+        "edsk2hEYzoqjDNKMkbRQ5BneeMNz1AtTpwZLix7NLh8u5YjJH15gtZ",
+        "spsk2t9u4rFhToRHRhMiaFok38prpTN45k2Ly2iYarEk23oz7cF341",
+        "p2sk2awUAtaUZqr2t6Wrr65koX4okAJ7evVSasc38TtamDgErFimyW",
+        "edpkuBknW28nW72KG6RoHtYW7p12T6GKc7nAbwYX5m8Wd9sDVC9yav",
+        "sppk7auceAFrff6ffTkA61JpGPWbAmxVfnTwHbD98sfX2Ftt8LWEjN7",
+        "p2pk66HDXqvZ493PXa83hsJCCU9ZPm14qZ5gEJCAsW4jS6kt8PBraZ2",
+    ] * 3
+    serial = config_generator.derive_keys(encoded_keys, workers=1, batch_size=2)
+    assert serial == [config_generator.derive_key(k) for k in encoded_keys]
+    parallel = config_generator.derive_keys(encoded_keys, workers=3, batch_size=2)
+    assert parallel == serial
+
+
+def cached_contracts(references):
+    contracts = []
+    for reference in references:
+        prefix, path = reference.split("#", 1)
+        assert prefix == "cached_contract"
+        with open(path) as f:
+            contracts.append(json.load(f))
+    return contracts
+
+
+def test_bootstrap_contracts_fetch(config_generator, tmp_path, http_server):
+    config_generator.HTTP_BACKOFF_FACTOR = 0
+    contracts = [{"delegate": f"tz1{i}", "script": {"code": [i]}} for i in range(5)]
+    for i, contract in enumerate(contracts):
+        http_server.responses[f"/contract{i}.json"] = [
+            (200, {"ETag": f'"v{i}"'}, json.dumps(contract).encode()),
+            (304, {"ETag": f'"v{i}"'}, b""),
+        ]
+    # Transient errors are retried
+    http_server.responses["/contract3.json"].insert(0, (503, {}, b""))
+    urls = [f"{http_server.url}/contract{i}.json" for i in range(5)]
+    cache_dir = str(tmp_path / "cache")
+
+    fetched = config_generator.fetch_bootstrap_contracts(urls, cache_dir, workers=3)
+    assert cached_contracts(fetched) == contracts
+    assert len(http_server.requests) == 6
+
+    # The second run is revalidated and served from the cache, in the order of
+    # the urls
+    fetched = config_generator.fetch_bootstrap_contracts(urls[::-1], cache_dir)
+    assert cached_contracts(fetched) == contracts[::-1]
+    assert len(http_server.requests) == 11
+    assert {headers["If-None-Match"] for _, _, headers in http_server.requests[6:]} == {
+        f'"v{i}"' for i in range(5)
+    }
+
+    # A corrupted cache entry is downloaded again
+    with open(tmp_path / "cache" / "index.json") as f:
+        sha256 = json.load(f)[urls[0]]["sha256"]
+    (tmp_path / "cache" / f"{sha256}.json").write_text("{}")
+    http_server.responses["/contract0.json"].insert(
+        0, (200, {"ETag": '"v0"'}, json.dumps(contracts[0]).encode())
+    )
+    fetched = config_generator.fetch_bootstrap_contracts(urls[:1], cache_dir)
+    assert cached_contracts(fetched) == contracts[:1]
+    _, _, headers = http_server.requests[-1]
+    assert "If-None-Match" not in headers
+
+    # So is a contract changed at the same url
+    changed = {"delegate": "tz1changed", "script": {"code": []}}
+    http_server.responses["/contract1.json"] = [
+        (200, {"ETag": '"v1-changed"'}, json.dumps(changed).encode())
+    ]
+    fetched = config_generator.fetch_bootstrap_contracts(urls[:2], cache_dir)
+    assert cached_contracts(fetched) == [contracts[0], changed]
+
+    # The contracts are only read to be written into parameters.json
+    path = tmp_path / "parameters.json"
+    parameters = {"bootstrap_accounts": [], "bootstrap_contracts": fetched}
+    config_generator.write_protocol_parameters_json(parameters, path)
+    written = json.loads(path.read_text())
+    assert written["bootstrap_contracts"] == [contracts[0], changed]
+
+
+def test_bootstrap_contracts_fetch_failure(config_generator, tmp_path, http_server):
+    config_generator.HTTP_RETRIES = 1
+    with pytest.raises(Exception):
+        config_generator.fetch_bootstrap_contracts(
+            [f"{http_server.url}/missing.json"], str(tmp_path)
+        )
+
+
+def test_fromfile_substitution(config_generator, tmp_path, monkeypatch):
+    monkeypatch.setattr(config_generator, "FROMFILE_CHUNK_SIZE", 7)
+    kernel = bytes(range(256)) * 3
+    (tmp_path / "kernel.wasm").write_bytes(kernel)
+    parameters = {
+        "bootstrap_accounts": [["edpk", "4000000"]],
+        "bootstrap_smart_rollups": [
+            {"kernel": f"fromfile#{tmp_path}/kernel.wasm", "pvm_kind": "wasm_2_0_0"},
+            {"kernel": "fromfile#/kernel/in/the/octez/image.wasm"},
+        ],
+        "kernels": [f"fromfile#{tmp_path}/kernel.wasm"],
+    }
+    path = tmp_path / "parameters.json"
+
+    config_generator.write_protocol_parameters_json(parameters, path)
+    written = json.loads(path.read_text())
+    rollups = written["bootstrap_smart_rollups"]
+    assert rollups[0] == {"kernel": kernel.hex(), "pvm_kind": "wasm_2_0_0"}
+    # Left for chain-initiator
+    assert rollups[1] == {"kernel": "fromfile#/kernel/in/the/octez/image.wasm"}
+    assert written["kernels"] == [kernel.hex()]
+    assert written["bootstrap_accounts"] == parameters["bootstrap_accounts"]
+
+
+def make_snapshot_metadata(count):
+    rng = random.Random(count)
+    return {
+        "data": [
+            {
+                "url": f"https://snapshots.example.com/{i}",
+                "chain_name": rng.choice(["mainnet", "ghostnet"]),
+                "history_mode": rng.choice(["rolling", "full", "archive"]),
+                "artifact_type": rng.choice(["tarball", "tezos-snapshot"]),
+                "block_height": rng.randrange(20),
+                "tezos_version": {"version": {"major": rng.choice([17, 18, 19])}},
+            }
+            for i in range(count)
+        ]
+    }
+
+
+def test_snapshot_index_lookup(config_generator):
+    all_snapshots = make_snapshot_metadata(300)
+    snapshot_index = config_generator.SnapshotIndex.from_metadata(all_snapshots)
+    snapshot_index = config_generator.SnapshotIndex.from_json(
+        json.loads(json.dumps(snapshot_index.to_json()))
+    )
+
+    for chain_name, history_mode, artifact_type, octez_version in itertools.product(
+        ["mainnet", "ghostnet", "oxfordnet"],
+        ["rolling", "full", "archive"],
+        ["tarball", "tezos-snapshot"],
+        [None, "18", "20"],
+    ):
+        # The filtering and sorting the index replaces
+        matching = [
+            s
+            for s in all_snapshots["data"]
+            if s["history_mode"] == history_mode
+            and s["artifact_type"] == artifact_type
+            and s["chain_name"] == chain_name
+        ]
+        if octez_version:
+            version_matching = [
+                s
+                for s in matching
+                if int(octez_version) == s["tezos_version"]["version"]["major"]
+            ]
+            if version_matching:
+                matching = version_matching
+        matching.sort(key=lambda s: s["block_height"])
+        expected = matching[-1] if matching else None
+
+        assert expected == snapshot_index.lookup(
+            chain_name, history_mode, artifact_type, octez_version
+        )
+
+
+def test_snapshot_metadata_revalidation(config_generator, tmp_path, http_server):
+    all_snapshots = make_snapshot_metadata(10)
+    snapshot = all_snapshots["data"][0]
+    fields = [snapshot[f] for f in ("chain_name", "history_mode", "artifact_type")]
+    http_server.responses["/tezos-snapshots.json"] = [
+        (200, {"ETag": '"v1"'}, json.dumps(all_snapshots).encode()),
+        (304, {"ETag": '"v1"'}, b""),
+    ]
+    url = f"{http_server.url}/tezos-snapshots.json"
+
+    first = config_generator.fetch_snapshot_index(url, str(tmp_path))
+    second = config_generator.fetch_snapshot_index(url, str(tmp_path))
+    assert first.latest == second.latest
+    assert first.lookup(*fields) == second.lookup(*fields) is not None
+
+    (_, _, first_headers), (_, _, second_headers) = http_server.requests
+    assert "If-None-Match" not in first_headers
+    assert second_headers["If-None-Match"] == '"v1"'
+
+    # A missing or corrupted cached index is downloaded again, unconditionally
+    (index_path,) = tmp_path.glob("*.index.json")
+    for corrupt in (index_path.unlink, lambda: index_path.write_text("{")):
+        corrupt()
+        http_server.responses["/tezos-snapshots.json"].insert(
+            0, (304, {"ETag": '"v1"'}, b"")
+        )
+        http_server.responses["/tezos-snapshots.json"].insert(
+            1, (200, {"ETag": '"v1"'}, json.dumps(all_snapshots).encode())
+        )
+        third = config_generator.fetch_snapshot_index(url, str(tmp_path))
+        assert third.lookup(*fields) == first.lookup(*fields)
+        _, _, headers = http_server.requests[-1]
+        assert "If-None-Match" not in headers
+    assert sorted(p.name[64:] for p in tmp_path.iterdir()) == [
+        ".index.json",
+        ".meta.json",
+    ]
+
+
+def bootstrap_fan_in(config_generator, nodes, bootstrap_nodes, count):
+    fan_in = collections.Counter({name: 0 for name in bootstrap_nodes})
+    for name in nodes:
+        peers = config_generator.select_bootstrap_peers(
+            name, [b for b in bootstrap_nodes if b != name], count
+        )
+        assert len(peers) == len(set(peers)) == min(count, len(bootstrap_nodes))
+        fan_in.update(peers)
+    return fan_in
+
+
+def test_bootstrap_peers_fan_in_simulation(config_generator):
+    # 500 nodes, of which 16 bootstrap nodes in 3 classes, each listing 3 peers
+    node_classes = {"rolling": 300, "archive": 100, "baking": 100}
+    bootstrap_counts = {"rolling": 8, "archive": 4, "baking": 4}
+    nodes = [f"{cl}-{i}" for cl, count in node_classes.items() for i in range(count)]
+    bootstrap_nodes = [
+        f"{cl}-{i}" for cl, count in bootstrap_counts.items() for i in range(count)
+    ]
+
+    fan_in = bootstrap_fan_in(config_generator, nodes, bootstrap_nodes, 3)
+    print("\nfan-in per bootstrap node (all-to-all would be ~500):")
+    for name, connections in sorted(fan_in.items()):
+        print(f"  {name}: {connections}")
+
+    # Every node connects to one bootstrap node of each class
+    for node_class, count in bootstrap_counts.items():
+        class_fan_in = [fan_in[b] for b in bootstrap_nodes if b.startswith(node_class)]
+        assert sum(class_fan_in) == len(nodes)
+        mean = len(nodes) / count
+        assert max(class_fan_in) < 1.5 * mean
+        assert min(class_fan_in) > 0.5 * mean
+
+    # Selection is deterministic
+    assert fan_in == bootstrap_fan_in(config_generator, nodes, bootstrap_nodes, 3)
+
+
+def test_bootstrap_peers_are_stable(config_generator):
+    bootstrap_nodes = [f"node-{i}" for i in range(20)] + ["archive-0", "archive-1"]
+    removed = "node-7"
+    for i in range(200):
+        before = config_generator.select_bootstrap_peers(
+            f"rolling-{i}", bootstrap_nodes, 4
+        )
+        after = config_generator.select_bootstrap_peers(
+            f"rolling-{i}", [b for b in bootstrap_nodes if b != removed], 4
+        )
+        if removed not in before:
+            assert before == after
+        else:
+            assert len(set(before) & set(after)) == 3
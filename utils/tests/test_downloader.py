@@ -0,0 +1,211 @@
+import hashlib
+import json
+import random
+
+import pytest
+
+from conftest import load_script
+
+
+@pytest.fixture
+def downloader():
+    return load_script("downloader.py", "downloader")
+
+
+@pytest.fixture
+def artifact(http_server):
+    content = random.Random(0).randbytes(1 << 20) + b"tail"
+    http_server.files["/snapshot"] = content
+    return content
+
+
+def range_requests(http_server):
+    return [
+        headers.get("Range")
+        for _, path, headers in http_server.requests
+        if path == "/snapshot"
+    ]
+
+
+def test_ranged_download(downloader, http_server, artifact, tmp_path, capsys):
+    output = tmp_path / "chain.snapshot"
+    sha256 = downloader.download(
+        f"{http_server.url}/snapshot",
+        output,
+        hashlib.sha256(artifact).hexdigest(),
+        connections=4,
+        chunk_size=100_000,
+    )
+    assert sha256 == hashlib.sha256(artifact).hexdigest()
+    assert output.read_bytes() == artifact
+    # A probe, then one request per chunk
+    assert len(range_requests(http_server)) == 1 + 11
+    assert "bytes=1000000-1048579" in range_requests(http_server)
+    assert f"Downloaded {len(artifact)} bytes in" in capsys.readouterr().out
+
+
+def test_broken_connections_are_resumed(
+    downloader, http_server, artifact, tmp_path, monkeypatch
+):
+    monkeypatch.setattr(downloader.time, "sleep", lambda _: None)
+    http_server.truncations["/snapshot"] = 3
+    output = tmp_path / "chain.snapshot"
+    downloader.download(
+        f"{http_server.url}/snapshot", output, connections=2, chunk_size=400_000
+    )
+    assert output.read_bytes() == artifact
+    # The probe isn't affected, the first two chunks are retried from about
+    # where their responses broke
+    requests = range_requests(http_server)
+    assert len(requests) == 1 + 3 + 2
+    assert "bytes=196608-399999" in requests
+    assert "bytes=596608-799999" in requests
+
+
+def test_no_range_support(downloader, http_server, artifact, tmp_path):
+    http_server.ranges = False
+    output = tmp_path / "chain.snapshot"
+    downloader.download(f"{http_server.url}/snapshot", output, connections=4)
+    assert output.read_bytes() == artifact
+    assert len(range_requests(http_server)) == 2
+
+
+def test_checksum_mismatch(downloader, http_server, artifact, tmp_path):
+    with pytest.raises(downloader.ChecksumError):
+        downloader.download(
+            f"{http_server.url}/snapshot", tmp_path / "chain.snapshot", "0" * 64
+        )
+
+
+def interrupt_after(downloader, monkeypatch, chunk_count):
+    """Make downloads fail, as if the container was killed, at chunk_count"""
+    download_chunk = downloader.RangedDownload.download_chunk
+
+    def interrupted(self, session, url, fd, index):
+        if index >= chunk_count:
+            raise downloader.requests.ConnectionError("Interrupted")
+        return download_chunk(self, session, url, fd, index)
+
+    monkeypatch.setattr(downloader.RangedDownload, "download_chunk", interrupted)
+
+
+def test_interrupted_download_is_resumed(
+    downloader, http_server, artifact, tmp_path, monkeypatch
+):
+    output = tmp_path / "chain.snapshot"
+    url = f"{http_server.url}/snapshot"
+    with monkeypatch.context() as m:
+        interrupt_after(downloader, m, 4)
+        with pytest.raises(downloader.requests.ConnectionError):
+            downloader.download(url, output, connections=1, chunk_size=100_000)
+    assert (tmp_path / "chain.snapshot.progress").exists()
+
+    http_server.requests.clear()
+    sha256 = downloader.download(
+        url,
+        output,
+        hashlib.sha256(artifact).hexdigest(),
+        connections=4,
+        chunk_size=100_000,
+    )
+    assert sha256 == hashlib.sha256(artifact).hexdigest()
+    assert output.read_bytes() == artifact
+    # Only the chunks missing are downloaded
+    requests = range_requests(http_server)
+    assert len(requests) == 1 + 7
+    assert "bytes=300000-399999" not in requests
+    assert "bytes=400000-499999" in requests
+    assert not (tmp_path / "chain.snapshot.progress").exists()
+
+
+def test_corrupted_chunks_are_downloaded_again(
+    downloader, http_server, artifact, tmp_path, monkeypatch, capsys
+):
+    output = tmp_path / "chain.snapshot"
+    url = f"{http_server.url}/snapshot"
+    with monkeypatch.context() as m:
+        interrupt_after(downloader, m, 4)
+        with pytest.raises(downloader.requests.ConnectionError):
+            downloader.download(url, output, connections=1, chunk_size=100_000)
+    with open(output, "r+b") as f:
+        f.seek(150_000)
+        f.write(b"corrupted")
+
+    http_server.requests.clear()
+    sha256 = downloader.download(url, output, connections=4, chunk_size=100_000)
+    assert sha256 == hashlib.sha256(artifact).hexdigest()
+    assert output.read_bytes() == artifact
+    requests = range_requests(http_server)
+    assert len(requests) == 1 + 7 + 1
+    assert "bytes=100000-199999" in requests
+    assert "Chunk 1 doesn't match its sha256" in capsys.readouterr().out
+
+
+@pytest.mark.parametrize("change", ["artifact", "chunk_size"])
+def test_changed_download_starts_afresh(
+    downloader, http_server, artifact, tmp_path, monkeypatch, change
+):
+    output = tmp_path / "chain.snapshot"
+    url = f"{http_server.url}/snapshot"
+    with monkeypatch.context() as m:
+        interrupt_after(downloader, m, 4)
+        with pytest.raises(downloader.requests.ConnectionError):
+            downloader.download(url, output, connections=1, chunk_size=100_000)
+
+    chunk_size = 100_000
+    if change == "artifact":
+        # Same size, another ETag
+        artifact = artifact[::-1]
+        http_server.files["/snapshot"] = artifact
+    else:
+        chunk_size = 200_000
+    http_server.requests.clear()
+    sha256 = downloader.download(url, output, connections=4, chunk_size=chunk_size)
+    assert sha256 == hashlib.sha256(artifact).hexdigest()
+    assert output.read_bytes() == artifact
+    assert len(range_requests(http_server)) == 1 + -(-len(artifact) // chunk_size)
+
+
+@pytest.mark.parametrize("hash_buffer_size", [0, 1 << 20])
+def test_chunks_are_hashed_as_downloaded(
+    downloader, http_server, artifact, tmp_path, monkeypatch, hash_buffer_size
+):
+    reads = []
+    pread = downloader.os.pread
+    monkeypatch.setattr(
+        downloader.os, "pread", lambda *args: reads.append(args) or pread(*args)
+    )
+    sha256 = downloader.download(
+        f"{http_server.url}/snapshot",
+        tmp_path / "chain.snapshot",
+        connections=4,
+        chunk_size=100_000,
+        hash_buffer_size=hash_buffer_size,
+    )
+    assert sha256 == hashlib.sha256(artifact).hexdigest()
+    # Beyond the hash buffer, chunks are read back from disk
+    assert bool(reads) == (hash_buffer_size == 0)
+
+
+def test_checkpoint_log(downloader, http_server, artifact, tmp_path, monkeypatch):
+    output = tmp_path / "chain.snapshot"
+    progress = tmp_path / "chain.snapshot.progress"
+    url = f"{http_server.url}/snapshot"
+    with monkeypatch.context() as m:
+        interrupt_after(downloader, m, 4)
+        with pytest.raises(downloader.requests.ConnectionError):
+            downloader.download(url, output, connections=1, chunk_size=100_000)
+    # The identity of the download, then a line appended per chunk
+    lines = progress.read_text().splitlines()
+    assert json.loads(lines[0])["chunk_size"] == 100_000
+    assert [line.split()[0] for line in lines[1:]] == ["0", "1", "2", "3"]
+
+    # Forgotten chunks and a line cut short by a crash are replayed
+    with open(progress, "a") as f:
+        f.write("2 -\n3 " + "0" * 20)
+    checkpoint = downloader.Checkpoint(str(progress))
+    chunks = checkpoint.load(json.loads(lines[0]))
+    assert sorted(chunks) == [0, 1, 3]
+    checkpoint.close()
+    # and compacted
+    assert progress.read_text().splitlines() == [lines[0], lines[1], lines[2], lines[4]]
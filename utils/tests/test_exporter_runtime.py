@@ -0,0 +1,93 @@
+import asyncio
+
+import pytest
+
+pytest.importorskip("aiohttp")
+
+import aiohttp
+from aiohttp import web
+
+from exporter_runtime import Registry, Service
+
+
+def test_registry_exposition():
+    registry = Registry()
+    requests = registry.counter("requests_total", "Requests.", ["path"])
+    registry.gauge("up", "Whether it is up.", collect=lambda: 1)
+    registry.gauge("absent", "Not known yet.", collect=lambda: None)
+    duration = registry.histogram(
+        "duration_seconds", "Durations.", ["path"], buckets=(0.1, 1)
+    )
+    requests.inc("/a")
+    requests.inc("/a")
+    requests.inc('/"b"\n')
+    duration.observe(0.05, "/a")
+    duration.observe(0.5, "/a")
+    registry.add_collector(lambda: ["relayed 1"])
+
+    assert registry.exposition().splitlines() == [
+        "# HELP requests_total Requests.",
+        "# TYPE requests_total counter",
+        'requests_total{path="/\\"b\\"\\n"} 1',
+        'requests_total{path="/a"} 2',
+        "# HELP up Whether it is up.",
+        "# TYPE up gauge",
+        "up 1",
+        "# HELP absent Not known yet.",
+        "# TYPE absent gauge",
+        "# HELP duration_seconds Durations.",
+        "# TYPE duration_seconds histogram",
+        'duration_seconds_bucket{path="/a",le="0.1"} 1',
+        'duration_seconds_bucket{path="/a",le="1"} 2',
+        'duration_seconds_bucket{path="/a",le="+Inf"} 2',
+        'duration_seconds_sum{path="/a"} 0.55',
+        'duration_seconds_count{path="/a"} 2',
+        "relayed 1",
+    ]
+    with pytest.raises(Exception, match="already registered"):
+        registry.gauge("up", "Again.")
+
+
+def test_service_lifecycle():
+    service = Service()
+    runs = []
+    entered = asyncio.Event()
+    release = asyncio.Event()
+
+    async def flaky():
+        runs.append(service.session)
+        if len(runs) % 2:
+            raise ValueError("fails every other run")
+
+    service.every(0.01, flaky)
+
+    @service.route("GET", "/slow")
+    async def slow(request):
+        entered.set()
+        await release.wait()
+        return web.Response(text="done")
+
+    async def scenario():
+        port = await service.start("127.0.0.1", 0)
+        async with aiohttp.ClientSession() as client:
+            # Failures don't stop the next runs, which share the connection pool
+            while len(runs) < 4:
+                await asyncio.sleep(0.01)
+            assert runs[0] is not None and all(s is runs[0] for s in runs)
+
+            # Requests in flight complete before the service stops
+            slow_response = asyncio.ensure_future(
+                client.get(f"http://127.0.0.1:{port}/slow")
+            )
+            await entered.wait()
+            stopping = asyncio.ensure_future(service.stop())
+            await asyncio.sleep(0.1)
+            assert not stopping.done()
+            release.set()
+            async with await slow_response as r:
+                assert await r.text() == "done"
+            await stopping
+        assert service.tasks == []
+        assert runs[0].closed
+
+    asyncio.run(scenario())
@@ -0,0 +1,169 @@
+import hashlib
+import io
+import random
+import tarfile
+
+import lz4.frame
+import pytest
+
+from conftest import load_script
+
+
+@pytest.fixture
+def extractor():
+    return load_script("extractor.py", "extractor")
+
+
+def tarball(files, frames=1):
+    """
+    An lz4 compressed tarball of files, a dict, or list of pairs, of names to
+    contents, None for directories, or ("->", target) for symbolic links
+    """
+    archive = io.BytesIO()
+    with tarfile.open(fileobj=archive, mode="w") as tar:
+        for name, content in files.items() if isinstance(files, dict) else files:
+            member = tarfile.TarInfo(name)
+            if isinstance(content, tuple):
+                member.type = tarfile.SYMTYPE
+                member.linkname = content[1]
+                tar.addfile(member)
+            elif content is None:
+                member.type = tarfile.DIRTYPE
+                member.mode = 0o755
+                tar.addfile(member)
+            else:
+                member.size = len(content)
+                member.mode = 0o644
+                tar.addfile(member, io.BytesIO(content))
+    data = archive.getvalue()
+    size = -(-len(data) // frames)
+    # With a content checksum, like the frames of the lz4 command line
+    return b"".join(
+        lz4.frame.compress(data[i : i + size], content_checksum=True)
+        for i in range(0, len(data), size)
+    )
+
+
+@pytest.fixture
+def node_files():
+    rand = random.Random(0)
+    files = {"node": None, "node/data": None, "node/data/context": None}
+    for i in range(200):
+        files[f"node/data/context/{i:04}"] = rand.randbytes(rand.randrange(4096))
+    files["node/data/store.big"] = rand.randbytes(3 << 20)
+    files["node/data/version.json"] = b'{ "version": "3.0" }'
+    return files
+
+
+def chunk_sha256(content, chunk_size):
+    return {
+        "chunk_size": chunk_size,
+        "sha256": [
+            hashlib.sha256(content[i : i + chunk_size]).hexdigest()
+            for i in range(0, len(content), chunk_size)
+        ],
+    }
+
+
+@pytest.mark.parametrize("frames", [1, 3])
+def test_extract(extractor, http_server, node_files, tmp_path, capsys, frames):
+    content = tarball(node_files, frames)
+    http_server.files["/tarball"] = content
+    sha256 = extractor.extract(
+        f"{http_server.url}/tarball",
+        tmp_path,
+        hashlib.sha256(content).hexdigest(),
+        chunk_sha256(content, 100_000),
+        writers=4,
+        buffers=2,
+    )
+    assert sha256 == hashlib.sha256(content).hexdigest()
+    for name, expected in node_files.items():
+        if expected is None:
+            assert (tmp_path / name).is_dir()
+        else:
+            assert (tmp_path / name).read_bytes() == expected
+    out = capsys.readouterr().out
+    assert "Extracted 202 files" in out
+    assert f"fetch: {len(content)} bytes" in out
+    assert "decompress: " in out and "waited" in out
+
+
+def test_extract_file(extractor, node_files, tmp_path):
+    content = tarball(node_files, 2)
+    (tmp_path / "chain.tarball").write_bytes(content)
+    sha256 = extractor.extract(str(tmp_path / "chain.tarball"), tmp_path / "data")
+    assert sha256 == hashlib.sha256(content).hexdigest()
+    for name, expected in node_files.items():
+        if expected is not None:
+            assert (tmp_path / "data" / name).read_bytes() == expected
+
+
+def test_checksum_mismatch(extractor, http_server, node_files, tmp_path):
+    http_server.files["/tarball"] = tarball(node_files)
+    with pytest.raises(extractor.ChecksumError):
+        extractor.extract(f"{http_server.url}/tarball", tmp_path, "0" * 64)
+
+
+def test_corrupted_chunk_aborts_extraction(
+    extractor, http_server, node_files, tmp_path
+):
+    content = tarball(node_files)
+    corrupted = bytearray(content)
+    corrupted[len(content) // 2] ^= 0xFF
+    http_server.files["/tarball"] = bytes(corrupted)
+    with pytest.raises(extractor.ChecksumError, match="chunk 1 "):
+        extractor.extract(
+            f"{http_server.url}/tarball",
+            tmp_path,
+            chunk_sha256=chunk_sha256(content, len(content) // 3 + 1),
+        )
+    # Nothing past the chunks checked was extracted
+    assert not (tmp_path / "node/data/version.json").exists()
+
+
+def test_corrupted_frame(extractor, http_server, node_files, tmp_path):
+    content = bytearray(tarball(node_files))
+    content[len(content) // 2] ^= 0xFF
+    http_server.files["/tarball"] = bytes(content)
+    with pytest.raises(RuntimeError, match="contentChecksum"):
+        extractor.extract(f"{http_server.url}/tarball", tmp_path)
+
+
+def test_refuses_to_extract_out_of_directory(extractor, http_server, tmp_path):
+    http_server.files["/tarball"] = tarball({"../escaped": b"data"})
+    with pytest.raises(Exception, match="Refusing to extract"):
+        extractor.extract(f"{http_server.url}/tarball", tmp_path / "data")
+    assert not (tmp_path / "escaped").exists()
+
+
+@pytest.mark.parametrize("target", ["../../outside", "{tmp_path}/outside"])
+def test_refuses_to_extract_through_symlinks(extractor, http_server, tmp_path, target):
+    (tmp_path / "outside").mkdir()
+    (tmp_path / "outside/passwd").write_text("root")
+    target = target.format(tmp_path=tmp_path)
+    http_server.files["/tarball"] = tarball(
+        {"node": None, "node/link": ("->", target), "node/link/passwd": b"data"}
+    )
+    data = tmp_path / "data"
+    with pytest.raises(Exception, match="Refusing to extract node/link/passwd"):
+        extractor.extract(f"{http_server.url}/tarball", data)
+    assert (tmp_path / "outside/passwd").read_text() == "root"
+
+
+def test_replaces_symlinks_by_files(extractor, http_server, tmp_path):
+    (tmp_path / "passwd").write_text("root")
+    http_server.files["/tarball"] = tarball(
+        [
+            ("node", None),
+            ("node/link", ("->", str(tmp_path / "passwd"))),
+            ("node/data", None),
+            ("node/inside", ("->", "data")),
+            ("node/inside/config.json", b"{}"),
+            ("node/link", b"data"),
+        ]
+    )
+    extractor.extract(f"{http_server.url}/tarball", tmp_path / "data")
+    assert (tmp_path / "passwd").read_text() == "root"
+    assert (tmp_path / "data/node/link").read_bytes() == b"data"
+    assert (tmp_path / "data/node/data/config.json").read_bytes() == b"{}"
@@ -0,0 +1,198 @@
+import json
+
+from conftest import load_script
+from octez_monitor import StreamMonitor
+from test_octez_monitor import wait_until
+
+MONITOR_PATH = "/monitor/heads/main"
+MEMPOOL_PATHS = {
+    "applied": "/chains/main/mempool/monitor_operations?applied=true&refused=false",
+    "refused": "/chains/main/mempool/monitor_operations?applied=false&refused=true",
+}
+
+
+def operation(op_hash, *kinds):
+    return {"hash": op_hash, "contents": [{"kind": kind} for kind in kinds]}
+
+
+class FakeChain:
+    """Serves blocks and endorsing rights on a local server"""
+
+    def __init__(self, http_server):
+        self.http_server = http_server
+
+    def add_block(self, block_hash, predecessor, level, endorsements=2, included=()):
+        header = {
+            "hash": block_hash,
+            "level": level,
+            "predecessor": predecessor,
+            "timestamp": "2023-01-01T00:00:00Z",
+        }
+        block = {
+            "hash": block_hash,
+            "header": header,
+            "operations": [
+                [{"contents": [{"kind": "endorsement"}]}] * endorsements,
+                [],
+                [],
+                [{"contents": [{"kind": "transaction"}]}]
+                + [operation(op_hash, "transaction") for op_hash in included],
+            ],
+        }
+        responses = self.http_server.responses
+        top = "/chains/main/blocks"
+        responses[f"{top}/{block_hash}"] = [(200, {}, json.dumps(block).encode())]
+        responses[f"{top}/{block_hash}/header"] = [
+            (200, {}, json.dumps(header).encode())
+        ]
+        responses[f"{top}/{predecessor}/helpers/endorsing_rights"] = [
+            (200, {}, json.dumps([{}] * 4).encode())
+        ]
+        return header
+
+
+def test_block_logger(http_server):
+    logger_script = load_script("logger.py", "logger")
+    chain = FakeChain(http_server)
+    logs = []
+    mempool = logger_script.MempoolCounter(["applied", "refused"])
+    logger = logger_script.BlockLogger(
+        "node-0", mempool, top=f"{http_server.url}/chains/main"
+    )
+    logger.emit = logs.append
+    http_server.streams.add(MONITOR_PATH)
+    monitor = StreamMonitor(f"{http_server.url}{MONITOR_PATH}", logger.on_head)
+    monitor.start()
+    http_server.wait_for_subscribers(MONITOR_PATH)
+
+    def publish(header, count):
+        http_server.publish(MONITOR_PATH, header)
+        wait_until(lambda: len(logs) == count)
+
+    try:
+        mempool.add("applied", [operation("o1", "transaction")])
+        publish(chain.add_block("B1", "B0", 1), 1)
+        assert logs[0] == {
+            "logtype": "new-block-on-node",
+            "node": "node-0",
+            "level": 1,
+            "priority": None,
+            "hash": "B1",
+            "last_hash": None,
+            "predecessor": "B0",
+            "timestamp": "2023-01-01T00:00:00Z",
+            "reorg": False,
+            "operations": {"endorsement": 2, "transaction": 1},
+            "num_endorsements": 2,
+            "possible_endorsements": 4,
+            "percent_endorsed": 50,
+            "pending_operations": {"applied": {"transaction": 1}, "refused": {}},
+        }
+        # The operations of the block are no longer pending, though the
+        # mempool streams haven't reconnected yet
+        mempool.add("applied", [operation("o2", "transaction", "reveal")])
+        publish(chain.add_block("B2", "B1", 2, included=["o2"]), 2)
+        assert logs[1]["pending_operations"]["applied"] == {"transaction": 1}
+
+        # Heads missed by the stream are logged in order
+        chain.add_block("B3", "B2", 3)
+        chain.add_block("B4", "B3", 4)
+        publish(chain.add_block("B5", "B4", 5), 5)
+        assert [log["hash"] for log in logs] == ["B1", "B2", "B3", "B4", "B5"]
+        assert not any(log["reorg"] for log in logs)
+
+        # A head already logged is ignored
+        http_server.publish(MONITOR_PATH, chain.add_block("B5", "B4", 5))
+        # The node switches to a branch forking off B3
+        chain.add_block("B4'", "B3", 4)
+        publish(chain.add_block("B5'", "B4'", 5), 7)
+        assert [(log["hash"], log["reorg"]) for log in logs[5:]] == [
+            ("B4'", True),
+            ("B5'", True),
+        ]
+        publish(chain.add_block("B6'", "B5'", 6), 8)
+        assert logs[-1]["reorg"] is False
+    finally:
+        monitor.stop()
+        http_server.close_streams(MONITOR_PATH)
+
+
+def test_mempool_counter(http_server):
+    logger_script = load_script("logger.py", "logger")
+    mempool = logger_script.MempoolCounter(["applied", "refused"])
+    for path in MEMPOOL_PATHS.values():
+        http_server.streams.add(path)
+    monitors = mempool.monitors(
+        top=f"{http_server.url}/chains/main", min_backoff=0.05, max_backoff=0.05
+    )
+    for monitor in monitors:
+        monitor.start()
+    for path in MEMPOOL_PATHS.values():
+        http_server.wait_for_subscribers(path)
+
+    try:
+        http_server.publish(
+            MEMPOOL_PATHS["applied"],
+            [operation("o1", "transaction"), operation("o2", "transaction")],
+        )
+        http_server.publish(
+            MEMPOOL_PATHS["refused"], [operation("o3", "reveal", "transaction")]
+        )
+        # An operation sent twice on the same stream is counted once
+        http_server.publish(
+            MEMPOOL_PATHS["applied"],
+            [operation("o2", "transaction"), operation("o4", "delegation")],
+        )
+        expected = {
+            "applied": {"transaction": 2, "delegation": 1},
+            "refused": {"reveal": 1, "transaction": 1},
+        }
+        wait_until(lambda: mempool.snapshot() == expected)
+
+        # On a new head, the node flushes its mempool and ends the streams,
+        # which replay what is left of it once reconnected.
+        http_server.close_streams(MEMPOOL_PATHS["applied"])
+        wait_until(lambda: monitors[0].reconnections == 1)
+        http_server.wait_for_subscribers(MEMPOOL_PATHS["applied"])
+        # The counts are reset once reconnected, after the reconnection counted
+        wait_until(lambda: mempool.snapshot()["applied"] == {})
+        http_server.publish(MEMPOOL_PATHS["applied"], [operation("o4", "delegation")])
+        wait_until(
+            lambda: mempool.snapshot()
+            == {"applied": {"delegation": 1}, "refused": expected["refused"]}
+        )
+    finally:
+        for monitor in monitors:
+            monitor.stop()
+        for path in MEMPOOL_PATHS.values():
+            http_server.close_streams(path)
+
+
+def test_octez_17_mempool_classes(http_server):
+    logger_script = load_script("logger.py", "logger")
+    assert {"validated", "unprocessed"} <= set(logger_script.MEMPOOL_CLASSES)
+    mempool = logger_script.MempoolCounter(["validated", "refused", "unprocessed"])
+    top = f"{http_server.url}/chains/main"
+    # unprocessed can't be streamed
+    assert [monitor.url for monitor in mempool.monitors(top=top)] == [
+        f"{top}/mempool/monitor_operations?validated=true&refused=false",
+        f"{top}/mempool/monitor_operations?validated=false&refused=true",
+    ]
+
+    mempool.add("validated", [operation("o1", "transaction")])
+    pending = {
+        "validated": [],
+        "unprocessed": [
+            ["o2", operation("o2", "reveal", "transaction")],
+            ["o3", operation("o3", "delegation")],
+        ],
+    }
+    http_server.responses[
+        "/chains/main/mempool/pending_operations?validated=false&refused=false"
+    ] = [(200, {}, json.dumps(pending).encode())]
+    logger = logger_script.BlockLogger("node-0", mempool, top=top)
+    assert logger.pending_operations() == {
+        "validated": {"transaction": 1},
+        "refused": {},
+        "unprocessed": {"reveal": 1, "transaction": 1, "delegation": 1},
+    }
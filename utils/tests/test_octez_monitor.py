@@ -0,0 +1,74 @@
+import json
+import time
+
+from octez_monitor import HeadMonitor, JSONStreamDecoder, StreamMonitor
+
+
+def wait_until(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.01)
+
+
+def test_json_stream_decoder():
+    values = [{"level": i, "chain": "Ͳezos"} for i in range(50)] + [[1, 2], "end"]
+    stream = "".join(json.dumps(v, ensure_ascii=False) + "\n" for v in values)
+    stream = stream.encode()
+    for chunk_size in (1, 2, 7, 100, len(stream)):
+        decoder = JSONStreamDecoder()
+        decoded = []
+        for i in range(0, len(stream), chunk_size):
+            decoded += decoder.feed(stream[i : i + chunk_size])
+        assert decoded == values
+
+
+def test_head_monitor_reconnects(http_server):
+    path = "/monitor/heads/main"
+    http_server.streams.add(path)
+    monitor = HeadMonitor(http_server.url, min_backoff=0.01, max_backoff=0.05)
+    monitor.start()
+    try:
+        http_server.wait_for_subscribers(path)
+        assert monitor.latest_head() is None
+        http_server.publish(path, {"level": 1})
+        # A head may be split across chunks
+        http_server.publish(path, b'{"lev')
+        http_server.publish(path, b'el": 2}')
+        wait_until(lambda: monitor.latest_head() == {"level": 2})
+
+        # Heads received before the stream broke aren't trusted anymore
+        http_server.streams.remove(path)
+        http_server.close_streams(path)
+        wait_until(lambda: not monitor.connected.is_set())
+        assert monitor.latest_head() is None
+
+        http_server.streams.add(path)
+        http_server.wait_for_subscribers(path)
+        wait_until(monitor.connected.is_set)
+        assert monitor.latest_head() is None
+        http_server.publish(path, {"level": 3})
+        wait_until(lambda: monitor.latest_head() == {"level": 3})
+        assert monitor.reconnections >= 1
+    finally:
+        monitor.stop()
+        http_server.close_streams(path)
+        monitor.join(5)
+
+
+def test_streams_ended_by_the_node_reconnect_at_once(http_server):
+    # E.g. monitor_operations, ended without a value on a flush of an empty
+    # mempool
+    http_server.responses["/mempool"] = [(200, {}, b"")]
+    values = []
+    monitor = StreamMonitor(
+        f"{http_server.url}/mempool", values.append, min_backoff=0.01, max_backoff=30
+    )
+    monitor.start()
+    try:
+        # The backoff would be 10s by now if it grew
+        wait_until(lambda: monitor.reconnections >= 10)
+        assert values == []
+    finally:
+        monitor.stop()
+        monitor.join(5)
@@ -0,0 +1,169 @@
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+import requests
+
+from conftest import CHARTS_DIR, load_script
+
+pytest.importorskip("aiohttp")
+
+
+@pytest.fixture
+def pyrometer_exporter():
+    return load_script(
+        "pyrometer_exporter.py",
+        "pyrometer_exporter",
+        CHARTS_DIR / "pyrometer" / "scripts",
+    )
+
+
+def metrics(url):
+    body = requests.get(f"{url}/metrics").text
+    return dict(
+        line.rsplit(" ", 1) for line in body.splitlines() if not line.startswith("#")
+    )
+
+
+def post(client, events):
+    r = client.post("/pyrometer_webhook", json=events)
+    assert r.status_code == 200
+
+
+def test_webhook_events(pyrometer_exporter, run_service):
+    client = run_service(pyrometer_exporter.service)
+    assert metrics(client.url)["pyrometer_seconds_since_last_event"] == "+Inf"
+    post(
+        client,
+        [
+            {"kind": "baker_unhealthy", "baker": "tz1a"},
+            {"kind": "baker_unhealthy", "baker": "tz1b"},
+            {"kind": "missed_bake", "baker": "tz1b"},
+            # Unknown to the exporter, e.g. after a restart
+            {"kind": "baker_recovered", "baker": "tz1c"},
+        ],
+    )
+    post(client, [{"kind": "baker_recovered", "baker": "tz1a"}])
+    values = metrics(client.url)
+    assert values["pyrometer_unhealthy_bakers_total"] == "1"
+    assert values['pyrometer_baker_unhealthy{baker="tz1a"}'] == "0"
+    assert values['pyrometer_baker_unhealthy{baker="tz1b"}'] == "1"
+    assert values['pyrometer_baker_unhealthy{baker="tz1c"}'] == "0"
+    assert values['pyrometer_events_total{kind="baker_unhealthy"}'] == "2"
+    assert values['pyrometer_events_total{kind="baker_recovered"}'] == "2"
+    assert values['pyrometer_events_total{kind="missed_bake"}'] == "1"
+    assert float(values["pyrometer_seconds_since_last_event"]) < 60
+    assert float(values['pyrometer_baker_seconds_since_last_event{baker="tz1b"}']) < 60
+
+
+def test_bounded_bakers(pyrometer_exporter):
+    baker_events = pyrometer_exporter.BakerEvents(max_bakers=2)
+    baker_events.ingest(
+        [
+            {"kind": "baker_unhealthy", "baker": "tz1a"},
+            {"kind": "missed_bake", "baker": "tz1b"},
+        ]
+    )
+    # tz1b is the least recently active healthy baker
+    baker_events.ingest([{"kind": "missed_bake", "baker": "tz1c"}])
+    assert list(baker_events.bakers) == ["tz1a", "tz1c"]
+    # Unhealthy bakers are kept, beyond max_bakers if need be
+    baker_events.ingest(
+        [
+            {"kind": "baker_unhealthy", "baker": "tz1d"},
+            {"kind": "baker_unhealthy", "baker": "tz1e"},
+        ]
+    )
+    assert list(baker_events.bakers) == ["tz1a", "tz1d", "tz1e"]
+    assert baker_events.unhealthy_count == 3
+
+
+def test_malformed_events(pyrometer_exporter, run_service):
+    client = run_service(pyrometer_exporter.service)
+    post(
+        client,
+        [
+            {"kind": "missed_bake", "baker": "tz1a"},
+            {"baker": "tz1a"},
+            {"kind": None, "baker": "tz1a"},
+            {"kind": ["baker_unhealthy"], "baker": "tz1a"},
+            {"kind": "baker_unhealthy", "baker": 1},
+        ],
+    )
+    # Scrapes keep working
+    for _ in range(2):
+        values = metrics(client.url)
+        assert values['pyrometer_events_total{kind="unknown"}'] == "3"
+        assert values['pyrometer_events_total{kind="baker_unhealthy"}'] == "1"
+        assert values["pyrometer_unhealthy_bakers_total"] == "0"
+
+
+def test_event_kinds_cap(pyrometer_exporter):
+    baker_events = pyrometer_exporter.BakerEvents()
+    baker_events.ingest([{"kind": f"junk{i}", "baker": "tz1a"} for i in range(150)])
+    baker_events.ingest(
+        [
+            {"kind": "baker_unhealthy", "baker": "tz1a"},
+            {"kind": "baker_unhealthy", "baker": "tz1b"},
+        ]
+    )
+    assert baker_events.unhealthy_count == 2
+    baker_events.ingest([{"kind": "baker_recovered", "baker": "tz1a"}])
+    assert baker_events.unhealthy_count == 1
+    assert baker_events.bakers["tz1a"][0] is False
+    assert baker_events.event_counts["other"] == 50
+    assert baker_events.event_counts["baker_unhealthy"] == 2
+    assert baker_events.event_counts["baker_recovered"] == 1
+    assert len(baker_events.event_counts) == 103
+
+
+def test_load(pyrometer_exporter, run_service):
+    """Replay large webhook batches concurrently with scrapes"""
+    bakers = [f"tz1baker{i}" for i in range(5000)]
+    batches = [
+        json.dumps(
+            [
+                {"kind": kind, "baker": baker, "level": 1000 + i}
+                for baker in bakers
+                for kind in ("baker_unhealthy", "missed_endorsement")
+            ]
+        )
+        for i in range(4)
+    ]
+    batches.append(
+        json.dumps(
+            [{"kind": "baker_recovered", "baker": baker} for baker in bakers[::2]]
+        )
+    )
+    client = run_service(pyrometer_exporter.service)
+
+    def replay(batch):
+        r = requests.post(
+            f"{client.url}/pyrometer_webhook",
+            data=batch,
+            headers={"Content-Type": "application/json"},
+        )
+        assert r.status_code == 200
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(8) as executor:
+        scrapes = [executor.submit(metrics, client.url) for _ in range(20)]
+        list(executor.map(replay, batches[:-1]))
+    replay(batches[-1])
+    elapsed = time.perf_counter() - start
+    events = 4 * len(bakers) * 2 + len(bakers) // 2
+    print(f"{events} events in {elapsed:.2f}s, {events / elapsed:.0f} events/s")
+
+    for scrape in scrapes:
+        assert int(scrape.result()["pyrometer_unhealthy_bakers_total"]) >= 0
+    values = metrics(client.url)
+    assert values["pyrometer_unhealthy_bakers_total"] == str(len(bakers) // 2)
+    assert values['pyrometer_events_total{kind="baker_unhealthy"}'] == str(
+        4 * len(bakers)
+    )
+    assert values['pyrometer_events_total{kind="missed_endorsement"}'] == str(
+        4 * len(bakers)
+    )
+    assert values['pyrometer_baker_unhealthy{baker="tz1baker1"}'] == "1"
+    assert values['pyrometer_baker_unhealthy{baker="tz1baker2"}'] == "0"
@@ -0,0 +1,252 @@
+import asyncio
+import datetime
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+import requests
+
+from conftest import load_script
+from test_octez_monitor import wait_until
+
+pytest.importorskip("aiohttp")
+
+HEADER_PATH = "/chains/main/blocks/head/header"
+MONITOR_PATH = "/monitor/heads/main"
+
+
+def header(level, age=0):
+    timestamp = datetime.datetime.utcnow() - datetime.timedelta(seconds=age)
+    return {"level": level, "timestamp": timestamp.strftime("%Y-%m-%dT%H:%M:%SZ")}
+
+
+@pytest.fixture
+def sidecar(http_server):
+    sidecar = load_script("sidecar.py", "sidecar")
+    sidecar.NODE_URL = http_server.url
+    sidecar.head_monitor = sidecar.HeadMonitor(
+        http_server.url,
+        on_head=sidecar.head_state.observe,
+        min_backoff=0.01,
+        max_backoff=0.05,
+    )
+    yield sidecar
+    sidecar.head_monitor.stop()
+    http_server.close_streams(MONITOR_PATH)
+
+
+def json_body(value):
+    return json.dumps(value).encode()
+
+
+def header_requests(http_server):
+    return sum(path == HEADER_PATH for _, path, _ in http_server.requests)
+
+
+def test_is_synced_from_stream(sidecar, http_server, run_service):
+    http_server.streams.add(MONITOR_PATH)
+    sidecar.head_monitor.start()
+    http_server.wait_for_subscribers(MONITOR_PATH)
+    http_server.publish(MONITOR_PATH, header(10))
+    wait_until(sidecar.head_monitor.latest_head)
+
+    client = run_service(sidecar.service)
+    for _ in range(20):
+        assert client.get("/is_synced").status_code == 200
+    http_server.publish(MONITOR_PATH, header(11, age=3600))
+    wait_until(lambda: sidecar.head_monitor.latest_head()["level"] == 11)
+    assert client.get("/is_synced").status_code == 500
+    assert header_requests(http_server) == 0
+
+
+def test_is_synced_polls_when_stream_is_down(sidecar, http_server, run_service):
+    # The node doesn't serve the stream
+    sidecar.head_monitor.start()
+    sidecar.head_header_cache.ttl = 0
+    http_server.responses[HEADER_PATH] = [
+        (200, {}, json_body(header(10))),
+        (200, {}, json_body(header(0, age=3600))),
+        (200, {}, json_body(header(12, age=3600))),
+    ]
+
+    client = run_service(sidecar.service)
+    assert client.get("/is_synced").status_code == 200
+    # Level 0 means the chain isn't activated yet
+    assert client.get("/is_synced").status_code == 200
+    assert client.get("/is_synced").status_code == 500
+    assert header_requests(http_server) == 3
+
+
+def test_is_synced_node_down(sidecar, run_service):
+    sidecar.NODE_URL = "http://127.0.0.1:1"
+    client = run_service(sidecar.service)
+    response = client.get("/is_synced")
+    assert response.status_code == 500
+    assert "Could not connect to node" in response.text
+
+
+def test_single_flight_cache(sidecar):
+    async def slow_call():
+        calls.append(1)
+        await release.wait()
+        if len(calls) > 1:
+            raise ValueError("node down")
+        return {"level": len(calls)}
+
+    async def scenario():
+        gets = [asyncio.ensure_future(cache.get()) for _ in range(20)]
+        await asyncio.sleep(0.01)
+        assert cache.coalesced + cache.misses == 20
+        release.set()
+        assert await asyncio.gather(*gets) == [{"level": 1}] * 20
+        assert await cache.get() == {"level": 1}
+        assert cache.stats() == {"hits": 1, "coalesced": 19, "misses": 1}
+
+        # Errors are shared as well
+        await asyncio.sleep(0.2)
+        for _ in range(2):
+            with pytest.raises(ValueError):
+                await cache.get()
+        assert len(calls) == 2
+
+    release = asyncio.Event()
+    calls = []
+    cache = sidecar.SingleFlightCache(slow_call, ttl=0.2)
+    asyncio.run(scenario())
+
+
+def test_concurrent_probes_share_node_requests(sidecar, http_server, run_service):
+    http_server.responses[HEADER_PATH] = [(200, {}, json_body(header(10)))]
+    client = run_service(sidecar.service)
+
+    def probe(_):
+        return requests.get(f"{client.url}/is_synced").status_code
+
+    with ThreadPoolExecutor(max_workers=10) as executor:
+        assert set(executor.map(probe, range(100))) == {200}
+    # Well below one node request per probe
+    assert header_requests(http_server) <= 5
+    stats = client.get("/probe_cache").json()["head_header"]
+    assert stats["misses"] == header_requests(http_server)
+    assert stats["hits"] + stats["coalesced"] + stats["misses"] == 100
+
+
+@pytest.mark.parametrize(
+    "status, body, outcome",
+    [
+        (500, b"", "unreachable"),
+        (200, b"<html>", "invalid_response"),
+        (200, json_body({"hash": "BLa"}), "invalid_response"),
+    ],
+)
+def test_is_synced_invalid_response(
+    sidecar, http_server, run_service, status, body, outcome
+):
+    http_server.responses[HEADER_PATH] = [(status, {}, body)]
+    client = run_service(sidecar.service)
+    assert client.get("/is_synced").status_code == 500
+    metrics = parse_metrics(client.get("/metrics").text)
+    assert metrics[f'sidecar_probes_total{{outcome="{outcome}"}}'] == 1
+    path = f'path="{HEADER_PATH}"'
+    assert metrics[f"sidecar_node_rpc_duration_seconds_count{{{path}}}"] == 1
+
+
+def parse_metrics(text):
+    metrics = {}
+    for line in text.splitlines():
+        if not line.startswith("#"):
+            name, value = line.rsplit(" ", 1)
+            metrics[name] = float(value)
+    return metrics
+
+
+def test_metrics(sidecar, http_server, run_service):
+    http_server.streams.add(MONITOR_PATH)
+    sidecar.head_monitor.start()
+    http_server.wait_for_subscribers(MONITOR_PATH)
+    http_server.publish(MONITOR_PATH, {**header(41, age=30), "hash": "BLa"})
+    wait_until(sidecar.head_monitor.latest_head)
+    client = run_service(sidecar.service)
+    for _ in range(3):
+        client.get("/is_synced")
+
+    response = client.get("/metrics")
+    assert response.headers["Content-Type"].startswith("text/plain")
+    metrics = parse_metrics(response.text)
+    assert metrics["sidecar_head_stream_up"] == 1
+    assert metrics["sidecar_head_level"] == 41
+    assert 30 <= metrics["sidecar_head_age_seconds"] < 40
+    assert metrics['sidecar_probes_total{outcome="synced"}'] == 3
+    assert metrics["sidecar_probe_duration_seconds_count"] == 3
+    assert metrics['sidecar_probe_duration_seconds_bucket{le="+Inf"}'] == 3
+
+    # The node is down, the last known head is still reported
+    http_server.streams.remove(MONITOR_PATH)
+    http_server.close_streams(MONITOR_PATH)
+    wait_until(lambda: not sidecar.head_monitor.connected.is_set())
+    sidecar.NODE_URL = "http://127.0.0.1:1"
+    client.get("/is_synced")
+    time.sleep(0.1)
+    metrics = parse_metrics(client.get("/metrics").text)
+    assert metrics["sidecar_head_stream_up"] == 0
+    assert metrics["sidecar_head_level"] == 41
+    assert metrics["sidecar_head_unchanged_seconds"] >= 0.1
+    assert metrics['sidecar_probes_total{outcome="unreachable"}'] == 1
+    path = f'path="{HEADER_PATH}"'
+    assert metrics[f"sidecar_node_rpc_duration_seconds_count{{{path}}}"] == 1
+    assert metrics['sidecar_probe_cache_total{cache="head_header",result="miss"}'] == 1
+    # Scrapes don't query the node
+    assert header_requests(http_server) == 0
+
+
+def test_multi_signal_readiness(sidecar, http_server, run_service):
+    sidecar.READINESS_CHECKS = {
+        "head_age": {},
+        "bootstrapped": {},
+        "peers": {"min": 2, "weight": 0.5},
+        "mempool": {"weight": 0.5},
+    }
+    sidecar.readiness_cache.ttl = 0
+    http_server.responses.update(
+        {
+            HEADER_PATH: [(200, {}, json_body(header(10)))],
+            "/chains/main/is_bootstrapped": [
+                (200, {}, json_body({"bootstrapped": True, "sync_state": "synced"}))
+            ],
+            "/network/connections": [(200, {}, json_body([{}, {}]))],
+            "/chains/main/mempool/filter": [(200, {}, json_body({}))],
+        }
+    )
+    client = run_service(sidecar.service)
+    response = client.get("/is_synced")
+    assert response.status_code == 200
+    assert response.json()["score"] == 1
+
+    # Missing peers only cost their weight
+    sidecar.READINESS_THRESHOLD = 0.8
+    http_server.responses["/network/connections"] = [(200, {}, json_body([{}]))]
+    response = client.get("/is_synced")
+    assert response.status_code == 200
+    assert response.json()["failing"] == ["peers"]
+    assert response.json()["score"] == 2.5 / 3
+
+    # A hanging mempool fails its check within the deadline
+    http_server.streams.add("/chains/main/mempool/filter")
+    start = time.monotonic()
+    response = client.get("/is_synced")
+    assert time.monotonic() - start < sidecar.NODE_CONNECT_TIMEOUT + 0.2
+    assert response.status_code == 500
+    assert response.json()["failing"] == ["peers", "mempool"]
+    assert response.json()["checks"]["mempool"]["ok"] is False
+    http_server.close_streams("/chains/main/mempool/filter")
+
+    metrics = parse_metrics(client.get("/metrics").text)
+    assert metrics['sidecar_readiness_check_failures_total{check="peers"}'] == 2
+    assert metrics['sidecar_probes_total{outcome="not_ready"}'] == 1
+    # The RPCs of the readiness checks are timed too
+    for path in ("/network/connections", "/chains/main/is_bootstrapped"):
+        path = f'path="{path}"'
+        assert metrics[f"sidecar_node_rpc_duration_seconds_count{{{path}}}"] == 3
+    stats = client.get("/probe_cache").json()["readiness"]
+    assert stats == {"hits": 0, "coalesced": 0, "misses": 3}
@@ -0,0 +1,75 @@
+import pytest
+
+from conftest import CHARTS_DIR, load_script
+from test_octez_monitor import wait_until
+
+pytest.importorskip("aiohttp")
+
+HEALTHZ = b"# TYPE signer_power gauge\nsigner_power 1\n"
+
+
+@pytest.fixture
+def signer_exporter(http_server, monkeypatch):
+    monkeypatch.setenv("READINESS_PROBE_PATH", "/authorized_keys")
+    monkeypatch.setenv("SIGNER_PORT", str(http_server.server_address[1]))
+    monkeypatch.setenv("SIGNER_METRICS", "true")
+    monkeypatch.setenv("SIGNER_PROBE_INTERVAL", "60")
+    signer_exporter = load_script(
+        "signer_exporter.py",
+        "signer_exporter",
+        CHARTS_DIR / "tezos-signer-forwarder" / "scripts",
+    )
+    signer_exporter.signer_health.signer_url = http_server.url
+    http_server.responses["/authorized_keys"] = [(200, {}, b"{}")]
+    http_server.responses["/healthz"] = [(200, {}, HEALTHZ)]
+    return signer_exporter
+
+
+def parse_metrics(body):
+    return dict(
+        line.rsplit(" ", 1) for line in body.splitlines() if not line.startswith("#")
+    )
+
+
+def test_scrapes_served_from_background_probes(
+    signer_exporter, http_server, run_service
+):
+    # Not probed yet
+    values = parse_metrics(signer_exporter.service.registry.exposition())
+    assert values["unhealthy_signers_total"] == "1"
+    assert values["signer_probe_age_seconds"] == "+Inf"
+
+    # The service probes the signer as soon as it starts
+    client = run_service(signer_exporter.service)
+
+    def metrics():
+        return parse_metrics(client.get("/metrics").text)
+
+    wait_until(lambda: metrics()["unhealthy_signers_total"] == "0")
+    for _ in range(10):
+        values = metrics()
+    assert values["signer_power"] == "1"
+    assert 0 <= float(values["signer_probe_age_seconds"]) < 60
+    assert values['signer_probe_duration_seconds_count{probe="readiness"}'] == "1"
+    assert values['signer_probe_duration_seconds_count{probe="healthz"}'] == "1"
+    # Scrapes don't reach the signer
+    assert [path for _, path, _ in http_server.requests] == [
+        "/authorized_keys",
+        "/healthz",
+    ]
+
+
+def test_unhealthy_signer(signer_exporter, http_server, run_service):
+    client = run_service(signer_exporter.service)
+
+    def metrics():
+        return parse_metrics(client.get("/metrics").text)
+
+    wait_until(lambda: metrics()["unhealthy_signers_total"] == "0")
+
+    http_server.responses["/authorized_keys"] = [(503, {}, b"")]
+    client.run(signer_exporter.signer_health.refresh())
+    values = metrics()
+    assert values["unhealthy_signers_total"] == "1"
+    assert "signer_power" not in values
+    assert values['signer_probe_duration_seconds_count{probe="readiness"}'] == "2"
@@ -0,0 +1,182 @@
+import hashlib
+import json
+import os
+import socket
+import subprocess
+import sys
+import time
+
+import pytest
+import requests
+
+from conftest import UTILS_DIR, load_script
+
+pytest.importorskip("aiohttp")
+
+BLOCK_HASH = "BLockGenesisGenesisGenesisGenesisGenesisf79b5d1CoW2"
+
+
+@pytest.fixture
+def snapshot_server():
+    return load_script("snapshot-server.py", "snapshot_server")
+
+
+def export(export_dir, name, level, data, node_history_mode="rolling"):
+    """Lay out an export like the snapshot-exporter container does"""
+    export_dir.mkdir(exist_ok=True)
+    (export_dir / "history_mode").write_text(f"{node_history_mode}\n")
+    (export_dir / f"{name}.snapshot").write_bytes(data)
+    mode = "full" if node_history_mode == "archive" else node_history_mode
+    header = {"version": 7, "mode": mode, "block_hash": BLOCK_HASH}
+    (export_dir / f"{name}.info.json").write_text(
+        json.dumps({"snapshot_header": dict(header, level=level)})
+    )
+    (export_dir / f"{name}.sha256").write_text(hashlib.sha256(data).hexdigest())
+    (export_dir / "latest").write_text(f"{name}\n")
+
+
+@pytest.fixture
+def export_dir(tmp_path):
+    return tmp_path / "peer-snapshot"
+
+
+def test_latest_export(snapshot_server, export_dir):
+    assert snapshot_server.latest_export(export_dir) is None
+    data = os.urandom(1000)
+    export(export_dir, "1700000000", 1234, data)
+    # Being exported, not the latest yet
+    (export_dir / "1700000600.exporting").write_bytes(b"partial")
+    assert snapshot_server.latest_export(export_dir) == {
+        "path": "/snapshot/1700000000",
+        "block_hash": BLOCK_HASH,
+        "level": 1234,
+        "history_mode": "rolling",
+        "node_history_mode": "rolling",
+        "filesize_bytes": 1000,
+        "sha256": hashlib.sha256(data).hexdigest(),
+    }
+
+    (export_dir / "1700000000.info.json").write_text("{}")
+    assert snapshot_server.latest_export(export_dir) is None
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+@pytest.fixture
+def serve_exports(export_dir):
+    """Run snapshot-server.py in its own process, serving export_dir"""
+    port = free_port()
+    code = (
+        "import importlib.util\n"
+        + "spec = importlib.util.spec_from_file_location("
+        + f"'snapshot_server', {str(UTILS_DIR / 'snapshot-server.py')!r})\n"
+        + "server = importlib.util.module_from_spec(spec)\n"
+        + "spec.loader.exec_module(server)\n"
+        + f"server.EXPORT_DIR = {str(export_dir)!r}\n"
+        + "server.service.run()\n"
+    )
+    env = dict(os.environ, PYTHONPATH=str(UTILS_DIR), SNAPSHOT_SERVER_PORT=str(port))
+    process = subprocess.Popen([sys.executable, "-c", code], env=env)
+    url = f"http://127.0.0.1:{port}"
+    deadline = time.monotonic() + 10
+    while True:
+        try:
+            requests.get(f"{url}/status", timeout=1)
+            break
+        except requests.ConnectionError:
+            assert time.monotonic() < deadline, "snapshot-server didn't start"
+            time.sleep(0.05)
+    yield port
+    process.terminate()
+    process.wait(10)
+
+
+def find_snapshot(peers, output):
+    return subprocess.run(
+        [sys.executable, UTILS_DIR / "peer-snapshot.py", peers, output],
+        env=dict(os.environ, PYTHONPATH=str(UTILS_DIR)),
+        capture_output=True,
+        text=True,
+        timeout=60,
+    )
+
+
+def test_bootstrap_from_peer(export_dir, serve_exports, tmp_path):
+    data = os.urandom(3 << 20)
+    export(export_dir, "1700000000", 1234, data)
+    output = tmp_path / "peer_snapshot_config.json"
+    result = find_snapshot(f"127.0.0.1:{serve_exports}", output)
+    assert result.returncode == 0, result.stdout + result.stderr
+    assert "shares a snapshot at level 1234" in result.stdout
+    url = f"http://127.0.0.1:{serve_exports}/snapshot/1700000000"
+    snapshot_config = json.loads(output.read_text())
+    assert snapshot_config == {
+        "url": url,
+        "artifact_type": "tezos-snapshot",
+        "history_mode": "rolling",
+        "block_hash": BLOCK_HASH,
+        "filesize_bytes": len(data),
+        "sha256": hashlib.sha256(data).hexdigest(),
+    }
+
+    # The export is fetched with Range requests, and checked
+    r = requests.get(url, headers={"Range": "bytes=10-19"})
+    assert r.status_code == 206 and r.content == data[10:20]
+    downloader = load_script("downloader.py", "downloader")
+    downloaded = tmp_path / "chain.snapshot"
+    downloader.download(
+        url, downloaded, snapshot_config["sha256"], connections=4, chunk_size=1 << 20
+    )
+    assert downloaded.read_bytes() == data
+
+
+def test_no_exported_snapshot(serve_exports, tmp_path):
+    output = tmp_path / "peer_snapshot_config.json"
+    result = find_snapshot(f"127.0.0.1:{serve_exports}", output)
+    assert result.returncode == 3
+    assert "has no snapshot to share" in result.stdout
+    assert not output.exists()
+
+
+def test_previous_export_is_resumed(export_dir, serve_exports, tmp_path):
+    export(export_dir, "1700000000", 1234, b"first")
+    output = tmp_path / "peer_snapshot_config.json"
+    assert find_snapshot(f"127.0.0.1:{serve_exports}", output).returncode == 0
+    url = f"http://127.0.0.1:{serve_exports}/snapshot/1700000000"
+    assert json.loads(output.read_text())["url"] == url
+
+    # Kept while its download may be resumed
+    export(export_dir, "1700021600", 1300, b"second")
+    result = find_snapshot(f"127.0.0.1:{serve_exports}", output)
+    assert result.returncode == 0, result.stdout + result.stderr
+    assert json.loads(output.read_text())["url"] == url
+
+    (export_dir / "1700000000.snapshot").unlink()
+    result = find_snapshot(f"127.0.0.1:{serve_exports}", output)
+    assert result.returncode == 0, result.stdout + result.stderr
+    assert "is no longer shared" in result.stdout
+    assert json.loads(output.read_text())["url"].endswith("/snapshot/1700021600")
+
+
+def test_archive_exports_are_not_imported(export_dir, serve_exports, tmp_path):
+    export(export_dir, "1700000000", 1234, b"snapshot", node_history_mode="archive")
+    r = requests.get(f"http://127.0.0.1:{serve_exports}/status")
+    assert r.json()["history_mode"] == "full"
+    output = tmp_path / "peer_snapshot_config.json"
+    result = find_snapshot(f"127.0.0.1:{serve_exports}", output)
+    assert result.returncode == 3
+    assert "only shares the snapshots of an archive node" in result.stdout
+    assert not output.exists()
+
+
+def test_removed_export(export_dir, serve_exports):
+    export(export_dir, "1700000000", 1234, b"snapshot")
+    (export_dir / "1700000000.snapshot").unlink()
+    r = requests.get(f"http://127.0.0.1:{serve_exports}/snapshot/1700000000")
+    assert r.status_code == 404
+    r = requests.get(f"http://127.0.0.1:{serve_exports}/snapshot/..%2Flatest")
+    assert r.status_code == 404
@@ -0,0 +1,61 @@
+import pytest
+
+from tezos_keys import Key, UnsupportedKeyError
+
+pytezos = pytest.importorskip("pytezos")
+
+CORPUS = [
+    # ed25519 seeds and full secret keys
+    "edsk3gUfUPyBSfrS9CCgmCiQsTCHGkviBDusMxDJstFtojtc1zcpsh",
+    "edsk2hEYzoqjDNKMkbRQ5BneeMNz1AtTpwZLix7NLh8u5YjJH15gtZ",
+    "edsk3BXsqFvmyekGKShHy3ps5D6mwhp1QiZGgxw5PTCqx4VvwHKXVF",
+    "edskRroXFEHzoRW9STK4dBd1EC7YZu95EHDNsiXZu8p5b2p4PpboLVbzwwpqkFrZdMTrKc9QYSb5LzTpbY9oi5Rj4d5QtPg15p",
+    # secp256k1
+    "spsk2t9u4rFhToRHRhMiaFok38prpTN45k2Ly2iYarEk23oz7cF341",
+    "spsk35CpPDpYaHPGRsEHkwbXYnBQdGLrgbMN9uu3qzPnWYBvk8ENHs",
+    # p256
+    "p2sk2awUAtaUZqr2t6Wrr65koX4okAJ7evVSasc38TtamDgErFimyW",
+    "p2sk3KuRwEwucN77ZTAwTCtRQgzDvHLK6Tg7opUfFRMAV6aCMEfH6h",
+    # public keys
+    "edpkuBknW28nW72KG6RoHtYW7p12T6GKc7nAbwYX5m8Wd9sDVC9yav",
+    "edpkttsZA3T5GVMoMPse3m1466L45HCwuqroA398YvNDAtnGB7HtVU",
+    "sppk7auceAFrff6ffTkA61JpGPWbAmxVfnTwHbD98sfX2Ftt8LWEjN7",
+    "sppk7dAGBqUavgefqndSsdZ6VgyD9hyEXCxYQAYYu8Np2yup7R46XNT",
+    "p2pk66HDXqvZ493PXa83hsJCCU9ZPm14qZ5gEJCAsW4jS6kt8PBraZ2",
+    "p2pk67JrN3sL2g2MMcSmjuPaVrFuoMEPxtBcvFJ6k3gj9ebJsKioYUh",
+]
+
+
+def describe(key):
+    return (
+        key.is_secret,
+        key.is_secret and key.secret_key(),
+        key.public_key(),
+        key.public_key_hash(),
+    )
+
+
+@pytest.mark.parametrize("encoded_key", CORPUS)
+def test_matches_pytezos(encoded_key):
+    key = Key.decode(encoded_key)
+    assert describe(key) == describe(pytezos.Key.from_encoded_key(encoded_key))
+
+
+@pytest.mark.parametrize("curve", ["sp", "p2"])
+def test_pure_python_weierstrass_matches_pytezos(curve):
+    from tezos_keys import weierstrass_public_point
+
+    for encoded_key in CORPUS:
+        if encoded_key.startswith(f"{curve}sk"):
+            expected = pytezos.Key.from_encoded_key(encoded_key).public_point
+            key = Key.decode(encoded_key)
+            assert weierstrass_public_point(curve, key.secret_exponent) == expected
+
+
+def test_falls_back_to_pytezos_for_bls_keys():
+    encoded_key = "BLsk2mPLQfDwfJrSa6ts3YmFfJKj7UGjB77KrARHKoLZDhuigiTCwD"
+    with pytest.raises(UnsupportedKeyError):
+        Key.decode(encoded_key)
+    key = Key.from_encoded_key(encoded_key)
+    assert isinstance(key, pytezos.Key)
+    assert key.public_key_hash().startswith("tz4")
@@ -0,0 +1,76 @@
+import json
+import socket
+import threading
+import time
+
+from conftest import load_script
+
+
+class FakeResolver:
+    """Resolves each host after a number of failures, None never resolving"""
+
+    def __init__(self, failures):
+        self.failures = failures
+        self.lock = threading.Lock()
+        self.calls = []
+
+    def __call__(self, host):
+        with self.lock:
+            self.calls.append((host, time.monotonic()))
+            attempts = sum(h == host for h, _ in self.calls)
+        if self.failures[host] is None or attempts <= self.failures[host]:
+            raise socket.gaierror(socket.EAI_NONAME, "Name does not resolve")
+        return ["10.0.0.1"]
+
+
+def test_bootstrap_peer_hosts(tmp_path):
+    wait_for_dns = load_script("wait-for-dns.py", "wait_for_dns")
+    config_json = tmp_path / "config.json"
+    config_json.write_text(
+        json.dumps(
+            {
+                "p2p": {
+                    "bootstrap-peers": [
+                        "node-0.node:9732",
+                        "node-1.node",
+                        "node-0.node:9733",
+                    ]
+                }
+            }
+        )
+    )
+    assert wait_for_dns.bootstrap_peer_hosts(config_json) == [
+        "node-0.node",
+        "node-1.node",
+    ]
+    assert not wait_for_dns.has_peers(tmp_path / "peers.json")
+    (tmp_path / "peers.json").write_text("[]")
+    assert not wait_for_dns.has_peers(tmp_path / "peers.json")
+
+
+def test_wait_for_peers(capsys):
+    wait_for_dns = load_script("wait-for-dns.py", "wait_for_dns")
+    hosts = [f"node-{i}" for i in range(20)]
+    resolver = FakeResolver({host: i % 4 for i, host in enumerate(hosts)})
+
+    # Peers are resolved concurrently, each retried with a growing backoff
+    start = time.monotonic()
+    resolved = wait_for_dns.wait_for_peers(
+        hosts, resolver=resolver, min_backoff=0.02, max_backoff=0.1
+    )
+    assert sorted(resolved) == sorted(hosts)
+    assert time.monotonic() - start < 1
+    retries = [t for host, t in resolver.calls if host == "node-3"]
+    assert len(retries) == 4
+    assert retries[3] - retries[2] > retries[1] - retries[0]
+    assert "Resolved node-3 to 10.0.0.1 in" in capsys.readouterr().out
+
+    # A quorum doesn't wait for the peers that don't resolve
+    resolver = FakeResolver(
+        {host: None if i < 2 else 0 for i, host in enumerate(hosts)}
+    )
+    resolved = wait_for_dns.wait_for_peers(
+        hosts, quorum=15, resolver=resolver, min_backoff=0.02, max_backoff=0.1
+    )
+    assert len(resolved) >= 15
+    assert "node-0" not in resolved and "node-1" not in resolved
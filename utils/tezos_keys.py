@@ -0,0 +1,228 @@
+"""
+Lightweight handling of base58 encoded tezos keys.
+
+config-generator only needs to turn the encoded keys of the accounts into
+their public keys and public key hashes. Importing pytezos for that takes
+seconds and a lot of memory on every pod start, so this module handles the
+common unencrypted ed25519, secp256k1 and p256 keys with blake2b and
+base58check directly. Anything else (encrypted keys, BLS keys) is handed over
+to pytezos, which is only imported when it is actually needed.
+"""
+
+from hashlib import blake2b
+
+from base58 import b58decode_check, b58encode_check
+
+#
+# Base58 prefixes, by encoded prefix and payload length, as defined in
+# octez's src/lib_crypto/base58.ml
+
+ENCODINGS = {
+    # (prefix, payload length): (curve, is_secret)
+    (b"\x0d\x0f\x3a\x07", 32): ("ed", True),  # edsk, seed
+    (b"\x2b\xf6\x4e\x07", 64): ("ed", True),  # edsk, full secret key
+    (b"\x0d\x0f\x25\xd9", 32): ("ed", False),  # edpk
+    (b"\x11\xa2\xe0\xc9", 32): ("sp", True),  # spsk
+    (b"\x03\xfe\xe2\x56", 33): ("sp", False),  # sppk
+    (b"\x10\x51\xee\xbd", 32): ("p2", True),  # p2sk
+    (b"\x03\xb2\x8b\x7f", 33): ("p2", False),  # p2pk
+}
+
+SECRET_KEY_PREFIXES = {
+    "ed": b"\x0d\x0f\x3a\x07",
+    "sp": b"\x11\xa2\xe0\xc9",
+    "p2": b"\x10\x51\xee\xbd",
+}
+PUBLIC_KEY_PREFIXES = {
+    "ed": b"\x0d\x0f\x25\xd9",
+    "sp": b"\x03\xfe\xe2\x56",
+    "p2": b"\x03\xb2\x8b\x7f",
+}
+PUBLIC_KEY_HASH_PREFIXES = {
+    "ed": b"\x06\xa1\x9f",  # tz1
+    "sp": b"\x06\xa1\xa1",  # tz2
+    "p2": b"\x06\xa1\xa4",  # tz3
+}
+
+#
+# Short Weierstrass curves y^2 = x^3 + ax + b used by tz2 and tz3 accounts:
+# (p, a, b, n, Gx, Gy)
+
+WEIERSTRASS_CURVES = {
+    "sp": (
+        0xFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFEFFFFFC2F,
+        0,
+        7,
+        0xFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFEBAAEDCE6AF48A03BBFD25E8CD0364141,
+        0x79BE667EF9DCBBAC55A06295CE870B07029BFCDB2DCE28D959F2815B16F81798,
+        0x483ADA7726A3C4655DA4FBFC0E1108A8FD17B448A68554199C47D08FFB10D4B8,
+    ),
+    "p2": (
+        0xFFFFFFFF00000001000000000000000000000000FFFFFFFFFFFFFFFFFFFFFFFF,
+        0xFFFFFFFF00000001000000000000000000000000FFFFFFFFFFFFFFFFFFFFFFFC,
+        0x5AC635D8AA3A93E7B3EBBD55769886BC651D06B0CC53B0F63BCE3C3E27D2604B,
+        0xFFFFFFFF00000000FFFFFFFFFFFFFFFFBCE6FAADA7179E84F3B9CAC2FC632551,
+        0x6B17D1F2E12C4247F8BCE6E563A440F277037D812DEB33A0F4A13945D898C296,
+        0x4FE342E2FE1A7F9B8EE7EB4A7C0F9E162BCE33576B315ECECBB6406837BF51F5,
+    ),
+}
+
+
+class UnsupportedKeyError(ValueError):
+    """Raised for encoded keys that this module does not handle itself."""
+
+
+def _jacobian_double(point, p, a):
+    x, y, z = point
+    if not y:
+        return (0, 0, 0)
+    ysq = y * y % p
+    s = 4 * x * ysq % p
+    m = (3 * x * x + a * pow(z, 4, p)) % p
+    nx = (m * m - 2 * s) % p
+    ny = (m * (s - nx) - 8 * ysq * ysq) % p
+    nz = 2 * y * z % p
+    return (nx, ny, nz)
+
+
+def _jacobian_add(point, other, p, a):
+    x1, y1, z1 = point
+    x2, y2, z2 = other
+    if not y1:
+        return other
+    if not y2:
+        return point
+    z1sq = z1 * z1 % p
+    z2sq = z2 * z2 % p
+    u1 = x1 * z2sq % p
+    u2 = x2 * z1sq % p
+    s1 = y1 * z2sq * z2 % p
+    s2 = y2 * z1sq * z1 % p
+    if u1 == u2:
+        if s1 != s2:
+            return (0, 0, 1)
+        return _jacobian_double(point, p, a)
+    h = u2 - u1
+    r = s2 - s1
+    h2 = h * h % p
+    h3 = h * h2 % p
+    u1h2 = u1 * h2 % p
+    nx = (r * r - h3 - 2 * u1h2) % p
+    ny = (r * (u1h2 - nx) - s1 * h3) % p
+    nz = h * z1 * z2 % p
+    return (nx, ny, nz)
+
+
+def weierstrass_public_point(curve, secret_exponent):
+    """
+    Return the SEC1 compressed encoding of secret_exponent * G on the named
+    curve.
+    """
+    p, a, _, n, gx, gy = WEIERSTRASS_CURVES[curve]
+    scalar = int.from_bytes(secret_exponent, "big")
+    if not 0 < scalar < n:
+        raise ValueError("Secret exponent is out of range for the curve.")
+
+    result = (0, 0, 1)
+    addend = (gx, gy, 1)
+    while scalar:
+        if scalar & 1:
+            result = _jacobian_add(result, addend, p, a)
+        addend = _jacobian_double(addend, p, a)
+        scalar >>= 1
+
+    x, y, z = result
+    zinv = pow(z, -1, p)
+    x = x * zinv * zinv % p
+    y = y * zinv * zinv * zinv % p
+    return bytes([2 + (y & 1)]) + x.to_bytes(32, "big")
+
+
+def secp256k1_public_point(secret_exponent):
+    try:
+        import coincurve
+    except ImportError:
+        return weierstrass_public_point("sp", secret_exponent)
+    return coincurve.PrivateKey(secret_exponent).public_key.format()
+
+
+def ed25519_public_point(secret_exponent):
+    import nacl.bindings
+
+    if len(secret_exponent) == 64:
+        return secret_exponent[32:]
+    public_point, _ = nacl.bindings.crypto_sign_seed_keypair(secret_exponent)
+    return public_point
+
+
+class Key:
+    """
+    The subset of pytezos' Key interface config-generator relies on:
+    is_secret, secret_key(), public_key() and public_key_hash().
+    """
+
+    def __init__(self, curve, public_point, secret_exponent=None):
+        self.curve = curve
+        self.public_point = public_point
+        self.secret_exponent = secret_exponent
+        self.is_secret = secret_exponent is not None
+
+    @classmethod
+    def decode(cls, encoded_key):
+        """
+        Parse an encoded key. Raise UnsupportedKeyError if it is not an
+        unencrypted ed25519, secp256k1 or p256 key.
+        """
+        try:
+            decoded = b58decode_check(encoded_key)
+        except ValueError as e:
+            raise UnsupportedKeyError(f"Invalid key encoding: {e}")
+
+        for (prefix, length), (curve, is_secret) in ENCODINGS.items():
+            if decoded.startswith(prefix) and len(decoded) == len(prefix) + length:
+                payload = decoded[len(prefix) :]
+                break
+        else:
+            raise UnsupportedKeyError("Unsupported key encoding.")
+
+        if not is_secret:
+            return cls(curve, payload)
+
+        if curve == "ed":
+            public_point = ed25519_public_point(payload)
+            # Like pytezos, we always export the 32 bytes seed
+            payload = payload[:32]
+        elif curve == "sp":
+            public_point = secp256k1_public_point(payload)
+        else:
+            public_point = weierstrass_public_point(curve, payload)
+        return cls(curve, public_point, payload)
+
+    @classmethod
+    def from_encoded_key(cls, encoded_key):
+        """
+        Parse an encoded key, falling back to pytezos for the formats this
+        module does not handle itself.
+        """
+        try:
+            return cls.decode(encoded_key)
+        except UnsupportedKeyError:
+            from pytezos import Key as PytezosKey
+
+            return PytezosKey.from_encoded_key(encoded_key)
+
+    def secret_key(self):
+        if not self.is_secret:
+            raise ValueError("Secret key is undefined")
+        return b58encode_check(
+            SECRET_KEY_PREFIXES[self.curve] + self.secret_exponent
+        ).decode()
+
+    def public_key(self):
+        return b58encode_check(
+            PUBLIC_KEY_PREFIXES[self.curve] + self.public_point
+        ).decode()
+
+    def public_key_hash(self):
+        pkh = blake2b(self.public_point, digest_size=20).digest()
+        return b58encode_check(PUBLIC_KEY_HASH_PREFIXES[self.curve] + pkh).decode()
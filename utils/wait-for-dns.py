@@ -0,0 +1,134 @@
+#! /usr/bin/env python
+"""
+When the octez-node boots for the first time, if one of the bootstrap
+nodes can't be contacted, then octez-node will give up.
+So at first boot (when peers.json is empty) we wait for bootstrap node.
+This is probably a bug in tezos core, though.
+
+The bootstrap peers of /etc/tezos/config.json are resolved concurrently, each
+retried with a jittered exponential backoff until its name resolves. We wait
+for all of them, or for DNS_QUORUM of them when it is set, so that a single
+slow peer doesn't hold the node back.
+"""
+
+import json
+import os
+import random
+import socket
+import threading
+import time
+
+CONFIG_JSON = "/etc/tezos/config.json"
+PEERS_JSON = "/var/tezos/node/peers.json"
+
+# Number of peers that must resolve, 0 meaning all of them
+DNS_QUORUM = int(os.environ.get("DNS_QUORUM") or "0")
+DNS_MIN_BACKOFF = float(os.environ.get("DNS_MIN_BACKOFF", "0.1"))
+DNS_MAX_BACKOFF = float(os.environ.get("DNS_MAX_BACKOFF", "5"))
+
+
+def resolve(host):
+    """Return the addresses of host, like `getent hosts`"""
+    return sorted({info[4][0] for info in socket.getaddrinfo(host, None)})
+
+
+def has_peers(peers_json=PEERS_JSON):
+    try:
+        with open(peers_json) as f:
+            return len(json.load(f)) > 0
+    except (OSError, ValueError):
+        return False
+
+
+def bootstrap_peer_hosts(config_json=CONFIG_JSON):
+    with open(config_json) as f:
+        peers = json.load(f)["p2p"].get("bootstrap-peers", [])
+    return list(dict.fromkeys(peer.split(":")[0] for peer in peers))
+
+
+class PeerResolver(threading.Thread):
+    """Resolve host, backing off after every failure, until it succeeds"""
+
+    def __init__(self, host, resolved, resolver, min_backoff, max_backoff):
+        super().__init__(daemon=True, name=f"resolve {host}")
+        self.host = host
+        self.resolved = resolved
+        self.resolver = resolver
+        self.min_backoff = min_backoff
+        self.max_backoff = max_backoff
+        self.attempts = 0
+
+    def run(self):
+        start = time.monotonic()
+        backoff = self.min_backoff
+        while True:
+            self.attempts += 1
+            try:
+                addresses = self.resolver(self.host)
+            except OSError as e:
+                if self.attempts == 1:
+                    print(f"Waiting for name service for {self.host}: {e}")
+            else:
+                self.resolved(self, addresses, time.monotonic() - start)
+                return
+            time.sleep(backoff * random.uniform(0.5, 1))
+            backoff = min(backoff * 2, self.max_backoff)
+
+
+def wait_for_peers(
+    hosts,
+    quorum=0,
+    resolver=resolve,
+    min_backoff=DNS_MIN_BACKOFF,
+    max_backoff=DNS_MAX_BACKOFF,
+):
+    """
+    Resolve hosts concurrently until quorum of them, or all of them if quorum
+    is 0, resolve. Returns the hosts resolved by then.
+    """
+    quorum = min(quorum or len(hosts), len(hosts))
+    condition = threading.Condition()
+    resolved = []
+
+    def on_resolved(peer, addresses, latency):
+        print(
+            f"Resolved {peer.host} to {' '.join(addresses)} in {latency:.2f}s, "
+            + f"after {peer.attempts} attempts"
+        )
+        with condition:
+            resolved.append(peer.host)
+            condition.notify()
+
+    for host in hosts:
+        PeerResolver(host, on_resolved, resolver, min_backoff, max_backoff).start()
+    with condition:
+        condition.wait_for(lambda: len(resolved) >= quorum)
+        return list(resolved)
+
+
+def main():
+    if has_peers():
+        print(
+            "Node already has an internal list of peers, no need to wait for bootstrap"
+        )
+        return
+
+    if json.loads(os.environ["CHAIN_PARAMS"]).get("network", {}).get("genesis") is None:
+        print("We are not setting up a private network, it is not necessary")
+        print("to wait for the bootstrap nodes as they are likely external.")
+        return
+
+    hosts = bootstrap_peer_hosts()
+    start = time.monotonic()
+    resolved = wait_for_peers(hosts, DNS_QUORUM)
+    print(
+        f"{len(resolved)} of {len(hosts)} bootstrap peers resolved "
+        + f"in {time.monotonic() - start:.2f}s"
+    )
+    for host in hosts:
+        if host not in resolved:
+            print(f"Not waiting any longer for {host}")
+
+
+if __name__ == "__main__":
+    main()